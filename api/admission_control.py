@@ -0,0 +1,327 @@
+"""
+Admission Control Module
+
+This module sheds load before a worker is saturated. A periodic event-loop
+timer measures scheduling delay (lag): when the loop is busy, callbacks fire
+late, and every stream on the worker slows down together. New chat requests
+are admitted only while lag and the number of in-flight requests are below
+their thresholds; otherwise they wait briefly and are then rejected with
+503 + Retry-After. Streams that were already admitted are never touched.
+
+Each user (API key, session or IP) may hold a limited number of running or
+queued requests; beyond that a request is rejected immediately, before any
+upstream connection is opened. Identities a client can pick freely (session
+ids) can also be bound to a group (the client IP) with its own cap, so
+rotating ids does not multiply the allowance. Waiting requests are admitted in weighted
+fair order (start-time fair queuing over per-user virtual finish tags), so a
+user with many parallel requests cannot crowd out the others.
+
+Key features:
+- Event-loop lag monitor on loop.call_later (no task, nothing to cancel)
+- Fixed-bucket lag histogram plus recent percentiles
+- Per-user cap on concurrent streams with fast rejection
+- Optional per-group cap (e.g. per IP) on top of the per-user cap
+- Short weighted fair admission queue before rejecting (absorbs bursts)
+- In-flight tracking that ends when the response stream is finished, or when
+  the response is done even if its body was never read (idempotent release)
+- Admitted/rejected counts per reason
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the lag histogram buckets in milliseconds
+LAG_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, math.inf]
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted.
+
+    Attributes:
+        reason: "lag", "inflight", "user_limit", "group_limit" or "queue"
+        retry_after: Suggested delay in seconds before retrying
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _bucket_label(bound: float) -> str:
+    return "+inf" if bound == math.inf else f"<={bound}ms"
+
+
+class LagMonitor:
+    """
+    Measures event-loop scheduling delay with a periodic timer.
+
+    Attributes:
+        interval: Seconds between timer ticks
+        recent: Recent lag samples in seconds (for percentiles and decisions)
+        histogram: Sample count per LAG_BUCKETS_MS bucket (since start)
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 600, decision_samples: int = 10):
+        self.interval = interval
+        self.recent: Deque[float] = deque(maxlen=window)
+        self.decision_samples = decision_samples
+        self.histogram: List[int] = [0] * len(LAG_BUCKETS_MS)
+        self.samples = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def ensure_started(self):
+        """Starts the timer on the running loop (again, if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._schedule(loop)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = None
+        self._loop = None
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop):
+        expected = loop.time() + self.interval
+        self._handle = loop.call_later(self.interval, self._tick, loop, expected)
+
+    def _tick(self, loop: asyncio.AbstractEventLoop, expected: float):
+        if loop is not self._loop:
+            return
+        self.record(max(0.0, loop.time() - expected))
+        self._schedule(loop)
+
+    def record(self, lag: float):
+        """Adds one lag sample (seconds)."""
+        self.recent.append(lag)
+        self.samples += 1
+        self.total += lag
+        self.max = max(self.max, lag)
+        lag_ms = lag * 1000
+        for i, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms <= bound:
+                self.histogram[i] += 1
+                break
+
+    def current_lag(self) -> float:
+        """Worst lag over the last few ticks (about a second by default)."""
+        if not self.recent:
+            return 0.0
+        return max(list(self.recent)[-self.decision_samples:])
+
+    def get_stats(self) -> Dict:
+        ordered = sorted(self.recent)
+
+        def pct(q: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))] * 1000, 2)
+
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "current_ms": round(self.current_lag() * 1000, 2),
+            "mean_ms": round(self.total / self.samples * 1000, 2) if self.samples else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+            "p50_ms": pct(0.5),
+            "p99_ms": pct(0.99),
+            "histogram": {_bucket_label(b): n for b, n in zip(LAG_BUCKETS_MS, self.histogram)}
+        }
+
+
+class AdmissionSlot:
+    """
+    One admitted request.
+
+    release() frees the slot once, however often it is called, so the end of
+    the stream and a guard that runs without the stream (e.g. a response
+    background task, for a body that is never iterated) can both call it.
+    """
+
+    def __init__(self, controller: "AdmissionController", user: str, group: Optional[str] = None):
+        self.controller = controller
+        self.user = user
+        self.group = group
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(self.user, self.group)
+
+    async def track(self, stream: AsyncGenerator) -> AsyncGenerator:
+        """Passes a response stream through and releases the slot at its end."""
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            self.release()
+
+
+class AdmissionController:
+    """
+    Admits new requests based on event-loop lag and in-flight requests.
+
+    Attributes:
+        monitor: LagMonitor whose lag is checked
+        max_lag: Maximum lag in seconds for admitting new work
+        max_inflight: Maximum admitted requests that have not finished
+        queue_timeout: Seconds a request may wait for the overload to clear
+        retry_after: Retry-After seconds sent with a rejection
+        max_per_user: Running plus queued requests allowed per user
+        max_per_group: Running plus queued requests allowed per group (e.g. IP)
+        inflight: Admitted requests that are still running
+        user_load: Running plus queued requests per user
+        group_load: Running plus queued requests per group
+    """
+
+    def __init__(
+        self,
+        monitor: LagMonitor,
+        max_lag: float = 0.2,
+        max_inflight: int = 64,
+        queue_timeout: float = 1.0,
+        retry_after: int = 2,
+        poll_interval: float = 0.05,
+        max_per_user: int = 4,
+        max_per_group: int = 16
+    ):
+        self.monitor = monitor
+        self.max_lag = max_lag
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.poll_interval = poll_interval
+        self.max_per_user = max_per_user
+        self.max_per_group = max_per_group
+        self.inflight = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"lag": 0, "inflight": 0, "user_limit": 0, "group_limit": 0, "queue": 0}
+        self.user_load: Dict[str, int] = {}
+        self.group_load: Dict[str, int] = {}
+        # Weighted fair queue: heap of [finish tag, sequence, user]
+        self.waiting: List[list] = []
+        self.finish_tags: Dict[str, float] = {}
+        self.virtual_time = 0.0
+        self._sequence = itertools.count()
+
+    def overload_reason(self) -> Optional[str]:
+        if self.inflight >= self.max_inflight:
+            return "inflight"
+        if self.monitor.current_lag() > self.max_lag:
+            return "lag"
+        return None
+
+    async def admit(self, user: str = "anonymous", weight: float = 1.0, group: Optional[str] = None) -> AdmissionSlot:
+        """
+        Admits a request or raises Overloaded.
+
+        Every successful admit must be paired with a release: through the
+        returned slot (slot.track() does that for streams) or release(user, group).
+
+        Args:
+            user: Identity the per-user cap and fair share apply to
+            weight: Share of the user when requests queue (higher: sooner)
+            group: Group the user belongs to (e.g. its IP), capped at max_per_group
+
+        Returns:
+            AdmissionSlot: Releases the admitted request once
+        """
+        self.monitor.ensure_started()
+        # Fast path: a user at the cap is refused without queueing
+        if self.user_load.get(user, 0) >= self.max_per_user:
+            raise self._rejection("user_limit", user, counted=False)
+        if group is not None and self.group_load.get(group, 0) >= self.max_per_group:
+            raise self._rejection("group_limit", user, counted=False)
+        self.user_load[user] = self.user_load.get(user, 0) + 1
+        if group is not None:
+            self.group_load[group] = self.group_load.get(group, 0) + 1
+
+        reason = self.overload_reason()
+        if reason or self.waiting:
+            # Finish tag: users with more queued work (or a lower weight) wait longer
+            tag = max(self.virtual_time, self.finish_tags.get(user, 0.0)) + 1.0 / max(weight, 1e-6)
+            self.finish_tags[user] = tag
+            entry = [tag, next(self._sequence), user]
+            heapq.heappush(self.waiting, entry)
+            loop = asyncio.get_running_loop()
+            give_up = loop.time() + self.queue_timeout
+            admitted = False
+            try:
+                while True:
+                    reason = self.overload_reason()
+                    if not reason and self.waiting[0] is entry:
+                        admitted = True
+                        break
+                    if loop.time() >= give_up:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                # Client gone while queued
+                self._unload(user, group)
+                raise
+            finally:
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+            if not admitted:
+                raise self._rejection(reason or "queue", user, group=group)
+            self.virtual_time = max(self.virtual_time, tag)
+        self.inflight += 1
+        self.admitted += 1
+        return AdmissionSlot(self, user, group)
+
+    def _rejection(self, reason: str, user: str, counted: bool = True, group: Optional[str] = None) -> Overloaded:
+        if counted:
+            self._unload(user, group)
+        self.rejected[reason] += 1
+        logger.warning(
+            f"Request rejected ({reason}) for {user}: inflight={self.inflight}, "
+            f"lag={self.monitor.current_lag() * 1000:.0f}ms"
+        )
+        return Overloaded(reason, self.retry_after)
+
+    def _unload(self, user: str, group: Optional[str] = None):
+        load = self.user_load.get(user, 0) - 1
+        if load > 0:
+            self.user_load[user] = load
+        else:
+            self.user_load.pop(user, None)
+            self.finish_tags.pop(user, None)
+        if group is not None:
+            load = self.group_load.get(group, 0) - 1
+            if load > 0:
+                self.group_load[group] = load
+            else:
+                self.group_load.pop(group, None)
+
+    def release(self, user: str = "anonymous", group: Optional[str] = None):
+        self.inflight = max(0, self.inflight - 1)
+        self._unload(user, group)
+
+    def get_stats(self) -> Dict:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "max_lag_ms": self.max_lag * 1000,
+            "max_per_user": self.max_per_user,
+            "max_per_group": self.max_per_group,
+            "active_users": len(self.user_load),
+            "admitted": self.admitted,
+            "queued": len(self.waiting),
+            "rejected": dict(self.rejected),
+            "lag": self.monitor.get_stats()
+        }
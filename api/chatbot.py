@@ -3,6 +3,8 @@ import json
 import urllib.parse
 import httpx
 
+from api.personalities import get_personality
+
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         try:
@@ -23,15 +25,8 @@ class handler(BaseHTTPRequestHandler):
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
             
-            # Prepare system message based on personality
-            system_messages = {
-                'general': "You are a helpful AI assistant. Be friendly and helpful.",
-                'coder': "You are DUB5, an AI expert programmer. Provide code solutions and technical help.",
-                'teacher': "You are an educational AI tutor. Explain concepts clearly and encourage learning.",
-                'writer': "You are a creative writing assistant. Help with writing, editing, and creative ideas."
-            }
-            
-            system_message = system_messages.get(personality, system_messages['general'])
+            # Prepare system message based on personality (shared registry)
+            system_message = get_personality(personality).compact_prompt.text
             
             # Call Pollinations AI
             with httpx.Client(timeout=30.0) as client:
@@ -1,5 +1,6 @@
 import os
 import json
+import hashlib
 import sys
 import httpx
 import random
@@ -7,12 +8,25 @@ import time
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, List, Dict, Any, AsyncGenerator
-from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
+from typing import Optional, List, Dict, Any, AsyncGenerator, NamedTuple, Tuple
+from contextlib import AsyncExitStack
 
 from api.config import Config
 from api.timeout_manager import with_timeout_protection
-from api.provider_manager import ProviderManager
+from api.continuation_manager import ContinuationState, continuation_manager, build_resume_messages
+from api.compression import negotiate_encoding, compress_body, compress_sse_stream, MIN_COMPRESS_SIZE
+from api.error_handler import create_error_response
+from api.stream_hub import stream_hub, turn_key
+from api.provider_manager import ProviderManager, UpstreamHTTPError, classify_failure, parse_retry_after
+from api.concurrency_limiter import ProviderLimiters, QueueTimeout
+from api.retry_budget import call_with_retry, retry_budget
+from api.admission_control import AdmissionController, LagMonitor, Overloaded
+from api import metrics
+from api.timeseries import TimeSeriesStore
+from api import tracing
+from api.tracing import TraceExporter, TracingMiddleware
+from api.profiler import ProfilerBusy, SamplingProfiler
+from api.memory_inspector import MemoryInspector, process_memory
 
 # Voeg de huidige map toe aan sys.path voor imports
 current_dir = Path(__file__).parent.absolute()
@@ -118,10 +132,12 @@ def _lazy_import_g4f():
         
         return _g4f_module, _g4f_client_class, False
 
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, FileResponse
-from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from fastapi.requests import HTTPConnection
+from pydantic import BaseModel, ValidationError
 from typing import Optional, Dict, List
 import asyncio
 import time
@@ -175,8 +191,13 @@ except Exception as ne:
 # ---- Import project modules ----
 from api.models import AVAILABLE_MODELS, DEFAULT_MODEL, FALLBACK_MODEL, STABLE_PROVIDERS, SEARCH_PROVIDERS
 from api.thinking_modes import THINKING_MODES, DEFAULT_THINKING_MODE
-from api.context_manager import smart_context_manager, count_tokens
-from api.personalities import PERSONALITIES, DEFAULT_PERSONALITY
+from api.context_manager import count_tokens, context_budget, truncate_to_tokens, token_ledger, ContextOverflowError
+from api.map_reduce import MapReduceProcessor
+from api.history_summarizer import history_summarizer
+from api.personalities import PERSONALITIES, DEFAULT_PERSONALITY, get_personality
+from api.prompt_registry import prompt_registry, prompt_hash, system_prompt_tokens
+from api.model_router import model_router
+from api.complexity_classifier import complexity_classifier
 from api.circuit_breaker import get_breaker
 from api.file_parser import parse_multi_file_response, extract_clean_text
 from api.doc_parser import process_document
@@ -238,6 +259,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---- Tracing (Server-Timing + SSE timing event) ----
+trace_exporter = TraceExporter(Config.TRACE_SAMPLE_RATE, Config.TRACE_EXPORT_PATH)
+app.add_middleware(
+    TracingMiddleware,
+    paths=["/api/chatbot"],
+    exporter=trace_exporter,
+    server_timing=Config.SERVER_TIMING
+)
+
 # ---- Request body schema ----
 class FileInput(BaseModel):
     name: str
@@ -256,6 +286,8 @@ class UserInput(BaseModel):
     image: Optional[str] = None # Base64 encoded image
     session_id: Optional[str] = "default"
     library_ids: Optional[List[str]] = [] # IDs van opgeslagen leermateriaal
+    continuation_token: Optional[str] = None # Hervat een antwoord dat bij de tijdslimiet is afgebroken
+    stream: Optional[bool] = True # False: één JSON antwoord in plaats van SSE
 
 class ImageInput(BaseModel):
     input: str
@@ -296,7 +328,7 @@ async def delete_from_library(user_id: str, lib_id: str):
 ADMIN_SECRET_KEY = Config.ADMIN_SECRET_KEY
 
 class AdminAnalytics:
-    def __init__(self):
+    def __init__(self, snapshot_path: str = "", snapshot_interval: float = 60.0):
         self.stats = {
             "total_requests": 0,
             "total_tokens": 0,
@@ -304,15 +336,56 @@ class AdminAnalytics:
             "errors": 0,
             "start_time": time.time()
         }
+        # Per seconde en per minuut: requests, fouten, tokens, latency en cache hits
+        self.timeseries = TimeSeriesStore()
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot = time.time()
+        if snapshot_path:
+            self.load_snapshot()
     
-    def log_request(self, model: str, tokens: int, is_error: bool = False):
+    def log_request(self, model: str, tokens: int, is_error: bool = False, latency: Optional[float] = None):
+        # latency wordt alleen meegegeven voor afgeronde generaties (telt als request in de time series)
         self.stats["total_requests"] += 1
         self.stats["total_tokens"] += tokens
         if is_error:
             self.stats["errors"] += 1
         self.stats["popular_models"][model] = self.stats["popular_models"].get(model, 0) + 1
+        self.timeseries.record(tokens, is_error, latency)
+        self.maybe_save_snapshot()
+
+    def log_cache(self, hit: bool):
+        self.timeseries.record_cache(hit)
+
+    def query(self, window: str = "1h") -> Dict[str, Any]:
+        return self.timeseries.query(window)
+
+    def load_snapshot(self):
+        # Na een cold start verder met de time series van de vorige instance
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                self.timeseries.restore(f.read())
+            logger.info(f"Analytics snapshot loaded from {self.snapshot_path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Analytics snapshot not loaded: {e}")
+
+    def maybe_save_snapshot(self, force: bool = False):
+        now = time.time()
+        if not self.snapshot_path or (not force and now - self.last_snapshot < self.snapshot_interval):
+            return
+        self.last_snapshot = now
+        try:
+            # Eerst naar een tijdelijk bestand, dan atomair vervangen
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self.timeseries.snapshot())
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Analytics snapshot not saved: {e}")
 
-analytics = AdminAnalytics()
+analytics = AdminAnalytics(Config.ANALYTICS_SNAPSHOT_PATH, Config.ANALYTICS_SNAPSHOT_INTERVAL)
 
 # ---- Simple In-Memory Cache ----
 class ChatCache:
@@ -337,6 +410,16 @@ class ChatCache:
 
 chat_cache = ChatCache()
 
+# ---- Provider Health (gedeeld door alle requests) ----
+# Maximaal aantal gelijktijdige upstream streams per provider (eerlijke wachtrij per sessie)
+# De limits passen zich aan op TTFT en overbelasting (AIMD), tenzij uitgeschakeld
+provider_limiters = ProviderLimiters(
+    {"g4f": Config.G4F_CONCURRENCY, "pollinations": Config.POLLINATIONS_CONCURRENCY},
+    max_wait=Config.PROVIDER_QUEUE_TIMEOUT,
+    adaptive={"max_limit": Config.PROVIDER_MAX_CONCURRENCY} if Config.ADAPTIVE_CONCURRENCY else None
+)
+provider_health = ProviderManager(providers=["g4f", "pollinations"], limiters=provider_limiters)
+
 # ---- Provider Selection for g4f ----
 
 # Performance tracking for g4f providers
@@ -440,6 +523,8 @@ def get_best_g4f_provider():
     return getattr(g4f.Provider, selected_provider_name)
 
 
+# Maximale duur van één chat request (Vercel limiet minus marge)
+STREAM_MAX_DURATION = 50
 
 async def stream_chat_completion(
     messages: List[Dict[str, str]],
@@ -448,26 +533,58 @@ async def stream_chat_completion(
     personality_name: str,
     image_data: Optional[str],
     force_roulette: bool,
-    session_id: str
+    session_id: str,
+    continuation: Optional[ContinuationState] = None,
+    prompt_hash: str = "",
+    routing: Optional[Dict[str, Any]] = None,
+    max_duration: float = STREAM_MAX_DURATION
 ) -> AsyncGenerator[str, None]:
     logger.info(f"stream_chat_completion called for session_id: {session_id}")
     start_time = time.time()
+    stream_start = time.perf_counter()
+    tracing.annotate(model=model, personality=personality_name)
     
-    # Check Cache
-    cache_key = f"{model}:{personality_name}:{json.dumps(messages[-1])}:{web_search}"
-    cached_response = chat_cache.get(cache_key)
+    # Check Cache (resumed generations always end in the same continue prompt)
+    # prompt_hash onderscheidt system prompts (modus, custom prompt, RAG) zonder ze te hashen
+    cache_key = f"{model}:{personality_name}:{prompt_hash}:{json.dumps(messages[-1])}:{web_search}"
+    cached_response = chat_cache.get(cache_key) if continuation is None else None
+    if continuation is None:
+        metrics.cache_requests.inc("hit" if cached_response else "miss")
+        analytics.log_cache(bool(cached_response))
     if cached_response:
         logger.info("Serving response from cache")
+        metrics.requests_total.inc("cache", model, personality_name, "cached")
+        tracing.annotate(cached=True)
         yield f"data: {json.dumps({'type': 'metadata', 'model': model, 'personality': personality_name, 'cached': True})}\n\n"
         yield cached_response
         return
 
     logger.info(f"Starting chat completion for session_id: {session_id}, model: {model}, personality: {personality_name}, web_search: {web_search}")
     
-    # Metadata event
-    yield f"data: {json.dumps({'type': 'metadata', 'model': model, 'personality': personality_name, 'session_id': session_id})}\n\n"
+    # Metadata event (met de beslissing van de model router bij model "auto")
+    metadata = {'type': 'metadata', 'model': model, 'personality': personality_name, 'session_id': session_id}
+    if routing:
+        metadata['routing'] = routing
+    yield f"data: {json.dumps(metadata)}\n\n"
 
     full_response_text = ""
+    checkpointed = False
+    ttft = None
+    finished = failed = timed_out = False
+    # Labels en tijdstempels voor /metrics
+    provider_label = "none"
+    first_chunk_at = last_chunk_at = None
+
+    def checkpoint(elapsed: float) -> dict:
+        # Persist the partial answer so the client can resume it with a new call
+        nonlocal checkpointed
+        state = continuation_manager.checkpoint(
+            messages, full_response_text, model, personality_name, session_id, previous=continuation
+        )
+        if state is None:
+            return {}
+        checkpointed = True
+        return {'resumable': True, 'continuation_token': state.token, 'segments': state.segments}
     
     # Create the base generator
     base_generator = fetch_chunks_async(
@@ -477,12 +594,51 @@ async def stream_chat_completion(
         personality_name, 
         image_data, 
         force_roulette, 
-        session_id
+        session_id,
+        provider_manager=provider_health
     )
     
+    # Kleine chunks samenvoegen volgens het profiel van de personality
+    profile = get_personality(personality_name)
+    pending_text = ""
+    last_flush = time.perf_counter()
+
+    def flush_pending() -> str:
+        nonlocal pending_text, last_flush
+        frame = f"data: {json.dumps({'type': 'chunk', 'content': pending_text})}\n\n"
+        pending_text = ""
+        last_flush = time.perf_counter()
+        return frame
+
+    # Volgende chunk die nog onderweg is terwijl gebufferde tekst op de flush timer wacht
+    next_chunk: Optional[asyncio.Task] = None
+    
     try:
-        # Wrap with timeout protection (50 seconds max, 10 second heartbeat interval)
-        async for chunk in with_timeout_protection(base_generator, max_duration=50, heartbeat_interval=10):
+        # Wrap with timeout protection (max_duration, 10 second heartbeat interval)
+        chunks = with_timeout_protection(
+            base_generator, max_duration=max_duration, heartbeat_interval=10, checkpoint_callback=checkpoint
+        )
+        while True:
+            if next_chunk is None and not pending_text:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                # Gebufferde tekst wacht hooguit coalesce_delay, ook als upstream pauzeert
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(chunks.__anext__())
+                delay = profile.coalesce_delay - (time.perf_counter() - last_flush) if pending_text else None
+                done, _ = await asyncio.wait({next_chunk}, timeout=max(delay, 0) if delay is not None else None)
+                if not done:
+                    yield flush_pending()
+                    continue
+                task, next_chunk = next_chunk, None
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    break
+
             # Skip None sentinel values but continue to get the end message
             if chunk is None:
                 continue
@@ -491,11 +647,25 @@ async def stream_chat_completion(
             if isinstance(chunk, Exception):
                 raise chunk
             
+            # Alles wat geen content is gaat pas weg nadat de gebufferde tekst is verstuurd
+            is_event = isinstance(chunk, dict) or chunk.startswith(": heartbeat") or (
+                chunk.startswith("data: ") and ("timeout" in chunk or "end" in chunk)
+            )
+            if pending_text and is_event:
+                yield flush_pending()
+            
+            # Provider info from fetch_chunks_async (which backend is answering)
+            if isinstance(chunk, dict):
+                provider_label = chunk.get("provider", provider_label)
+                yield f"data: {json.dumps({'type': 'provider', **chunk})}\n\n"
+                continue
+            
             # Check if this is a timeout or end message from the wrapper
             if chunk.startswith("data: ") and ("timeout" in chunk or "end" in chunk):
                 yield chunk
                 # If it's a timeout message, we should stop processing
                 if "timeout" in chunk:
+                    timed_out = True
                     break
                 # If it's an end message, we're done
                 if "end" in chunk:
@@ -510,19 +680,77 @@ async def stream_chat_completion(
             # Process actual content chunks from fetch_chunks_async
             cleaned_chunk = clean_text(chunk) if chunk else ""
             if cleaned_chunk:
-                yield f"data: {json.dumps({'type': 'chunk', 'content': cleaned_chunk})}\n\n"
+                # De eerste chunk gaat direct door (time to first token)
+                first_chunk = not full_response_text
+                chunk_at = time.perf_counter()
+                if first_chunk:
+                    ttft = time.time() - start_time
+                    first_chunk_at = chunk_at
+                    tracing.record("ttft", stream_start)
+                else:
+                    metrics.inter_token_gap.observe(chunk_at - last_chunk_at, provider_label, model)
+                last_chunk_at = chunk_at
                 full_response_text += cleaned_chunk
+                pending_text += cleaned_chunk
+                if (
+                    first_chunk
+                    or len(pending_text) >= profile.coalesce_chars
+                    or time.perf_counter() - last_flush >= profile.coalesce_delay
+                ):
+                    yield flush_pending()
+        if pending_text:
+            yield flush_pending()
+        finished = True
     except Exception as e:
+        failed = True
+        if pending_text:
+            yield flush_pending()
         logger.error(f"Error during chat streaming for session_id: {session_id}: {e}", exc_info=True)
         yield f"data: {json.dumps({'type': 'error', 'content': f'Error during streaming: {e}'})}\n\n"
     finally:
+        if next_chunk is not None:
+            # Een lopende __anext__ eerst stoppen, anders kan aclose() niet
+            next_chunk.cancel()
+            try:
+                await next_chunk
+            except BaseException:
+                pass
+        # Upstream generator direct sluiten, zodat de provider slot vrijkomt
+        # (ook als de timeout wrapper is afgebroken)
+        await base_generator.aclose()
         # Ensure the queue is cleared and the thread is properly shut down if needed
         logger.info(f"Stream finished for session_id: {session_id}. Total response length: {len(full_response_text)}")
-        if full_response_text:
+        if full_response_text and continuation is None and not checkpointed:
             chat_cache.set(cache_key, full_response_text)
         
+        # Live latency/fouten per model voor de model router (afgebroken door de client telt niet mee)
+        if finished or failed:
+            model_router.record(model, ttft, ok=bool(full_response_text) and not failed)
+        
+        # Samenvatting van weggevallen history bijwerken, buiten het kritieke pad
+        if full_response_text:
+            history_summarizer.refresh(session_id, complete_upstream_text)
+        else:
+            history_summarizer.discard(session_id)
+        
+        # Latency, TTFT en doorvoer per provider/model/personality
+        output_tokens = count_tokens(full_response_text) if full_response_text else 0
+        status = "error" if failed else "timeout" if timed_out else "ok" if finished else "cancelled"
+        if first_chunk_at is not None:
+            tracing.record("stream", first_chunk_at, desc=provider_label)
+        tracing.annotate(provider=provider_label, outcome=status, output_tokens=output_tokens)
+        metrics.requests_total.inc(provider_label, model, personality_name, status)
+        metrics.request_duration.observe(time.time() - start_time, provider_label, model, personality_name)
+        if ttft is not None:
+            metrics.ttft_seconds.observe(ttft, provider_label, model, personality_name)
+        if output_tokens > 1 and last_chunk_at > first_chunk_at:
+            metrics.tokens_per_second.observe(
+                output_tokens / (last_chunk_at - first_chunk_at), provider_label, model
+            )
+        
         # Log performance for analytics
-        analytics.log_request(model, count_tokens(full_response_text), is_error=False)
+        analytics.log_request(model, output_tokens, is_error=failed, latency=time.time() - start_time)
+        profiler.request_done()
 
 async def fetch_chunks_async(
     messages: List[Dict[str, str]],
@@ -531,20 +759,36 @@ async def fetch_chunks_async(
     personality_name: str,
     image_data: Optional[str],
     force_roulette: bool,
-    session_id: str
+    session_id: str,
+    provider_manager: Optional[ProviderManager] = None
 ) -> AsyncGenerator[str, None]:
     logger.info(f"fetch_chunks_async started for session_id: {session_id}")
     
-    # Initialize ProviderManager for automatic fallback
-    provider_manager = ProviderManager(providers=["g4f", "pollinations"])
+    # Initialize ProviderManager for automatic fallback (unless a shared one is given)
+    if provider_manager is None:
+        provider_manager = ProviderManager(providers=["g4f", "pollinations"])
+    tried_providers = []
+    # Retries voor de eerste token moeten binnen deze deadline passen
+    retry_deadline = time.monotonic() + Config.RETRY_DEADLINE
     
     try:
         # Try providers in order based on ProviderManager selection
         for attempt in range(2):  # Try primary, then fallback
-            provider = provider_manager.get_next_provider()
+            provider = provider_manager.get_next_provider(exclude=tried_providers)
+            tried_providers.append(provider)
             logger.info(f"Attempt {attempt + 1}: Using provider: {provider}")
             
+            slot_limiter = provider_limiters.get(provider)
+            acquired = False
+            ttft = None
+            queue_start = time.perf_counter()
             try:
+                # Wachten op een vrije upstream slot (eerlijk verdeeld per sessie)
+                await slot_limiter.acquire(session_id)
+                acquired = True
+                slot_start = call_start = time.perf_counter()
+                tracing.record("queue", queue_start, desc=provider)
+                
                 if provider == "g4f":
                     # Lazy load g4f module
                     g4f, Client, is_available = _lazy_import_g4f()
@@ -569,11 +813,21 @@ async def fetch_chunks_async(
                     provider_name_str = selected_g4f_provider.__name__
                     start_time_g4f = time.perf_counter()
 
-                    response = await g4f_client.chat.completions.create(
-                        model=model,
-                        messages=messages,
-                        stream=True
-                    )
+                    async def open_g4f_stream():
+                        nonlocal call_start
+                        call_start = time.perf_counter()
+                        return await g4f_client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            stream=True
+                        )
+
+                    # Transiënte fouten voor de eerste token binnen het retry budget herhalen
+                    response = await call_with_retry(open_g4f_stream, "g4f", retry_budget, retry_deadline)
+                    # Zonder backoff van eerdere pogingen (signaal voor de adaptieve limiet)
+                    ttft = time.perf_counter() - call_start
+                    tracing.record("connect", slot_start, desc="g4f")
+                    yield {"provider": "g4f", "upstream": provider_name_str}
                     for chunk in response:
                         content = chunk.choices[0].delta.content
                         if content:
@@ -590,6 +844,8 @@ async def fetch_chunks_async(
                     
                     # Record success with ProviderManager
                     provider_manager.record_success("g4f")
+                    slot_limiter.record_success(ttft)
+                    metrics.provider_latency.observe(time.perf_counter() - slot_start, "g4f", "ok")
                     logger.info(f"g4f call with {provider_name_str} successful in {latency:.4f} seconds.")
                     yield None # Signal end of stream
                     return
@@ -609,69 +865,112 @@ async def fetch_chunks_async(
                     }
                     
                     logger.info(f"Making direct Pollinations AI request: {pollinations_url}")
-                    # Configure httpx client with 50-second timeout
-                    async with httpx.AsyncClient(timeout=50.0) as client:
-                        async with client.stream(
-                            "POST",
-                            pollinations_url,
-                            json=pollinations_payload
-                        ) as response:
+                    # Verbinding openen tot en met de response headers: transiënte fouten
+                    # (connect, timeout, 502/503/504) worden binnen het retry budget herhaald
+                    async def open_pollinations_stream():
+                        nonlocal call_start
+                        call_start = time.perf_counter()
+                        stack = AsyncExitStack()
+                        try:
+                            # Configure httpx client with 50-second timeout
+                            client = await stack.enter_async_context(httpx.AsyncClient(timeout=50.0))
+                            response = await stack.enter_async_context(client.stream(
+                                "POST",
+                                pollinations_url,
+                                json=pollinations_payload
+                            ))
                             logger.info(f"Pollinations Response Status: {response.status_code}")
-                            if response.is_success:
-                                buffer = b""
-                                async for chunk in response.aiter_bytes():
-                                    buffer += chunk
-                                    while b"\n" in buffer:
-                                        line, buffer = buffer.split(b"\n", 1)
-                                        line = line.decode("utf-8").strip()
-                                        if line.startswith("data: "):
-                                            data_str = line[6:]
-                                            if data_str == "[DONE]": 
-                                                break
-                                            try:
-                                                chunk_data = json.loads(data_str)
-                                                content = chunk_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                                                if content:
-                                                    logger.debug(f"Pollinations AI: Yielding content: {content[:50]}...")
-                                                    yield content
-                                            except json.JSONDecodeError:
-                                                continue
-                                            except Exception as chunk_e:
-                                                logger.error(f"Error processing Pollinations chunk: {chunk_e}")
-                                                continue
-                                
-                                # Process remaining buffer
-                                if buffer.strip():
-                                    line = buffer.decode("utf-8").strip()
-                                    if line.startswith("data: "):
-                                        data_str = line[6:]
-                                        if data_str != "[DONE]":
-                                            try:
-                                                chunk_data = json.loads(data_str)
-                                                content = chunk_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                                                if content:
-                                                    yield content
-                                            except json.JSONDecodeError:
-                                                pass
-                                            except Exception as chunk_e:
-                                                logger.error(f"Error processing final Pollinations chunk: {chunk_e}")
-                            else:
+                            if not response.is_success:
                                 response_body = await response.aread()
                                 logger.error(f"Pollinations AI failed with status {response.status_code}: {response_body.decode()}")
-                                raise Exception(f"Pollinations AI HTTP error: {response.status_code}")
+                                raise UpstreamHTTPError(
+                                    f"Pollinations AI HTTP error: {response.status_code}",
+                                    response.status_code,
+                                    parse_retry_after(response.headers.get("Retry-After"))
+                                )
+                        except BaseException:
+                            await stack.aclose()
+                            raise
+                        return stack, response
+
+                    stack, response = await call_with_retry(
+                        open_pollinations_stream, "pollinations", retry_budget, retry_deadline
+                    )
+                    async with stack:
+                        ttft = time.perf_counter() - call_start
+                        tracing.record("connect", slot_start, desc="pollinations")
+                        yield {"provider": "pollinations", "upstream": "pollinations"}
+                        buffer = b""
+                        async for chunk in response.aiter_bytes():
+                            buffer += chunk
+                            while b"\n" in buffer:
+                                line, buffer = buffer.split(b"\n", 1)
+                                line = line.decode("utf-8").strip()
+                                if line.startswith("data: "):
+                                    data_str = line[6:]
+                                    if data_str == "[DONE]": 
+                                        break
+                                    try:
+                                        chunk_data = json.loads(data_str)
+                                        content = chunk_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                                        if content:
+                                            logger.debug(f"Pollinations AI: Yielding content: {content[:50]}...")
+                                            yield content
+                                    except json.JSONDecodeError:
+                                        continue
+                                    except Exception as chunk_e:
+                                        logger.error(f"Error processing Pollinations chunk: {chunk_e}")
+                                        continue
+                                
+                        # Process remaining buffer
+                        if buffer.strip():
+                            line = buffer.decode("utf-8").strip()
+                            if line.startswith("data: "):
+                                data_str = line[6:]
+                                if data_str != "[DONE]":
+                                    try:
+                                        chunk_data = json.loads(data_str)
+                                        content = chunk_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                                        if content:
+                                            yield content
+                                    except json.JSONDecodeError:
+                                        pass
+                                    except Exception as chunk_e:
+                                        logger.error(f"Error processing final Pollinations chunk: {chunk_e}")
 
                     end_time_pollinations = time.perf_counter()
                     duration_pollinations = end_time_pollinations - start_time_pollinations
                     
                     # Record success with ProviderManager
                     provider_manager.record_success("pollinations")
+                    slot_limiter.record_success(ttft)
+                    metrics.provider_latency.observe(time.perf_counter() - slot_start, "pollinations", "ok")
                     logger.info(f"Pollinations AI call completed in {duration_pollinations:.4f} seconds.")
                     yield None # Signal end of stream
                     return
                     
+            except QueueTimeout as busy:
+                # Provider zit vol: geen storing, direct naar de volgende provider
+                logger.warning(f"Provider {provider} saturated: {busy}")
+                tracing.record("queue", queue_start, desc=f"{provider} timeout")
+                if attempt == 1:
+                    yield Exception(f"All AI providers busy. Last error: {busy}")
+                    return
+                continue
             except Exception as provider_e:
-                # Record failure with ProviderManager
-                provider_manager.record_failure(provider)
+                # Rate limits en Retry-After: exact zo lang wachten, geen strike
+                failure = classify_failure(provider_e)
+                if failure.outage:
+                    # Record failure with ProviderManager
+                    provider_manager.record_failure(provider)
+                if failure.delay is not None:
+                    provider_manager.defer(provider, failure.delay, failure.kind)
+                # Overbelasting (429, 5xx, netwerk) verlaagt de concurrency limit
+                if failure.overload:
+                    slot_limiter.record_overload()
+                if acquired:
+                    metrics.provider_latency.observe(time.perf_counter() - slot_start, provider, failure.kind)
+                    tracing.record("failed", slot_start, desc=f"{provider} {failure.kind}")
                 logger.error(f"Provider {provider} failed: {provider_e}", exc_info=True)
                 
                 # If this was the last attempt, raise the error
@@ -682,67 +981,127 @@ async def fetch_chunks_async(
                 else:
                     logger.info(f"Attempting fallback to next provider")
                     continue
+            finally:
+                if acquired:
+                    slot_limiter.release()
 
     except Exception as e:
         logger.error(f"Error in fetch_chunks_async for session_id: {session_id}: {e}", exc_info=True)
         yield Exception(f"Streaming error: {e}")
 
-# ---- Main chat API endpoint ----
-@app.post("/api/chatbot")
-async def chatbot_response(user_input: UserInput, request: Request):
-    # Rate Limiting
-    client_ip = request.client.host
-    if not limiter.is_allowed(client_ip):
-        logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-        raise HTTPException(status_code=429, detail="Te veel verzoeken. Probeer het over een minuutje weer.")
+async def complete_upstream_text(messages: List[Dict[str, str]], model: str) -> str:
+    """
+    Haalt een volledig antwoord op zonder SSE, voor interne hulptaken
+    (history samenvattingen, map-fase van grote inputs).
+    """
+    parts = []
+    async for chunk in fetch_chunks_async(
+        messages, model, False, "internal", None, False, "internal", provider_manager=provider_health
+    ):
+        if isinstance(chunk, Exception):
+            raise chunk
+        if isinstance(chunk, str):
+            parts.append(chunk)
+    return final_clean_text("".join(parts))
+
+def build_file_context(user_input: UserInput) -> str:
+    """Zet de geüploade bestanden om naar tekst context voor het user bericht."""
+    file_context = ""
+    if user_input.files:
+        import base64
+        for file in user_input.files:
+            try:
+                # Als de content base64 is, decoderen we het
+                if "base64," in file.content:
+                    header, data = file.content.split("base64,")
+                    file_bytes = base64.b64decode(data)
+                else:
+                    file_bytes = file.content.encode('utf-8')
+                
+                parsed_text = process_document(file.name, file_bytes)
+                if parsed_text:
+                    file_context += f"\n\n--- INHOUD BESTAND: {file.name} ---\n{parsed_text}\n"
+            except Exception as fe:
+                logger.error(f"Error processing file {file.name}: {fe}")
+    return file_context
+
+class ChatPlan(NamedTuple):
+    """Resultaat van build_chat_messages: alles wat nodig is om de generatie te starten."""
+    messages: List[Dict[str, str]]
+    model: str
+    personality: str
+    prompt_hash: str
+    routing: Optional[Dict[str, Any]] = None
+
+def build_chat_messages(
+    user_input: UserInput,
+    file_context: Optional[str] = None,
+    user_content: Optional[str] = None
+) -> ChatPlan:
+    """
+    Bouwt de upstream conversatie voor een chat request.
+
+    Gedeeld door alle transports (HTTP en WebSocket) zodat ze dezelfde
+    model-, personality- en prompt-logica gebruiken.
+
+    Args:
+        user_input: Het request
+        file_context: Al verwerkte bestanden (anders worden ze hier verwerkt)
+        user_content: Vervangt input + bestanden als user bericht (map-reduce resultaat)
 
+    Returns:
+        ChatPlan: messages, model, personality, prompt_hash (identificeert de
+                  volledige system prompt, voor cache keys) en routing (de
+                  beslissing van de model router bij model "auto")
+    """
     # Thinking Mode & Personality Selection
     thinking_mode = user_input.thinking_mode if user_input.thinking_mode in THINKING_MODES else DEFAULT_THINKING_MODE
     personality = user_input.personality if user_input.personality in PERSONALITIES else DEFAULT_PERSONALITY
     
     # Auto-model selection or specific model
+    routing = None
     if user_input.model == "auto":
-        if thinking_mode == "concise":
-            model = "gpt-4o-mini"
-        elif thinking_mode == "deep":
-            model = "gpt-4o"
-        elif thinking_mode == "reason":
-            model = "gpt-4o"
-        else:
-            model = "gpt-4o" # Default to gpt-4o for balanced
+        # Modus niet bewust gekozen: lokale classifier schat de complexiteit van de prompt
+        prediction = None
+        if user_input.thinking_mode in (None, "auto", DEFAULT_THINKING_MODE):
+            prediction = complexity_classifier.predict(user_input.input)
+            thinking_mode = prediction.thinking_mode
+        # Router kiest op live latency, foutpercentage en kosten binnen de SLO van de modus
+        decision = model_router.route(thinking_mode, preferred=get_personality(personality).recommended_model)
+        model = decision.model
+        routing = decision.to_dict()
+        if prediction:
+            routing["classifier"] = prediction.to_dict()
+        logger.info(f"Model router picked {model}: {decision.reason}")
     else:
         model = user_input.model if user_input.model in AVAILABLE_MODELS else DEFAULT_MODEL
     
     logger.info(f"Request received: model={model}, thinking_mode={thinking_mode}, personality={personality}, web_search={user_input.web_search}")
     
-    # Combined system prompts
-    mode_prompt = THINKING_MODES.get(thinking_mode, THINKING_MODES[DEFAULT_THINKING_MODE])["system_prompt"]
-    personality_prompt = PERSONALITIES.get(personality, PERSONALITIES[DEFAULT_PERSONALITY])["system_prompt"]
-    
     # Log analytics
     input_tokens = count_tokens(user_input.input, model)
     analytics.log_request(model, input_tokens)
 
-    # Gebruik custom system prompt als die is meegegeven, anders de standaard
-    if user_input.custom_system_prompt:
-        base_prompt = user_input.custom_system_prompt
-    else:
-        base_prompt = SYSTEM_PROMPT
+    # Statische system prompt: vooraf opgebouwd per personality en modus
+    # (custom system prompt als die is meegegeven, anders de standaard)
+    prefix = prompt_registry.get(personality, thinking_mode, user_input.custom_system_prompt)
 
-    combined_system_prompt = f"{base_prompt}\n\nROL: {personality.upper()}\n{personality_prompt}\n\nMODUS: {thinking_mode.upper()}\n{mode_prompt}"
+    # Alleen de dynamische delen worden per request toegevoegd
+    dynamic_prompt = ""
     
     # PROJECT CONTEXT (voor Web App Builder)
     if personality == "coder":
         project_context = project_manager.get_project_context(user_input.session_id)
-        combined_system_prompt += f"\n\n{project_context}"
+        dynamic_prompt += f"\n\n{project_context}"
 
     if user_input.web_search:
-        combined_system_prompt += "\n\nWEB SEARCH ENABLED: You have access to real-time information via web search. Use this capability to provide up-to-date information if the user asks for news, current events, or data beyond your training cutoff."
+        dynamic_prompt += "\n\nWEB SEARCH ENABLED: You have access to real-time information via web search. Use this capability to provide up-to-date information if the user asks for news, current events, or data beyond your training cutoff."
 
     # RAG: KENNIS UIT BIBLIOTHEEK (voor Learning Platform)
     rag_context = ""
     if user_input.library_ids:
         # Hier gaan we chunks zoeken in de opgegeven library items
+        rag_start = time.perf_counter()
         all_relevant_chunks = []
         user_id = "default_user" # In de toekomst uit auth
         
@@ -755,82 +1114,581 @@ async def chatbot_response(user_input: UserInput, request: Request):
         
         if all_relevant_chunks:
             rag_context = "\n\nRELEVANTE KENNIS UIT BIBLIOTHEEK:\n" + "\n---\n".join(all_relevant_chunks)
-            combined_system_prompt += rag_context
+            dynamic_prompt += rag_context
+        tracing.record("rag", rag_start)
+
+    combined_system_prompt = prefix.text + dynamic_prompt
 
+    # Build messages with history (memory)
+    messages = [{"role": "system", "content": combined_system_prompt}]
+    
+    # Voeg history toe van de frontend
+    if user_input.history:
+        for msg in user_input.history:
+            # Ensure each history item is a valid dictionary with role and content
+            if isinstance(msg, dict) and "role" in msg and "content" in msg:
+                messages.append({"role": msg["role"], "content": msg["content"]})
+            elif isinstance(msg, list) and len(msg) >= 2:
+                # Fallback for old list-style history [role, content]
+                messages.append({"role": msg[0], "content": msg[1]})
+    
+    # VERWERK GEÜPLOADE BESTANDEN
+    if file_context is None:
+        file_context = build_file_context(user_input)
+
+    # Voeg het huidige bericht toe met de file context (of het map-reduce resultaat)
+    user_msg_content = user_input.input
+    if user_content is not None:
+        user_msg_content = user_content
+    elif file_context:
+        user_msg_content = f"{user_msg_content}\n\nGEÜPLOADE BESTANDEN:\n{file_context}"
+    
+    # AUTOMATISCHE TXT CONVERSIE VOOR GROTE INPUT
+    # Als de totale input te groot is (en map-reduce uit staat), voegen we een hint toe aan de AI
+    if user_content is None and len(user_msg_content) > 15000: # Ongeveer 4000 tokens
+        logger.info("Input is very large, adding compression hint")
+        user_msg_content += "\n\n(Let op: Deze input is erg groot en is automatisch verwerkt als tekstbestand context.)"
+
+    messages.append({"role": "user", "content": user_msg_content})
+    
+    # SLIM CONTEXT MANAGEMENT
+    # We bepalen het token budget op basis van het model
+    max_tokens = context_budget(model)
+    # Berichten die buiten het venster vallen worden vervangen door een samenvatting (indien al beschikbaar)
+    messages, context_tokens = history_summarizer.apply(
+        messages, model, max_tokens=max_tokens, session_id=user_input.session_id,
+        system_tokens=system_prompt_tokens(prefix, dynamic_prompt, model)
+    )
+    
+    logger.info(f"Context management: {len(messages)} messages ({context_tokens} tokens) sent to {model}")
+
+    return ChatPlan(messages, model, personality, prompt_hash(prefix, dynamic_prompt), routing)
+
+# ---- Map-reduce voor grote inputs ----
+# De map-fase gebruikt een snel model; het eindantwoord het gekozen model.
+MAP_REDUCE_MODEL = "gpt-4o-mini"
+# Tijd die na de map-fase minimaal overblijft voor het eindantwoord
+MAP_REDUCE_ANSWER_SECONDS = 20
+map_reducer = MapReduceProcessor(
+    concurrency=Config.MAP_REDUCE_CONCURRENCY,
+    chunk_tokens=Config.MAP_REDUCE_CHUNK_TOKENS,
+    deadline=Config.MAP_REDUCE_DEADLINE
+)
+
+def is_large_input(user_input: UserInput, file_context: str) -> bool:
+    threshold = Config.MAP_REDUCE_THRESHOLD
+    return bool(threshold) and len(user_input.input) + len(file_context) > threshold
+
+async def map_reduce_stream(user_input: UserInput, file_context: str, deadline: float) -> AsyncGenerator[str, None]:
+    """
+    Verkleint een grote input met gelijktijdige map calls en streamt daarna het antwoord.
+
+    Tijdens de map-fase worden progress events gestuurd, zodat de client
+    voortgang ziet en de verbinding open blijft. Map-fase en eindantwoord
+    delen één deadline (time.monotonic() waarde, gezet bij binnenkomst van het request).
+    """
+    question, material = user_input.input, file_context
+    if count_tokens(question) > Config.MAP_REDUCE_CHUNK_TOKENS // 2:
+        # De input zelf is het grote stuk: neem begin en eind mee als vraag
+        material = f"{question}{file_context}"
+        question = truncate_to_tokens(question, 300)
+
+    reduced = None
+    async for event in map_reducer.run(
+        question, material, complete_upstream_text, MAP_REDUCE_MODEL,
+        max_seconds=deadline - time.monotonic() - MAP_REDUCE_ANSWER_SECONDS
+    ):
+        if event["type"] == "reduced":
+            reduced = event
+            continue
+        yield f"data: {json.dumps(event)}\n\n"
+
+    user_content = (
+        f"{question}\n\nVERKLEINDE INPUT (automatisch samengevat uit {reduced['chunks']} delen van een grote input):\n"
+        f"{reduced['content']}"
+    )
+    plan = build_chat_messages(user_input, file_context=file_context, user_content=user_content)
+    async for frame in stream_chat_completion(
+        plan.messages,
+        plan.model,
+        user_input.web_search,
+        plan.personality,
+        user_input.image,
+        getattr(user_input, 'force_roulette', False),
+        user_input.session_id,
+        prompt_hash=plan.prompt_hash,
+        routing=plan.routing,
+        max_duration=max(0.0, deadline - time.monotonic())
+    ):
+        yield frame
+
+async def with_timing_event(stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    Sluit een SSE stream af met het timing event van het request dat hem leest.
+
+    Het event hoort niet in de generatie zelf: via de stream hub delen meerdere
+    requests één generatie, en elk request krijgt zijn eigen trace terug.
+    """
     try:
-        # Build messages with history (memory)
-        messages = [{"role": "system", "content": combined_system_prompt}]
-        
-        # Voeg history toe van de frontend
-        if user_input.history:
-            for msg in user_input.history:
-                # Ensure each history item is a valid dictionary with role and content
-                if isinstance(msg, dict) and "role" in msg and "content" in msg:
-                    messages.append({"role": msg["role"], "content": msg["content"]})
-                elif isinstance(msg, list) and len(msg) >= 2:
-                    # Fallback for old list-style history [role, content]
-                    messages.append({"role": msg[0], "content": msg[1]})
-        
-        # VERWERK GEÜPLOADE BESTANDEN
-        file_context = ""
-        if user_input.files:
-            import base64
-            for file in user_input.files:
-                try:
-                    # Als de content base64 is, decoderen we het
-                    if "base64," in file.content:
-                        header, data = file.content.split("base64,")
-                        file_bytes = base64.b64decode(data)
-                    else:
-                        file_bytes = file.content.encode('utf-8')
-                    
-                    parsed_text = process_document(file.name, file_bytes)
-                    if parsed_text:
-                        file_context += f"\n\n--- INHOUD BESTAND: {file.name} ---\n{parsed_text}\n"
-                except Exception as fe:
-                    logger.error(f"Error processing file {file.name}: {fe}")
-
-        # Voeg het huidige bericht toe met de file context
-        user_msg_content = user_input.input
-        if file_context:
-            user_msg_content = f"{user_msg_content}\n\nGEÜPLOADE BESTANDEN:\n{file_context}"
-        
-        # AUTOMATISCHE TXT CONVERSIE VOOR GROTE INPUT
-        # Als de totale input te groot is, voegen we een hint toe aan de AI
-        if len(user_msg_content) > 15000: # Ongeveer 4000 tokens
-            logger.info("Input is very large, adding compression hint")
-            user_msg_content += "\n\n(Let op: Deze input is erg groot en is automatisch verwerkt als tekstbestand context.)"
+        async for frame in stream:
+            yield frame
+    finally:
+        await stream.aclose()
+    # Laatste event: waar de tijd van dit request heen ging (alleen bij getraceerde requests)
+    trace = tracing.current_trace.get()
+    if trace is not None:
+        yield f"data: {json.dumps(trace.timing_event())}\n\n"
 
-        messages.append({"role": "user", "content": user_msg_content})
-        
-        # SLIM CONTEXT MANAGEMENT
-        # We bepalen het token budget op basis van het model
-        max_tokens = 8000 if "gpt-4" in model or "claude" in model else 4000
-        messages = smart_context_manager(messages, model, max_tokens=max_tokens)
-        
-        logger.info(f"Context management: {len(messages)} messages sent to {model}")
+def open_chat_stream(user_input: UserInput) -> AsyncGenerator[str, None]:
+    """
+    Geeft de SSE stream voor een chat request terug.
 
-        return StreamingResponse(
-            stream_chat_completion(
-                messages, 
-                model, 
-                user_input.web_search, 
-                personality, 
-                user_input.image,
-                getattr(user_input, 'force_roulette', False),
-                user_input.session_id
-            ),
-            media_type="text/event-stream",
-            headers={
-                "Content-Type": "text/event-stream",
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
+    Hervat een eerder afgebroken antwoord als er een continuation token is
+    meegegeven, anders wordt de conversatie opgebouwd met build_chat_messages.
+    Requests met een eigen session_id delen via de stream hub één generatie
+    per gesprekbeurt.
+
+    Raises:
+        HTTPException: 410 als het continuation token ongeldig of verlopen is
+    """
+    # CONTINUATION: hervat een eerder afgebroken antwoord zonder history opnieuw te versturen
+    if user_input.continuation_token:
+        continuation = continuation_manager.resume(user_input.continuation_token, user_input.session_id)
+        if continuation is None:
+            raise HTTPException(status_code=410, detail="Continuation token is ongeldig of verlopen.")
+        logger.info(f"Resuming continuation segment {continuation.segments + 1} for session_id: {user_input.session_id}")
+        return with_timing_event(stream_chat_completion(
+            build_resume_messages(continuation),
+            continuation.model,
+            user_input.web_search,
+            continuation.personality,
+            None,
+            False,
+            user_input.session_id,
+            continuation=continuation
+        ))
+
+    # GROTE INPUT: eerst in delen verkleinen (map-reduce), daarna het echte antwoord
+    deadline = time.monotonic() + STREAM_MAX_DURATION
+    with tracing.span("files"):
+        file_context = build_file_context(user_input)
+    if is_large_input(user_input, file_context):
+        return with_timing_event(map_reduce_stream(user_input, file_context, deadline))
+
+    with tracing.span("prompt"):
+        plan = build_chat_messages(user_input, file_context=file_context)
+
+    def start_generation():
+        return stream_chat_completion(
+            plan.messages, 
+            plan.model, 
+            user_input.web_search, 
+            plan.personality, 
+            user_input.image,
+            getattr(user_input, 'force_roulette', False),
+            user_input.session_id,
+            prompt_hash=plan.prompt_hash,
+            routing=plan.routing
+        )
+
+    # Dezelfde sessie in meerdere tabs: sluit aan bij een lopende generatie
+    if user_input.session_id and user_input.session_id != "default":
+        key = turn_key(user_input.session_id, plan.messages, plan.model, plan.personality, user_input.web_search, user_input.image)
+        return with_timing_event(stream_hub.subscribe(key, start_generation))
+    return with_timing_event(start_generation())
+
+# ---- Main chat API endpoint ----
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+# ---- Admission control ----
+# Nieuwe requests worden geweigerd (503 + Retry-After) als de event loop achterloopt
+# of er te veel requests lopen; lopende streams worden nooit afgebroken.
+# Per gebruiker is het aantal gelijktijdige streams begrensd (429, direct),
+# en per IP voor identiteiten die de client zelf kiest (sessies).
+lag_monitor = LagMonitor()
+admission = AdmissionController(
+    lag_monitor,
+    max_lag=Config.ADMISSION_MAX_LAG_MS / 1000,
+    max_inflight=Config.ADMISSION_MAX_INFLIGHT,
+    queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT,
+    retry_after=Config.ADMISSION_RETRY_AFTER,
+    max_per_user=Config.MAX_STREAMS_PER_USER,
+    max_per_group=Config.MAX_STREAMS_PER_IP
+)
+
+def parse_key_weights(value: str) -> Dict[str, float]:
+    """Leest "key1:2,key2:0.5" in; ongeldige items worden overgeslagen."""
+    weights = {}
+    for item in value.split(","):
+        key, _, weight = item.strip().rpartition(":")
+        try:
+            if key:
+                weights[key] = float(weight)
+        except ValueError:
+            logger.warning(f"Ignoring invalid API key weight: {item}")
+    return weights
+
+API_KEY_WEIGHTS = parse_key_weights(Config.API_KEY_WEIGHTS)
+
+def admission_identity(user_input: UserInput, connection: HTTPConnection) -> Tuple[str, float, Optional[str]]:
+    """
+    Bepaalt voor wie een request telt: bekende API key (uit
+    DUB5_API_KEY_WEIGHTS), anders sessie, anders IP (de "default" sessie
+    wordt door iedereen gedeeld). Geeft ook het gewicht in de eerlijke
+    wachtrij terug, en de IP groep voor sessies: die kiest de client zelf,
+    dus een nieuw session id per request mag de IP limiet niet omzeilen.
+    Werkt voor HTTP requests en WebSockets, zodat elke transport dezelfde
+    identiteit gebruikt.
+    """
+    ip = f"ip:{connection.client.host if connection.client else 'unknown'}"
+    api_key = connection.headers.get("X-API-Key")
+    if api_key and api_key in API_KEY_WEIGHTS:
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return f"key:{digest}", API_KEY_WEIGHTS[api_key], None
+    if user_input.session_id and user_input.session_id != "default":
+        return f"session:{user_input.session_id}", 1.0, ip
+    return ip, 1.0, None
+
+def admission_rejection(e: Overloaded) -> HTTPException:
+    """Zet een geweigerde admission om naar 429 (per-user/IP limiet) of 503 (server te druk)."""
+    if e.reason in ("user_limit", "group_limit"):
+        return HTTPException(
+            status_code=429,
+            detail="Je hebt al te veel antwoorden tegelijk lopen. Wacht tot er een klaar is.",
+            headers={"Retry-After": str(e.retry_after)}
         )
+    return HTTPException(
+        status_code=503,
+        detail="De server is even te druk. Probeer het zo opnieuw.",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.post("/api/chatbot")
+async def chatbot_response(user_input: UserInput, request: Request):
+    # Body is binnen en gevalideerd: sluit de "validate" stage van de trace af
+    tracing.mark_endpoint_start()
+
+    # Rate Limiting
+    client_ip = request.client.host
+    if not limiter.is_allowed(client_ip):
+        logger.warning(f"Rate limit exceeded for IP: {client_ip}")
+        raise HTTPException(status_code=429, detail="Te veel verzoeken. Probeer het over een minuutje weer.")
+
+    # Admission voordat er iets upstream gebeurt: weigeren is goedkoop
+    user_key, weight, group = admission_identity(user_input, request)
+    try:
+        with tracing.span("admission"):
+            slot = await admission.admit(user_key, weight, group)
+    except Overloaded as e:
+        raise admission_rejection(e)
+
+    # Een stream geeft zijn plek pas vrij als hij klaar is, al het andere hier
+    tracked = False
+    try:
+        if not user_input.stream:
+            return await json_completion_response(user_input, request)
+        stream = slot.track(open_chat_stream(user_input))
+        tracked = True
+    except HTTPException:
+        raise
+    except ContextOverflowError as e:
+        # System prompt en context laten geen ruimte voor de vraag: nooit een lege user turn sturen
+        raise HTTPException(status_code=413, detail=f"Het bericht past niet in het contextvenster: {e}")
     except Exception as e:
         logger.error(f"Error in chatbot_response: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not tracked:
+            slot.release()
+
+    # Ook als de body nooit gelezen wordt (client direct weg) komt de plek vrij
+    # (async, zodat de release op de event loop blijft en niet in de threadpool draait)
+    async def release_slot():
+        slot.release()
+    release = BackgroundTask(release_slot)
+
+    # Streaming compressie als de client het ondersteunt (Accept-Encoding)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if Config.SSE_COMPRESSION else None
+    if encoding:
+        return StreamingResponse(
+            compress_sse_stream(stream, encoding),
+            media_type="text/event-stream",
+            headers={**SSE_HEADERS, "Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+            background=release
+        )
+
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=release
+    )
+
+# ---- WebSocket chat transport ----
+# Eén verbinding per browser tab; meerdere gesprekken lopen tegelijk via stream_id.
+# Let op: Vercel serverless ondersteunt geen WebSockets, dit werkt alleen op een
+# langlopende server (uvicorn).
+WS_MAX_STREAMS_PER_CONNECTION = 4
+
+def sse_to_events(frame: str) -> List[Dict[str, Any]]:
+    """Zet een SSE frame van stream_chat_completion om naar WebSocket events."""
+    if frame.startswith(":"):
+        # Heartbeat comments zijn niet nodig, WebSocket pings houden de verbinding open
+        return []
+    if frame.startswith("data: "):
+        try:
+            return [json.loads(frame[6:].strip())]
+        except json.JSONDecodeError:
+            return [{"type": "chunk", "content": frame[6:].strip()}]
+    # Cached responses worden als ruwe tekst teruggegeven
+    return [{"type": "chunk", "content": frame}] if frame else []
+
+@app.websocket("/api/ws")
+async def chatbot_websocket(websocket: WebSocket):
+    await websocket.accept()
+    client_ip = websocket.client.host if websocket.client else "unknown"
+    streams: Dict[str, asyncio.Task] = {}
+    send_lock = asyncio.Lock()
+
+    async def send_event(stream_id: str, event: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_text(json.dumps({**event, "stream_id": stream_id}))
+
+    async def run_stream(stream_id: str, user_input: UserInput):
+        # Zelfde admission als /api/chatbot: lag, in-flight en per-user limiet
+        slot = None
+        user_key, weight, group = admission_identity(user_input, websocket)
+        try:
+            try:
+                slot = await admission.admit(user_key, weight, group)
+            except Overloaded as e:
+                rejection = admission_rejection(e)
+                await send_event(stream_id, {
+                    "type": "error",
+                    "content": rejection.detail,
+                    "status": rejection.status_code,
+                    "retry_after": e.retry_after
+                })
+                return
+            async for frame in slot.track(open_chat_stream(user_input)):
+                for event in sse_to_events(frame):
+                    await send_event(stream_id, event)
+            await send_event(stream_id, {"type": "done"})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"WebSocket stream {stream_id} failed: {detail}")
+            try:
+                await send_event(stream_id, {"type": "error", "content": detail})
+            except Exception:
+                pass
+        finally:
+            if slot is not None:
+                slot.release()
+            streams.pop(stream_id, None)
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await send_event("", {"type": "error", "content": "Ongeldige JSON"})
+                continue
+            if not isinstance(message, dict):
+                await send_event("", {"type": "error", "content": "Bericht moet een JSON object zijn"})
+                continue
+
+            msg_type = message.get("type", "chat")
+            stream_id = str(message.get("stream_id") or "")
+
+            if msg_type == "ping":
+                await send_event(stream_id, {"type": "pong"})
+                continue
+
+            if msg_type == "cancel":
+                task = streams.get(stream_id)
+                if task:
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+                await send_event(stream_id, {"type": "cancelled"})
+                continue
+
+            if msg_type != "chat":
+                await send_event(stream_id, {"type": "error", "content": f"Onbekend berichttype: {msg_type}"})
+                continue
+            if not stream_id or stream_id in streams:
+                await send_event(stream_id, {"type": "error", "content": "stream_id ontbreekt of is al actief"})
+                continue
+            if len(streams) >= WS_MAX_STREAMS_PER_CONNECTION:
+                await send_event(stream_id, {"type": "error", "content": "Te veel gelijktijdige gesprekken op deze verbinding"})
+                continue
+            if not limiter.is_allowed(client_ip):
+                logger.warning(f"Rate limit exceeded for IP: {client_ip}")
+                await send_event(stream_id, {"type": "error", "content": "Te veel verzoeken. Probeer het over een minuutje weer."})
+                continue
+
+            try:
+                user_input = UserInput(**{k: v for k, v in message.items() if k not in ("type", "stream_id")})
+            except ValidationError as ve:
+                await send_event(stream_id, {"type": "error", "content": str(ve)})
+                continue
+
+            streams[stream_id] = asyncio.create_task(run_stream(stream_id, user_input))
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket disconnected with {len(streams)} active streams")
+    finally:
+        for task in list(streams.values()):
+            task.cancel()
+
+# ---- Non-streaming completion ----
+async def collect_chat_completion(user_input: UserInput) -> Dict[str, Any]:
+    """
+    Draait een chat request volledig en verzamelt het antwoord.
+
+    Gebruikt dezelfde pipeline als de streaming endpoints (cache, watermark
+    filter, provider fallback) en houdt latency en provider metadata bij.
+
+    Returns:
+        dict: content, model, personality, provider, upstream, cached, ttft,
+              latency, finish_reason ("stop", "timeout" of "error") en error
+              (None bij succes)
+    """
+    start = time.perf_counter()
+    result: Dict[str, Any] = {
+        "content": "",
+        "model": None,
+        "personality": None,
+        "provider": None,
+        "upstream": None,
+        "cached": False,
+        "ttft": None,
+        "error": None,
+        "finish_reason": "stop"
+    }
+    parts = []
+    async for frame in open_chat_stream(user_input):
+        for event in sse_to_events(frame):
+            event_type = event.get("type")
+            if event_type == "metadata":
+                result["model"] = event.get("model")
+                result["personality"] = event.get("personality")
+                result["cached"] = event.get("cached", False)
+            elif event_type == "provider":
+                result["provider"] = event.get("provider")
+                result["upstream"] = event.get("upstream")
+            elif event_type == "chunk":
+                if result["ttft"] is None:
+                    result["ttft"] = time.perf_counter() - start
+                parts.append(event.get("content", ""))
+            elif event_type == "error":
+                result["error"] = event.get("content")
+                result["finish_reason"] = "error"
+            elif event_type == "timeout":
+                result["error"] = event.get("content")
+                result["finish_reason"] = "timeout"
+                if event.get("continuation_token"):
+                    result["continuation_token"] = event["continuation_token"]
+    result["content"] = "".join(parts)
+    result["latency"] = time.perf_counter() - start
+    return result
+
+async def json_completion_response(user_input: UserInput, request: Request) -> Response:
+    """
+    Non-streaming modus (stream=false): één JSON body met het volledige antwoord.
+
+    De body wordt gzip/deflate gecomprimeerd als de client dat via
+    Accept-Encoding aangeeft.
+    """
+    result = await collect_chat_completion(user_input)
+    result["content"] = final_clean_text(result["content"])
+
+    if result["finish_reason"] == "error":
+        status_code = 502
+        body = create_error_response(
+            error_code="PROVIDER_FAILURE",
+            message="AI provider is temporarily unavailable",
+            details=result["error"],
+            retry_after=60
+        )
+    else:
+        status_code = 200
+        body = {"type": "completion", "session_id": user_input.session_id, **result}
+
+    payload = json.dumps(body).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding and len(payload) >= MIN_COMPRESS_SIZE:
+        payload = compress_body(payload, encoding)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=payload, status_code=status_code, media_type="application/json", headers=headers)
+
+# ---- Batch chat endpoint ----
+# Voor offline jobs (test suites, content generatie) die veel losse prompts sturen.
+class BatchInput(BaseModel):
+    items: List[UserInput]
+    concurrency: Optional[int] = None # Mag de server limiet alleen verlagen
+
+@app.post("/api/chatbot/batch")
+async def chatbot_batch(batch: BatchInput, request: Request):
+    # Een batch telt als één request voor de rate limiter, de grootte is begrensd
+    client_ip = request.client.host
+    if not limiter.is_allowed(client_ip):
+        logger.warning(f"Rate limit exceeded for IP: {client_ip}")
+        raise HTTPException(status_code=429, detail="Te veel verzoeken. Probeer het over een minuutje weer.")
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch bevat geen items.")
+    if len(batch.items) > Config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Maximaal {Config.BATCH_MAX_ITEMS} items per batch.")
+
+    # Niet meer tegelijk dan de per-user limiet, anders weigert de batch zijn eigen items
+    concurrency = max(1, min(batch.concurrency or Config.BATCH_CONCURRENCY, Config.BATCH_CONCURRENCY, admission.max_per_user))
+    semaphore = asyncio.Semaphore(concurrency)
+    logger.info(f"Batch of {len(batch.items)} items started with concurrency {concurrency}")
+
+    async def run_item(index: int, item: UserInput) -> Dict[str, Any]:
+        queued_at = time.perf_counter()
+        async with semaphore:
+            queue_wait = time.perf_counter() - queued_at
+            # Elk item gaat door dezelfde admission als een los chat request
+            user_key, weight, group = admission_identity(item, request)
+            slot = None
+            try:
+                slot = await admission.admit(user_key, weight, group)
+                result = await collect_chat_completion(item)
+            except Overloaded as e:
+                rejection = admission_rejection(e)
+                result = {"content": "", "error": rejection.detail, "status_code": rejection.status_code, "retry_after": e.retry_after}
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Batch item {index} failed: {detail}")
+                result = {"content": "", "error": detail}
+            finally:
+                if slot is not None:
+                    slot.release()
+        result["status"] = "error" if result.get("error") else "ok"
+        return {"index": index, "queue_wait": queue_wait, **result}
+
+    async def generate_results():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(batch.items)]
+        try:
+            # NDJSON in volgorde van voltooiing, "index" verwijst naar de positie in de batch
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
 
 # ---- Optional chat history endpoint ----
 chat_history = []
@@ -925,8 +1783,7 @@ async def system_status():
         "sys_path": sys.path[:5] # Eerste paar paden voor debug
     }
 
-@app.get("/api/admin/stats")
-async def get_admin_stats(request: Request):
+def require_admin(request: Request):
     # Slimme beveiliging: check X-Admin-Token header
     admin_token = request.headers.get("X-Admin-Token")
     
@@ -934,13 +1791,147 @@ async def get_admin_stats(request: Request):
         # Check ook nog even localhost als backup
         if request.client.host not in ["127.0.0.1", "localhost", "::1"]:
             raise HTTPException(status_code=403, detail="Unauthorized")
+
+@app.get("/api/admin/stats")
+async def get_admin_stats(request: Request):
+    require_admin(request)
     
     return {
         "uptime": time.time() - analytics.stats["start_time"],
         "stats": analytics.stats,
-        "cache_size": len(chat_cache.cache)
+        "recent": {window: analytics.query(window)["summary"] for window in ("5m", "1h", "24h")},
+        "cache_size": len(chat_cache.cache),
+        "model_router": model_router.get_status(),
+        "providers": provider_health.get_provider_status(),
+        "retries": retry_budget.get_stats(),
+        "admission": admission.get_stats(),
+        "memory": process_memory()
     }
 
+@app.get("/api/admin/stats/timeseries")
+async def get_admin_timeseries(request: Request, window: str = "1h"):
+    require_admin(request)
+    try:
+        return analytics.query(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/stats/snapshot")
+async def get_admin_snapshot(request: Request):
+    require_admin(request)
+    return Response(content=analytics.timeseries.snapshot(), media_type="application/octet-stream")
+
+# ---- Profiler (admin, standaard uit) ----
+profiler = SamplingProfiler(max_duration=Config.PROFILER_MAX_DURATION)
+
+@app.post("/api/admin/profile")
+async def profile_worker(request: Request, seconds: float = 10.0, requests: Optional[int] = None, interval_ms: float = 5.0):
+    """
+    Sampled de Python stacks van deze worker gedurende `seconds` seconden (of tot
+    `requests` chat requests klaar zijn) en geeft collapsed stacks terug voor een flamegraph.
+    """
+    require_admin(request)
+    if not Config.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is uitgeschakeld (DUB5_PROFILER_ENABLED=1)")
+    if seconds <= 0 or interval_ms <= 0 or (requests is not None and requests <= 0):
+        raise HTTPException(status_code=400, detail="seconds, requests en interval_ms moeten positief zijn")
+    try:
+        collapsed = await profiler.profile(seconds, interval_ms / 1000, requests)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    stats = profiler.get_stats()
+    return Response(
+        content=collapsed,
+        media_type="text/plain",
+        headers={
+            "X-Profile-Samples": str(stats["samples"]),
+            "X-Profile-Duration": str(stats["elapsed_s"]),
+            "X-Profile-Overhead": str(stats["overhead"])
+        }
+    )
+
+# ---- Geheugen (admin): tracemalloc snapshots en groottes van in-process structuren ----
+memory_inspector = MemoryInspector()
+memory_inspector.register("chat_cache", lambda: chat_cache.cache)
+memory_inspector.register("rate_limiter_clients", lambda: limiter.clients)
+memory_inspector.register("chat_history", lambda: chat_history)
+memory_inspector.register("stream_hub", lambda: stream_hub.broadcasts)
+memory_inspector.register("history_summaries", lambda: history_summarizer.sessions)
+memory_inspector.register("history_pending", lambda: history_summarizer.pending)
+memory_inspector.register("token_ledger", lambda: token_ledger.sessions)
+memory_inspector.register("admission_users", lambda: admission.user_load)
+memory_inspector.register("g4f_provider_performance", lambda: g4f_provider_performance)
+memory_inspector.register("trace_buffer", lambda: trace_exporter.recent)
+memory_inspector.register("analytics", lambda: analytics.stats)
+if hasattr(continuation_manager.store, "entries"):
+    memory_inspector.register("continuations", lambda: continuation_manager.store.entries)
+
+@app.get("/api/admin/memory")
+async def get_memory_report(request: Request, types: bool = False):
+    """RSS, tracemalloc status en groottes van bekende structuren (types=true: ook aantallen per type)."""
+    require_admin(request)
+    # Heap walks in een thread, zodat de event loop streams blijft bedienen
+    report = await asyncio.to_thread(memory_inspector.get_stats)
+    if types:
+        report["types"] = await asyncio.to_thread(memory_inspector.type_counts)
+    return report
+
+@app.post("/api/admin/memory/tracemalloc/start")
+async def start_tracemalloc(request: Request, frames: int = 10):
+    require_admin(request)
+    memory_inspector.start(frames)
+    return memory_inspector.get_stats()["tracemalloc"]
+
+@app.post("/api/admin/memory/tracemalloc/stop")
+async def stop_tracemalloc(request: Request):
+    require_admin(request)
+    memory_inspector.stop()
+    return memory_inspector.get_stats()["tracemalloc"]
+
+@app.post("/api/admin/memory/snapshots/{name}")
+async def take_memory_snapshot(request: Request, name: str, limit: int = 20, group_by: str = "lineno"):
+    require_admin(request)
+    try:
+        await asyncio.to_thread(memory_inspector.take_snapshot, name)
+        return await asyncio.to_thread(memory_inspector.top, name, limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/memory/snapshots/{name}")
+async def get_memory_snapshot(request: Request, name: str, limit: int = 20, group_by: str = "lineno"):
+    require_admin(request)
+    try:
+        return await asyncio.to_thread(memory_inspector.top, name, limit, group_by)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Snapshot {name} bestaat niet")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/memory/diff")
+async def diff_memory_snapshots(request: Request, base: str, target: str, limit: int = 20, group_by: str = "lineno"):
+    """Allocatieplekken die het meest gegroeid zijn tussen twee snapshots."""
+    require_admin(request)
+    try:
+        return await asyncio.to_thread(memory_inspector.diff, base, target, limit, group_by)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/traces")
+async def get_admin_traces(request: Request):
+    # Steekproef van afgeronde chat traces als JSON lines (nieuwste onderaan)
+    require_admin(request)
+    return Response(content=trace_exporter.jsonl(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+@app.get("/api/metrics")
+async def get_metrics():
+    # Prometheus text format; scrapen is goedkoop (alleen tellers uitschrijven)
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 # ---- Run with Uvicorn if standalone ----
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,173 @@
+"""
+Complexity Classifier Module
+
+This module estimates how demanding a prompt is, so requests with model
+"auto" get a matching thinking mode (and thereby model tier) without an extra
+upstream call. It is a small linear model over hashed prompt features; the
+weights ship as a data file trained by scripts/train_complexity_classifier.py.
+
+Key features:
+- Signed feature hashing of words, word bigrams and prompt shape
+- Multiclass linear model with softmax confidence
+- Deterministic hashing (crc32), independent of PYTHONHASHSEED
+- Only the start of very long prompts is scanned (bounded cost per request)
+- Falls back to the default thinking mode if the model file is missing
+"""
+
+import json
+import logging
+import math
+import re
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+from api.thinking_modes import DEFAULT_THINKING_MODE
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path(__file__).parent.parent / "data" / "complexity_model.json"
+
+# Model tier implied by each thinking mode (the router applies the mode's SLO)
+MODE_TIERS = {
+    "concise": "fast",
+    "balanced": "standard",
+    "reason": "strong",
+    "deep": "strong",
+}
+
+WORD_PATTERN = re.compile(r"[^\W\d_]+|\d+", re.UNICODE)
+CODE_PATTERN = re.compile(r"```|def |function |class |import |=>|;\s*$|\{\s*$|</?\w+>", re.MULTILINE)
+MATH_PATTERN = re.compile(r"\d\s*[-+*/^=]\s*\d|\b(?:integral|derivative|equation|vergelijking|bewijs|prove)\b", re.IGNORECASE)
+
+
+def _bucket(value: int) -> int:
+    return value.bit_length()
+
+
+def extract_features(text: str, max_chars: int = 600) -> List[str]:
+    """
+    Returns the feature strings of a prompt (before hashing).
+    """
+    head = text[:max_chars]
+    words = WORD_PATTERN.findall(head.lower())
+    features = [f"w:{w}" for w in set(words)]
+    features.extend(f"b:{a}_{b}" for a, b in set(zip(words, words[1:])))
+    features.append(f"len:{_bucket(len(text))}")
+    features.append(f"words:{_bucket(len(words))}")
+    features.append(f"lines:{_bucket(text.count(chr(10)))}")
+    features.append(f"q:{min(head.count('?'), 3)}")
+    if CODE_PATTERN.search(head):
+        features.append("shape:code")
+    if MATH_PATTERN.search(head):
+        features.append("shape:math")
+    return features
+
+
+def hash_features(features: List[str], dim: int) -> Dict[int, float]:
+    """Signed feature hashing into a sparse vector of size dim."""
+    vector: Dict[int, float] = {}
+    for feature in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        index = h % dim
+        vector[index] = vector.get(index, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+    return vector
+
+
+@dataclass
+class ComplexityPrediction:
+    """
+    Classifier output for one prompt.
+
+    Attributes:
+        thinking_mode: Predicted thinking mode
+        tier: Model tier implied by the mode ("fast", "standard" or "strong")
+        confidence: Softmax probability of the predicted mode
+    """
+    thinking_mode: str
+    tier: str
+    confidence: float
+
+    def to_dict(self) -> Dict:
+        return {"thinking_mode": self.thinking_mode, "tier": self.tier, "confidence": round(self.confidence, 3)}
+
+
+class ComplexityClassifier:
+    """
+    Linear prompt-complexity classifier over hashed features.
+
+    Attributes:
+        classes: Thinking modes, in weight column order
+        dim: Hashing dimension
+        bias: Bias per class
+        weights: Feature index -> weight per class (sparse)
+        min_confidence: Below this the default thinking mode is used
+    """
+
+    def __init__(
+        self,
+        classes: List[str],
+        dim: int,
+        bias: List[float],
+        weights: Dict[int, List[float]],
+        max_chars: int = 600,
+        min_confidence: float = 0.45
+    ):
+        self.classes = classes
+        self.dim = dim
+        self.bias = bias
+        self.weights = weights
+        self.max_chars = max_chars
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def from_file(cls, path: Path = MODEL_PATH) -> "ComplexityClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        weights = {int(k): v for k, v in data["weights"].items()}
+        return cls(data["classes"], data["dim"], data["bias"], weights, data.get("max_chars", 600))
+
+    def scores(self, text: str) -> List[float]:
+        """Returns the raw class scores of a prompt."""
+        scores = list(self.bias)
+        n = len(scores)
+        for index, value in hash_features(extract_features(text, self.max_chars), self.dim).items():
+            row = self.weights.get(index)
+            if row is not None:
+                for c in range(n):
+                    scores[c] += value * row[c]
+        return scores
+
+    def predict(self, text: str) -> ComplexityPrediction:
+        """
+        Predicts the thinking mode for a prompt.
+        """
+        scores = self.scores(text or "")
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        best = scores.index(top)
+        confidence = exps[best] / sum(exps)
+        mode = self.classes[best]
+        if confidence < self.min_confidence:
+            mode = DEFAULT_THINKING_MODE
+        return ComplexityPrediction(thinking_mode=mode, tier=MODE_TIERS.get(mode, "standard"), confidence=confidence)
+
+
+class _DefaultClassifier:
+    """Used when no model file is available: always the default thinking mode."""
+
+    def predict(self, text: str) -> ComplexityPrediction:
+        return ComplexityPrediction(DEFAULT_THINKING_MODE, MODE_TIERS[DEFAULT_THINKING_MODE], 0.0)
+
+
+def load_classifier(path: Path = MODEL_PATH):
+    try:
+        return ComplexityClassifier.from_file(path)
+    except Exception as e:
+        logger.warning(f"Complexity model not available, using default thinking mode: {e}")
+        return _DefaultClassifier()
+
+
+# Global classifier (weights loaded once at import)
+complexity_classifier = load_classifier()
@@ -0,0 +1,168 @@
+"""
+Response Compression Module
+
+This module negotiates and applies HTTP response compression for the chat
+endpoints. Large code answers from the coder personality compress very well,
+so sending them gzip- or deflate-encoded cuts bytes on the wire.
+
+Key features:
+- Accept-Encoding negotiation with q-value support (gzip preferred)
+- One-shot compression of complete response bodies
+- Minimum size threshold so tiny bodies are not inflated by headers
+- Streaming compression of SSE responses, sync-flushed at coalesced frame
+  boundaries so every event (including heartbeats) reaches the client promptly
+"""
+
+import asyncio
+import gzip
+import zlib
+from typing import AsyncGenerator, Optional, Union
+
+
+# Encodings we can produce, in order of preference
+SUPPORTED_ENCODINGS = ("gzip", "deflate")
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 512
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks the response encoding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Raw Accept-Encoding header value (may be None)
+
+    Returns:
+        str: "gzip" or "deflate", or None for identity
+
+    Example:
+        >>> negotiate_encoding("deflate, gzip;q=0.5")
+        'deflate'
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    best = None
+    best_q = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_body(data: bytes, encoding: Optional[str]) -> bytes:
+    """
+    Compresses a complete response body with the negotiated encoding.
+
+    Args:
+        data: Uncompressed body
+        encoding: "gzip", "deflate" or None
+
+    Returns:
+        bytes: Encoded body (unchanged for None)
+    """
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if encoding == "deflate":
+        return zlib.compress(data, 6)
+    return data
+
+
+class StreamCompressor:
+    """
+    Incremental gzip/deflate compressor for streamed responses.
+
+    Every call to compress() ends with a Z_SYNC_FLUSH, so the bytes returned
+    so far can be fully decoded by the client without waiting for more data.
+    """
+
+    def __init__(self, encoding: str, level: int = 6):
+        wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+_STREAM_END = object()
+
+
+async def compress_sse_stream(
+    generator: AsyncGenerator,
+    encoding: str,
+    max_batch_bytes: int = 16384,
+    max_pending: int = 256
+) -> AsyncGenerator[bytes, None]:
+    """
+    Compresses an SSE stream, coalescing frames that are ready together.
+
+    The source generator is drained by a background task. Each time the
+    client side is ready to send, all frames already produced are joined and
+    compressed with a single sync flush. Bursts of small chunk events share
+    one flush, while a lone frame (such as a heartbeat) is flushed at once.
+
+    Args:
+        generator: Source async generator yielding SSE frames (str or bytes)
+        encoding: "gzip" or "deflate"
+        max_batch_bytes: Upper bound on uncompressed bytes per flush
+        max_pending: Frames buffered ahead of the client before backpressure
+
+    Yields:
+        bytes: Compressed data, decodable up to the last complete frame
+    """
+    compressor = StreamCompressor(encoding)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    async def pump():
+        try:
+            async for frame in generator:
+                await queue.put(frame)
+            await queue.put(_STREAM_END)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await generator.aclose()
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        finished = False
+        while not finished:
+            item = await queue.get()
+            batch = []
+            size = 0
+            while True:
+                if item is _STREAM_END:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                data = item.encode("utf-8") if isinstance(item, str) else item
+                batch.append(data)
+                size += len(data)
+                if size >= max_batch_bytes or queue.empty():
+                    break
+                item = queue.get_nowait()
+            if batch:
+                yield compressor.compress(b"".join(batch))
+        yield compressor.finish()
+    finally:
+        pump_task.cancel()
+
@@ -0,0 +1,279 @@
+"""
+Concurrency Limiter Module
+
+This module caps the number of concurrent upstream streams per provider.
+Requests beyond the cap wait in a fair queue: waiters are grouped per key
+(session or user) and slots are handed out round-robin over the keys, so one
+heavy user cannot starve the others. A request that waits longer than the
+queue timeout gets QueueTimeout, so the caller can fail over to another
+provider instead of queueing indefinitely.
+
+Limits can adapt to the provider (AIMD with a Vegas-style latency signal):
+every healthy completion raises the limit by increase/limit, while time to
+first token far above the recent baseline (a high percentile of the window,
+so normal latency variance does not count as queueing), or an overload error
+(429, 5xx, network), multiplies it down.
+
+Key features:
+- One limiter per provider, created on first use
+- Round-robin hand-off over waiting keys (FIFO within a key)
+- Slots are handed directly to the next waiter (no thundering herd)
+- Optional adaptive limit between min_limit and max_limit
+- Queue-wait percentiles, timeouts and peak queue depth per provider
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueTimeout(Exception):
+    """Raised when no upstream slot became free within the queue timeout."""
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class FairLimiter:
+    """
+    Async concurrency limiter with round-robin queuing per key.
+
+    Attributes:
+        name: Name used in logs and stats (the provider)
+        limit: Current limit (fractional when adaptive; capacity is its floor)
+        max_wait: Seconds a waiter may queue before QueueTimeout
+        active: Slots currently held
+        adaptive: Whether record_success/record_overload move the limit
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        max_wait: float = 3.0,
+        window: int = 200,
+        adaptive: bool = False,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        increase: float = 1.0,
+        latency_backoff: float = 0.9,
+        overload_backoff: float = 0.5,
+        tolerance: float = 2.0,
+        baseline_quantile: float = 0.9,
+        min_samples: int = 5,
+        decrease_interval: float = 1.0,
+        clock=time.monotonic
+    ):
+        self.name = name
+        self.limit = float(limit)
+        self.max_wait = max_wait
+        self.active = 0
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.latency_backoff = latency_backoff
+        self.overload_backoff = overload_backoff
+        self.tolerance = tolerance
+        self.baseline_quantile = baseline_quantile
+        self.min_samples = min_samples
+        self.decrease_interval = decrease_interval
+        self.clock = clock
+        self.ttfts: Deque[float] = deque(maxlen=window)
+        self.last_decrease = float("-inf")
+        self.decreases = 0
+        self.overloads = 0
+        # key -> FIFO of waiter futures; dict order is the round-robin order
+        self.waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.waits: Deque[float] = deque(maxlen=window)
+        self.granted = 0
+        self.timeouts = 0
+        self.peak_queue = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(1, int(self.limit))
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self.waiters.values())
+
+    def _grant_next(self) -> bool:
+        """Hands a slot to the first waiter of the next key in turn."""
+        while self.waiters:
+            key, queue = next(iter(self.waiters.items()))
+            future = queue.popleft()
+            # Key to the back of the rotation (or out if it has nobody left)
+            del self.waiters[key]
+            if queue:
+                self.waiters[key] = queue
+            if not future.done():
+                future.set_result(None)
+                return True
+        return False
+
+    async def acquire(self, key: str = "default", timeout: Optional[float] = None):
+        """
+        Waits for a slot.
+
+        Args:
+            key: Fairness key (session or user id)
+            timeout: Maximum queue time (defaults to max_wait)
+
+        Raises:
+            QueueTimeout: No slot became free in time
+        """
+        start = time.perf_counter()
+        if self.active < self.capacity and not self.waiters:
+            self.active += 1
+            self._record_wait(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, deque()).append(future)
+        self.peak_queue = max(self.peak_queue, self.queued)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout if timeout is not None else self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we gave up: pass it on
+                self.release()
+            else:
+                future.cancel()
+                self._discard(key, future)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timeouts += 1
+            waited = time.perf_counter() - start
+            logger.warning(f"Upstream queue timeout for {self.name} after {waited:.2f}s ({self.queued} waiting)")
+            raise QueueTimeout(f"{self.name} busy: no slot within {waited:.1f}s")
+        # The slot was counted as active when it was granted to us
+        self._record_wait(time.perf_counter() - start)
+
+    def release(self):
+        """Frees a slot and hands free capacity to waiters."""
+        self.active = max(0, self.active - 1)
+        self._drain()
+
+    def _drain(self):
+        while self.active < self.capacity and self._grant_next():
+            self.active += 1
+
+    def record_success(self, ttft: float):
+        """
+        Feeds a healthy completion with its time to first token.
+
+        Additive increase, unless the TTFT is more than tolerance × the
+        baseline_quantile of the recent TTFTs (queueing at the provider): then
+        multiplicative decrease. The TTFT should be measured from the upstream
+        call that succeeded, without queue time or retry backoff.
+        """
+        inflated = (
+            len(self.ttfts) >= self.min_samples
+            and ttft > _percentile(self.ttfts, self.baseline_quantile) * self.tolerance
+        )
+        self.ttfts.append(ttft)
+        if not self.adaptive:
+            return
+        if inflated:
+            self._decrease(self.latency_backoff, f"TTFT {ttft:.2f}s inflated")
+        else:
+            self.limit = min(float(self.max_limit), self.limit + self.increase / self.limit)
+            self._drain()
+
+    def record_overload(self):
+        """Feeds an overload signal (429, 5xx or network error)."""
+        self.overloads += 1
+        if self.adaptive:
+            self._decrease(self.overload_backoff, "overload error")
+
+    def _decrease(self, factor: float, reason: str):
+        # Concurrent requests see the same incident: decrease once per interval
+        now = self.clock()
+        if now - self.last_decrease < self.decrease_interval:
+            return
+        self.last_decrease = now
+        previous = self.capacity
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self.decreases += 1
+        if self.capacity != previous:
+            logger.info(f"Concurrency limit of {self.name} lowered to {self.capacity} ({reason})")
+
+    def _discard(self, key: str, future: asyncio.Future):
+        queue = self.waiters.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self.waiters[key]
+
+    def _record_wait(self, seconds: float):
+        self.granted += 1
+        self.waits.append(seconds)
+
+    def get_stats(self) -> Dict:
+        return {
+            "limit": self.capacity,
+            "limit_raw": round(self.limit, 2),
+            "adaptive": self.adaptive,
+            "decreases": self.decreases,
+            "overloads": self.overloads,
+            "ttft_min": round(min(self.ttfts), 4) if self.ttfts else None,
+            "ttft_baseline": round(_percentile(self.ttfts, self.baseline_quantile), 4) if self.ttfts else None,
+            "active": self.active,
+            "queued": self.queued,
+            "queued_keys": len(self.waiters),
+            "peak_queue": self.peak_queue,
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+            "wait_p50": round(_percentile(self.waits, 0.5), 4),
+            "wait_p95": round(_percentile(self.waits, 0.95), 4),
+        }
+
+
+class ProviderLimiters:
+    """
+    Registry of FairLimiters, one per upstream provider.
+
+    Attributes:
+        limits: Per-provider (initial) slot limits (others get default_limit)
+        default_limit: Limit for providers without an explicit entry
+        max_wait: Queue timeout before failing over
+        adaptive: Options for adaptive limits (e.g. {"max_limit": 32}), None for fixed limits
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 8,
+        max_wait: float = 3.0,
+        adaptive: Optional[Dict] = None
+    ):
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.max_wait = max_wait
+        self.adaptive = adaptive
+        self.limiters: Dict[str, FairLimiter] = {}
+
+    def get(self, provider: str) -> FairLimiter:
+        limiter = self.limiters.get(provider)
+        if limiter is None:
+            limit = self.limits.get(provider, self.default_limit)
+            options = {"adaptive": True, **self.adaptive} if self.adaptive is not None else {}
+            limiter = self.limiters[provider] = FairLimiter(provider, limit, self.max_wait, **options)
+        return limiter
+
+    def get_status(self) -> Dict[str, Dict]:
+        return {name: limiter.get_stats() for name, limiter in self.limiters.items()}
+
@@ -65,3 +65,36 @@ class Config:
     )
     VERCEL_ENV = os.environ.get("VERCEL")
     ADMIN_SECRET_KEY = os.environ.get("DUB5_ADMIN_KEY", "dub5_master_2026")
+    BATCH_CONCURRENCY = int(os.environ.get("DUB5_BATCH_CONCURRENCY", "4"))
+    BATCH_MAX_ITEMS = int(os.environ.get("DUB5_BATCH_MAX_ITEMS", "200"))
+    SSE_COMPRESSION = os.environ.get("DUB5_SSE_COMPRESSION", "1") != "0"
+    MAP_REDUCE_THRESHOLD = int(os.environ.get("DUB5_MAP_REDUCE_THRESHOLD", "15000"))
+    MAP_REDUCE_CONCURRENCY = int(os.environ.get("DUB5_MAP_REDUCE_CONCURRENCY", "4"))
+    MAP_REDUCE_CHUNK_TOKENS = int(os.environ.get("DUB5_MAP_REDUCE_CHUNK_TOKENS", "2000"))
+    MAP_REDUCE_DEADLINE = float(os.environ.get("DUB5_MAP_REDUCE_DEADLINE", "25"))
+    G4F_CONCURRENCY = int(os.environ.get("DUB5_G4F_CONCURRENCY", "8"))
+    POLLINATIONS_CONCURRENCY = int(os.environ.get("DUB5_POLLINATIONS_CONCURRENCY", "6"))
+    PROVIDER_QUEUE_TIMEOUT = float(os.environ.get("DUB5_PROVIDER_QUEUE_TIMEOUT", "3"))
+    ADAPTIVE_CONCURRENCY = os.environ.get("DUB5_ADAPTIVE_CONCURRENCY", "1") != "0"
+    PROVIDER_MAX_CONCURRENCY = int(os.environ.get("DUB5_PROVIDER_MAX_CONCURRENCY", "32"))
+    RETRY_DEADLINE = float(os.environ.get("DUB5_RETRY_DEADLINE", "10"))
+    ADMISSION_MAX_LAG_MS = float(os.environ.get("DUB5_ADMISSION_MAX_LAG_MS", "200"))
+    ADMISSION_MAX_INFLIGHT = int(os.environ.get("DUB5_ADMISSION_MAX_INFLIGHT", "64"))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("DUB5_ADMISSION_QUEUE_TIMEOUT", "1"))
+    ADMISSION_RETRY_AFTER = int(os.environ.get("DUB5_ADMISSION_RETRY_AFTER", "2"))
+    MAX_STREAMS_PER_USER = int(os.environ.get("DUB5_MAX_STREAMS_PER_USER", "4"))
+    # Gelijktijdige streams per IP voor sessies (session ids kiest de client zelf)
+    MAX_STREAMS_PER_IP = int(os.environ.get("DUB5_MAX_STREAMS_PER_IP", "16"))
+    # Bekende API keys met hun gewicht in de eerlijke wachtrij, bv. "key1:2,key2:0.5"
+    # (andere keys tellen niet als identiteit)
+    API_KEY_WEIGHTS = os.environ.get("DUB5_API_KEY_WEIGHTS", "")
+    # Binaire snapshot van de admin time series (leeg: niet bewaren), bv. /tmp/dub5_analytics.bin
+    ANALYTICS_SNAPSHOT_PATH = os.environ.get("DUB5_ANALYTICS_SNAPSHOT_PATH", "")
+    ANALYTICS_SNAPSHOT_INTERVAL = float(os.environ.get("DUB5_ANALYTICS_SNAPSHOT_INTERVAL", "60"))
+    # Server-Timing header en SSE timing event per chat request; een steekproef gaat naar JSON lines
+    SERVER_TIMING = os.environ.get("DUB5_SERVER_TIMING", "1") != "0"
+    TRACE_SAMPLE_RATE = float(os.environ.get("DUB5_TRACE_SAMPLE_RATE", "0.01"))
+    TRACE_EXPORT_PATH = os.environ.get("DUB5_TRACE_EXPORT_PATH", "")
+    # Profiler endpoint voor admins (standaard uit)
+    PROFILER_ENABLED = os.environ.get("DUB5_PROFILER_ENABLED", "0") == "1"
+    PROFILER_MAX_DURATION = float(os.environ.get("DUB5_PROFILER_MAX_DURATION", "60"))
@@ -1,16 +1,265 @@
 # api/context_manager.py
 
-def smart_context_manager(messages, model, max_tokens=4096):
+import logging
+from collections import OrderedDict
+
+from api.tokenizer import get_tokenizer, message_text, TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budget per model family (keeps upstream requests fast)
+CONTEXT_BUDGETS = {
+    "gpt-4": 8000,
+    "claude": 8000,
+}
+DEFAULT_CONTEXT_BUDGET = 4000
+
+# Markers used by chatbot_response when appending uploaded files to the input
+FILES_MARKER = "\n\nGEÜPLOADE BESTANDEN:\n"
+FILE_SECTION_MARKER = "\n\n--- INHOUD BESTAND: "
+TRUNCATION_NOTICE = "\n\n[... {omitted} tokens weggelaten ...]\n\n"
+
+# Budget reserved for the newest (user) message before the system prompt is trimmed
+MIN_NEWEST_TOKENS = 512
+
+
+class ContextOverflowError(ValueError):
+    """Raised when not even the newest message fits in the token budget."""
+
+
+def context_budget(model):
+    """
+    Returns the prompt token budget for a model.
+    """
+    for family, budget in CONTEXT_BUDGETS.items():
+        if family in (model or ""):
+            return budget
+    return DEFAULT_CONTEXT_BUDGET
+
+
+class TokenLedger:
+    """
+    Remembers the token count of every message per session, so a new turn
+    only tokenizes the messages that were not in the previous one.
+    """
+
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.reused = 0
+        self.counted = 0
+
+    def message_counts(self, messages, model, session_id=None, first_tokens=None):
+        """
+        Returns the token count (including per-message overhead) of each message.
+
+        first_tokens is the already known token count of the first message's
+        text (e.g. a precomputed system prompt); it is used instead of counting.
+        """
+        tokenizer = get_tokenizer(model)
+        key = (session_id, tokenizer.name) if session_id else None
+        previous = self.sessions.get(key, {}) if key else {}
+
+        known = {}
+        counts = []
+        for index, message in enumerate(messages):
+            text = message_text(message)
+            # Keyed by content instead of position, so inserted messages
+            # (e.g. a history summary) do not invalidate the rest
+            fingerprint = (message.get("role") if isinstance(message, dict) else None, len(text), hash(text))
+            count = previous.get(fingerprint)
+            if index == 0 and first_tokens is not None:
+                count = first_tokens + TOKENS_PER_MESSAGE
+                self.reused += 1
+            elif count is None:
+                count = tokenizer.count(text) + TOKENS_PER_MESSAGE
+                self.counted += 1
+            else:
+                self.reused += 1
+            known[fingerprint] = count
+            counts.append(count)
+
+        if key:
+            self.sessions[key] = known
+            self.sessions.move_to_end(key)
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return counts
+
+
+token_ledger = TokenLedger()
+
+
+def truncate_to_tokens(text, max_tokens, model=None):
+    """
+    Shortens text to about max_tokens, keeping the head and the tail
+    (beginnings and endings of documents carry the most context).
+    """
+    tokenizer = get_tokenizer(model)
+    total = tokenizer.count(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    keep = max_tokens
+    for _ in range(8):
+        keep_chars = max(1, int(len(text) * keep / total))
+        head = text[:keep_chars * 2 // 3]
+        tail = text[len(text) - keep_chars // 3:] if keep_chars // 3 else ""
+        candidate = head + TRUNCATION_NOTICE.format(omitted=total - keep) + tail
+        if tokenizer.count(candidate) <= max_tokens:
+            return candidate
+        keep = int(keep * 0.85)
+    return text[:max(1, max_tokens)]
+
+
+def truncate_file_context(content, max_tokens, model=None):
+    """
+    Fits a user message with uploaded files into max_tokens.
+
+    The question itself is kept intact; the remaining budget is shared fairly
+    between the files (small files stay whole, large ones are cut head+tail).
+    """
+    tokenizer = get_tokenizer(model)
+    if tokenizer.count(content) <= max_tokens:
+        return content
+    if FILES_MARKER not in content:
+        return truncate_to_tokens(content, max_tokens, model)
+
+    question, files_part = content.split(FILES_MARKER, 1)
+    sections = files_part.split(FILE_SECTION_MARKER)
+    preamble, files = sections[0], [FILE_SECTION_MARKER + s for s in sections[1:]]
+
+    remaining = max_tokens - tokenizer.count(question) - tokenizer.count(FILES_MARKER + preamble)
+    if remaining <= 0 or not files:
+        return truncate_to_tokens(content, max_tokens, model)
+
+    # Water-filling: files smaller than their fair share keep everything
+    sizes = [tokenizer.count(f) for f in files]
+    allocation = [0] * len(files)
+    pending = sorted(range(len(files)), key=lambda i: sizes[i])
+    budget = remaining
+    while pending:
+        share = budget // len(pending)
+        i = pending.pop(0)
+        allocation[i] = min(sizes[i], share)
+        budget -= allocation[i]
+
+    kept = [truncate_to_tokens(f, allocation[i], model) for i, f in enumerate(files)]
+    logger.info(f"Truncated {len(files)} uploaded files to fit {max_tokens} tokens")
+    return question + FILES_MARKER + preamble + "".join(kept)
+
+
+def trim_system_messages(system, counts, max_tokens, model=None):
+    """
+    Shrinks leading system messages to max_tokens, cutting the last one first
+    (the dynamic context is appended there). Messages left without budget
+    are dropped.
+
+    Returns:
+        tuple: (messages, token count of the returned messages)
+    """
+    tokenizer = get_tokenizer(model)
+    trimmed, counts = list(system), list(counts)
+    excess = sum(counts) - max(max_tokens, 0)
+    for i in reversed(range(len(trimmed))):
+        if excess <= 0:
+            break
+        content = trimmed[i].get("content")
+        limit = counts[i] - TOKENS_PER_MESSAGE - excess
+        if not isinstance(content, str) or limit <= 0:
+            excess -= counts[i]
+            trimmed[i] = None
+            continue
+        content = truncate_to_tokens(content, limit, model)
+        new_count = tokenizer.count(content) + TOKENS_PER_MESSAGE
+        excess -= counts[i] - new_count
+        trimmed[i], counts[i] = {**trimmed[i], "content": content}, new_count
+    logger.warning(f"System prompt trimmed to fit {max_tokens} tokens next to the newest message")
+    kept = [(m, c) for m, c in zip(trimmed, counts) if m is not None]
+    return [m for m, _ in kept], sum(c for _, c in kept)
+
+
+def smart_context_manager(messages, model, max_tokens=4096, session_id=None, system_tokens=None):
+    """
+    Packs messages into the token budget.
+
+    - Leading system messages are kept, but trimmed (last one first) when they
+      leave less than MIN_NEWEST_TOKENS for the newest message
+    - The newest message is always kept; oversize file contexts are truncated
+    - History is packed newest-first until the budget is used up
+    Per-message counts are memoized per session (see TokenLedger);
+    system_tokens is the known token count of the first (system) message's
+    text, so the precomputed prompt prefix is not tokenized again.
+
+    Returns:
+        tuple: (messages, token count of the returned messages)
+
+    Raises:
+        ContextOverflowError: When the budget cannot hold any of the newest message
+    """
+    if not messages:
+        return messages, 0
+
+    counts = token_ledger.message_counts(messages, model, session_id, first_tokens=system_tokens)
+
+    n_system = 0
+    while n_system < len(messages) and isinstance(messages[n_system], dict) and messages[n_system].get("role") == "system":
+        n_system += 1
+    system, system_tokens = messages[:n_system], sum(counts[:n_system])
+    rest, rest_counts = messages[n_system:], counts[n_system:]
+
+    budget = max_tokens - system_tokens - TOKENS_PER_REPLY
+    if not rest:
+        return messages, system_tokens + TOKENS_PER_REPLY
+
+    newest, newest_tokens = rest[-1], rest_counts[-1]
+    reserve = min(newest_tokens, MIN_NEWEST_TOKENS)
+    if budget < reserve:
+        # System prompt + dynamic context (RAG, files, custom prompt) leave no room for the question
+        system, system_tokens = trim_system_messages(system, counts[:n_system], max_tokens - TOKENS_PER_REPLY - reserve, model)
+        budget = max_tokens - system_tokens - TOKENS_PER_REPLY
+    if budget <= TOKENS_PER_MESSAGE:
+        raise ContextOverflowError(f"Token budget of {max_tokens} leaves no room for the message")
+    if newest_tokens > budget and isinstance(newest.get("content"), str):
+        content = truncate_file_context(newest["content"], max(budget - TOKENS_PER_MESSAGE, 0), model)
+        if newest["content"].strip() and not content.strip():
+            raise ContextOverflowError(f"Token budget of {max_tokens} leaves no room for the message")
+        newest = {**newest, "content": content}
+        newest_tokens = get_tokenizer(model).count(content) + TOKENS_PER_MESSAGE
+    budget -= newest_tokens
+
+    kept = []
+    for message, tokens in zip(reversed(rest[:-1]), reversed(rest_counts[:-1])):
+        if tokens > budget:
+            break
+        kept.append(message)
+        budget -= tokens
+    kept.reverse()
+
+    dropped = len(rest) - 1 - len(kept)
+    if dropped:
+        logger.info(f"Context management dropped {dropped} old messages to fit {max_tokens} tokens")
+
+    kept_tokens = sum(rest_counts[len(rest) - 1 - len(kept):-1])
+    total = system_tokens + kept_tokens + newest_tokens + TOKENS_PER_REPLY
+    return system + kept + [newest], total
+
+
+def count_tokens(text, model=None):
     """
-    Placeholder for a smart context manager.
-    In a real implementation, this would intelligently trim messages
-    to fit within the model's context window.
+    Counts tokens with the BPE tokenizer for the given model.
+    Results are memoized per text, so re-counting history is cheap.
     """
-    return messages, 0 # Return messages and a dummy token count
+    return get_tokenizer(model).count(text)
 
-def count_tokens(text):
+def count_messages_tokens(messages, model=None):
     """
-    Placeholder for a token counting function.
-    In a real implementation, this would use a tokenizer specific to the model.
+    Counts the tokens of a whole message list in one pass, including the
+    chat formatting overhead per message and for the reply.
     """
-    return len(text.split()) # Simple word count as a placeholder
\ No newline at end of file
+    if not messages:
+        return 0
+    counts = get_tokenizer(model).count_batch(message_text(m) for m in messages)
+    return sum(counts) + TOKENS_PER_MESSAGE * len(messages) + TOKENS_PER_REPLY
@@ -0,0 +1,212 @@
+"""
+Continuation Management Module
+
+This module lets long generations survive Vercel's 60-second serverless cap
+by checkpointing a partial response shortly before the stream deadline and
+resuming it in a follow-up invocation.
+
+Key features:
+- Pluggable checkpoint stores (cache directory on disk or in-memory)
+- Opaque continuation tokens bound to the originating session
+- Server-side "continue" prompt so the client never re-uploads history
+- Automatic expiry of stale checkpoints
+"""
+
+import json
+import logging
+import os
+import secrets
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+from api.environment import Environment
+
+logger = logging.getLogger(__name__)
+
+
+# Mirrors the instruction in Config.DUB5_SYSTEM_PROMPT so the model resumes
+# from the last character without any preamble.
+CONTINUE_PROMPT = "Continue EXACTLY where you left off"
+
+
+@dataclass
+class ContinuationState:
+    """
+    Persisted state of a generation that was interrupted by the deadline.
+
+    Attributes:
+        token: Opaque continuation token handed to the client
+        session_id: Session that created the checkpoint
+        messages: Conversation sent upstream, without the partial answer
+        partial_response: Assistant text generated so far (all segments)
+        model: Model used for the generation
+        personality: Personality used for the generation
+        segments: Number of invocations that contributed to the response
+        created_at: Unix timestamp of the checkpoint
+    """
+    token: str
+    session_id: str
+    messages: List[Dict[str, str]]
+    partial_response: str
+    model: str
+    personality: str
+    segments: int = 1
+    created_at: float = field(default_factory=time.time)
+
+
+class MemoryContinuationStore:
+    """
+    In-process checkpoint store.
+
+    Only useful when the follow-up call lands on the same warm worker, e.g.
+    during local development or in tests.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, dict] = {}
+
+    def save(self, token: str, data: dict) -> None:
+        self.entries[token] = data
+
+    def load(self, token: str) -> Optional[dict]:
+        return self.entries.get(token)
+
+    def delete(self, token: str) -> None:
+        self.entries.pop(token, None)
+
+
+class FileContinuationStore:
+    """
+    Checkpoint store backed by JSON files in the cache directory.
+
+    On Vercel this is /tmp, which is shared by invocations served from the
+    same warm instance.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(Environment.get_cache_dir(), "continuations")
+
+    def _path(self, token: str) -> str:
+        return os.path.join(self.directory, f"{token}.json")
+
+    def save(self, token: str, data: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(token) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(token))
+
+    def load(self, token: str) -> Optional[dict]:
+        try:
+            with open(self._path(token), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, token: str) -> None:
+        try:
+            os.remove(self._path(token))
+        except OSError:
+            pass
+
+
+class ContinuationManager:
+    """
+    Creates and resumes generation checkpoints.
+
+    Attributes:
+        store: Backend implementing save/load/delete of checkpoint dicts
+        ttl: Seconds a checkpoint stays resumable
+    """
+
+    def __init__(self, store=None, ttl: int = 900):
+        self.store = store if store is not None else FileContinuationStore()
+        self.ttl = ttl
+
+    def checkpoint(
+        self,
+        messages: List[Dict[str, str]],
+        partial_response: str,
+        model: str,
+        personality: str,
+        session_id: str,
+        previous: Optional[ContinuationState] = None
+    ) -> Optional[ContinuationState]:
+        """
+        Persists a partial response and returns its continuation state.
+
+        When resuming an earlier checkpoint, pass it as ``previous`` so the
+        original conversation is kept and the partial answers are joined.
+
+        Returns:
+            ContinuationState, or None if nothing could be persisted
+        """
+        if previous is not None:
+            messages = previous.messages
+            partial_response = previous.partial_response + partial_response
+            segments = previous.segments + 1
+        else:
+            segments = 1
+
+        if not partial_response:
+            return None
+
+        state = ContinuationState(
+            token=secrets.token_urlsafe(24),
+            session_id=session_id,
+            messages=messages,
+            partial_response=partial_response,
+            model=model,
+            personality=personality,
+            segments=segments
+        )
+        try:
+            self.store.save(state.token, asdict(state))
+        except Exception as e:
+            logger.error(f"Failed to persist continuation checkpoint: {e}")
+            return None
+
+        logger.info(
+            f"Checkpointed {len(partial_response)} chars for session_id: {session_id} "
+            f"(segment {segments})"
+        )
+        return state
+
+    def resume(self, token: str, session_id: str) -> Optional[ContinuationState]:
+        """
+        Loads and consumes a checkpoint.
+
+        Returns None if the token is unknown, expired or belongs to another
+        session. A token can only be resumed once; a foreign session cannot
+        consume it (it stays valid for its owner).
+        """
+        data = self.store.load(token)
+        if not data:
+            return None
+
+        state = ContinuationState(**data)
+        if state.session_id != session_id:
+            logger.warning(f"Continuation token used by foreign session_id: {session_id}")
+            return None
+        self.store.delete(token)
+        if time.time() - state.created_at > self.ttl:
+            logger.info(f"Continuation token expired for session_id: {session_id}")
+            return None
+        return state
+
+
+def build_resume_messages(state: ContinuationState) -> List[Dict[str, str]]:
+    """
+    Builds the upstream conversation for resuming a checkpoint.
+
+    The original conversation is followed by the partial assistant answer and
+    the server-side continue instruction.
+    """
+    return state.messages + [
+        {"role": "assistant", "content": state.partial_response},
+        {"role": "user", "content": CONTINUE_PROMPT}
+    ]
+
+
+continuation_manager = ContinuationManager()
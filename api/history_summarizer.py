@@ -0,0 +1,282 @@
+"""
+History Summarizer Module
+
+This module keeps long conversations useful after their oldest messages fall
+out of the token window. Messages dropped by smart_context_manager are folded
+into a per-session rolling summary that is generated in the background once a
+response stream has finished, so no request ever waits for it.
+
+Key features:
+- Summaries keyed by a hash of the dropped history prefix
+- Rolling updates: a new summary extends the previous one instead of
+  re-reading the whole history
+- Zero-latency reuse on later turns (cached summary is inserted as a
+  system message right after the system prompt)
+- One background generation per session at a time, bounded session and
+  pending-turn caches
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api.context_manager import smart_context_manager, truncate_to_tokens
+from api.tokenizer import message_text
+
+logger = logging.getLogger(__name__)
+
+
+SUMMARY_PREFIX = "Samenvatting van het eerdere gesprek (oudere berichten vallen buiten het contextvenster):\n"
+
+SUMMARY_PROMPT = (
+    "Vat het onderstaande gesprek beknopt samen voor een assistent die het gesprek voortzet. "
+    "Behoud namen, feiten, beslissingen, voorkeuren van de gebruiker en open vragen. "
+    "Schrijf in de taal van het gesprek en gebruik hooguit 200 woorden."
+)
+
+
+@dataclass
+class HistorySummary:
+    """
+    Summary of the first `covered` messages after the system prompt.
+
+    Attributes:
+        covered: Number of history messages the summary describes
+        prefix_hash: Hash of exactly those messages
+        text: Summary text
+    """
+    covered: int
+    prefix_hash: str
+    text: str
+
+
+def prefix_hashes(messages: List[Dict[str, str]]) -> List[str]:
+    """
+    Returns the running hash after every message (index i covers messages[:i + 1]).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    hashes = []
+    for message in messages:
+        digest.update(str(message.get("role", "")).encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(message_text(message).encode("utf-8", "surrogatepass"))
+        digest.update(b"\x01")
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def summary_message(summary: HistorySummary) -> Dict[str, str]:
+    return {"role": "system", "content": SUMMARY_PREFIX + summary.text}
+
+
+class HistorySummarizer:
+    """
+    Per-session cache and background generator of history summaries.
+
+    Attributes:
+        max_sessions: Maximum number of sessions kept (LRU)
+        max_entries: Summaries kept per session (edited histories branch off)
+        max_summary_tokens: Upper bound on the size of a stored summary
+        max_input_tokens: Upper bound on the transcript sent to the summarizer
+        min_new_messages: Dropped messages needed before a summary is extended
+        timeout: Seconds a background summary may take
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 500,
+        max_entries: int = 4,
+        max_summary_tokens: int = 400,
+        max_input_tokens: int = 6000,
+        min_new_messages: int = 2,
+        timeout: float = 45.0
+    ):
+        self.max_sessions = max_sessions
+        self.max_entries = max_entries
+        self.max_summary_tokens = max_summary_tokens
+        self.max_input_tokens = max_input_tokens
+        self.min_new_messages = min_new_messages
+        self.timeout = timeout
+        self.sessions: "OrderedDict[str, List[HistorySummary]]" = OrderedDict()
+        self.pending: "OrderedDict[str, Tuple[List[Dict[str, str]], str]]" = OrderedDict()
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+
+    def lookup(self, session_id: str, dropped: List[Dict[str, str]]) -> Optional[HistorySummary]:
+        """
+        Returns the cached summary covering the longest prefix of the dropped messages.
+        """
+        entries = self.sessions.get(session_id)
+        if not entries or not dropped:
+            return None
+        hashes = prefix_hashes(dropped)
+        best = None
+        for entry in entries:
+            if entry.covered <= len(hashes) and hashes[entry.covered - 1] == entry.prefix_hash:
+                if best is None or entry.covered > best.covered:
+                    best = entry
+        if best is not None:
+            self.sessions.move_to_end(session_id)
+        return best
+
+    def apply(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        session_id: Optional[str] = None,
+        system_tokens: Optional[int] = None
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Packs messages into the budget and replaces dropped history by its cached summary.
+
+        The dropped messages are remembered so refresh() can extend the summary
+        once the response for this turn has been streamed.
+
+        Args:
+            system_tokens: Known token count of the system prompt (see smart_context_manager)
+
+        Returns:
+            tuple: (messages, token count), as smart_context_manager
+        """
+        packed, tokens = smart_context_manager(
+            messages, model, max_tokens=max_tokens, session_id=session_id, system_tokens=system_tokens
+        )
+        if not session_id or session_id == "default":
+            return packed, tokens
+
+        n_system = 0
+        while n_system < len(messages) and messages[n_system].get("role") == "system":
+            n_system += 1
+        # System messages can be dropped when the prompt was trimmed, so count
+        # the ones that are actually left in packed
+        kept_system = 0
+        while kept_system < min(n_system, len(packed)) and packed[kept_system].get("role") == "system":
+            kept_system += 1
+        dropped = messages[n_system:len(messages) - (len(packed) - kept_system)]
+        if not dropped:
+            self.pending.pop(session_id, None)
+            return packed, tokens
+
+        self.pending[session_id] = (dropped, model)
+        self.pending.move_to_end(session_id)
+        while len(self.pending) > self.max_sessions:
+            self.pending.popitem(last=False)
+        summary = self.lookup(session_id, dropped)
+        if summary is None:
+            self.misses += 1
+            return packed, tokens
+
+        self.hits += 1
+        with_summary = messages[:n_system] + [summary_message(summary)] + messages[n_system + summary.covered:]
+        return smart_context_manager(
+            with_summary, model, max_tokens=max_tokens, session_id=session_id, system_tokens=system_tokens
+        )
+
+    def refresh(
+        self,
+        session_id: str,
+        summarize: Callable[[List[Dict[str, str]], str], Awaitable[str]]
+    ) -> Optional[asyncio.Task]:
+        """
+        Starts a background summary of the history dropped in this session's last turn.
+
+        Args:
+            session_id: Session whose turn just finished
+            summarize: Async function (messages, model) -> summary text
+
+        Returns:
+            The background task, or None if nothing needs to be summarized
+        """
+        pending = self.pending.pop(session_id, None)
+        if pending is None:
+            return None
+        running = self.tasks.get(session_id)
+        if running is not None and not running.done():
+            return None
+
+        dropped, model = pending
+        previous = self.lookup(session_id, dropped)
+        covered = previous.covered if previous else 0
+        if len(dropped) - covered < self.min_new_messages:
+            return None
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        task = loop.create_task(self._generate(session_id, dropped, model, previous, summarize))
+        self.tasks[session_id] = task
+        task.add_done_callback(lambda t: self.tasks.pop(session_id, None) if self.tasks.get(session_id) is t else None)
+        return task
+
+    def discard(self, session_id: str):
+        """Forgets the dropped history of a turn that produced no response."""
+        self.pending.pop(session_id, None)
+
+    def build_transcript(self, new_messages: List[Dict[str, str]], previous: Optional[HistorySummary], model: str) -> str:
+        lines = []
+        if previous is not None:
+            lines.append(f"Eerdere samenvatting:\n{previous.text}\n")
+        for message in new_messages:
+            lines.append(f"{message.get('role', 'user')}: {message_text(message)}")
+        return truncate_to_tokens("\n".join(lines), self.max_input_tokens, model)
+
+    async def _generate(self, session_id, dropped, model, previous, summarize):
+        covered = previous.covered if previous else 0
+        transcript = self.build_transcript(dropped[covered:], previous, model)
+        prompt = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ]
+        try:
+            text = await asyncio.wait_for(summarize(prompt, model), timeout=self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"History summary failed for session_id: {session_id}: {e}")
+            return None
+
+        text = (text or "").strip()
+        if not text:
+            self.failures += 1
+            return None
+        summary = HistorySummary(
+            covered=len(dropped),
+            prefix_hash=prefix_hashes(dropped)[-1],
+            text=truncate_to_tokens(text, self.max_summary_tokens, model)
+        )
+        self.store(session_id, summary)
+        self.generated += 1
+        logger.info(f"History summary for session_id: {session_id} now covers {summary.covered} messages")
+        return summary
+
+    def store(self, session_id: str, summary: HistorySummary):
+        entries = [e for e in self.sessions.get(session_id, []) if e.prefix_hash != summary.prefix_hash]
+        entries.append(summary)
+        self.sessions[session_id] = entries[-self.max_entries:]
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "pending": len(self.pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "failures": self.failures,
+            "running": sum(1 for t in self.tasks.values() if not t.done()),
+        }
+
+
+# Global history summarizer instance
+history_summarizer = HistorySummarizer()
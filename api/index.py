@@ -11,6 +11,8 @@ from fastapi.responses import StreamingResponse, HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
+from api.personalities import get_personality
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -65,14 +67,8 @@ async def chatbot_endpoint(request: Request):
         personality = data.get("personality", "general")
         model = data.get("model", "openai")
         
-        # Create system message based on personality
-        if personality == "coder":
-            system_message = """You are DUB5, an AI editor that creates and modifies web applications. 
-            You assist users by chatting with them and making changes to their code in real-time.
-            Generate complete, standalone HTML, CSS, and JavaScript files.
-            Always provide full code with proper structure."""
-        else:
-            system_message = "You are a helpful AI assistant."
+        # Create system message based on personality (shared registry)
+        system_message = get_personality(personality).compact_prompt.text
         
         # Add system message to conversation
         full_messages = [{"role": "system", "content": system_message}] + messages
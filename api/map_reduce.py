@@ -0,0 +1,189 @@
+"""
+Map-Reduce Module
+
+This module handles inputs that are too large to answer in a single upstream
+call within the 50-second stream cap. The input and file contexts are split
+into token-bounded chunks, each chunk is condensed by its own upstream call
+(map, run concurrently), and the condensed parts are combined into a compact
+context for the final streamed answer (reduce).
+
+Key features:
+- Token-bounded chunking on paragraph, line and word boundaries
+- Concurrent map calls under a concurrency cap and an overall deadline
+- Progress events while the map phase runs (also keep the stream alive)
+- Graceful degradation: failed or late chunks fall back to a truncated excerpt
+"""
+
+import asyncio
+import logging
+import re
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+
+from api.context_manager import truncate_to_tokens
+from api.tokenizer import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+EXTRACT_PROMPT = (
+    "Je krijgt deel {index} van {total} van een grote input. Haal alle informatie uit dit deel "
+    "die nodig is om de vraag van de gebruiker te beantwoorden: feiten, cijfers, namen, code en "
+    "citaten. Laat irrelevante delen weg en voeg niets toe dat niet in de tekst staat. "
+    "Antwoord alleen met de geëxtraheerde informatie."
+)
+
+_SPLIT_LEVELS = [r"(?<=\n\n)", r"(?<=\n)", r"(?<= )"]
+
+
+def chunk_text(text: str, max_tokens: int, model: Optional[str] = None) -> List[str]:
+    """
+    Splits text into chunks of at most max_tokens tokens.
+
+    Splits on paragraphs first, then lines, then words; a single word longer
+    than the limit is cut by characters.
+    """
+    tokenizer = get_tokenizer(model)
+
+    def pieces(segment: str, level: int) -> List[str]:
+        if tokenizer.count(segment) <= max_tokens:
+            return [segment]
+        if level >= len(_SPLIT_LEVELS):
+            step = max(1, len(segment) * max_tokens // max(1, tokenizer.count(segment)))
+            return [segment[i:i + step] for i in range(0, len(segment), step)]
+        parts = [p for p in re.split(_SPLIT_LEVELS[level], segment) if p]
+        if len(parts) == 1:
+            return pieces(segment, level + 1)
+        result = []
+        for part in parts:
+            result.extend(pieces(part, level + 1))
+        return result
+
+    chunks: List[str] = []
+    current, current_tokens = "", 0
+    for piece in pieces(text, 0):
+        piece_tokens = tokenizer.count(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current += piece
+        current_tokens += piece_tokens
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def build_extract_messages(question: str, chunk: str, index: int, total: int) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": EXTRACT_PROMPT.format(index=index + 1, total=total)},
+        {"role": "user", "content": f"VRAAG:\n{question}\n\nDEEL {index + 1}/{total}:\n{chunk}"},
+    ]
+
+
+class MapReduceProcessor:
+    """
+    Runs the map and reduce phases for one large input.
+
+    Attributes:
+        concurrency: Maximum number of concurrent map calls
+        chunk_tokens: Token limit per chunk
+        reduce_tokens: Token limit of the combined result
+        deadline: Seconds the whole map phase may take
+        chunk_timeout: Seconds a single map call may take
+        progress_interval: Seconds between progress events when nothing finishes
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        chunk_tokens: int = 2000,
+        reduce_tokens: int = 3000,
+        deadline: float = 25.0,
+        chunk_timeout: float = 20.0,
+        progress_interval: float = 5.0
+    ):
+        self.concurrency = max(1, concurrency)
+        self.chunk_tokens = chunk_tokens
+        self.reduce_tokens = reduce_tokens
+        self.deadline = deadline
+        self.chunk_timeout = chunk_timeout
+        self.progress_interval = progress_interval
+
+    async def run(
+        self,
+        question: str,
+        material: str,
+        extract: Callable[[List[Dict[str, str]], str], Awaitable[str]],
+        model: str,
+        max_seconds: Optional[float] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Yields progress events and finally {"type": "reduced", "content": ...}.
+
+        Args:
+            question: The user's question (sent with every chunk)
+            material: The large input/file context to condense
+            extract: Async function (messages, model) -> text
+            model: Model used for chunking and the map calls
+            max_seconds: Shorter deadline for this run (e.g. what is left of
+                the request budget); never longer than the configured deadline
+        """
+        chunks = chunk_text(material, self.chunk_tokens, model)
+        total = len(chunks)
+        results: List[Optional[str]] = [None] * total
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        seconds = self.deadline if max_seconds is None else max(0.0, min(self.deadline, max_seconds))
+        deadline = loop.time() + seconds
+        logger.info(f"Map-reduce: {total} chunks of <= {self.chunk_tokens} tokens, concurrency {self.concurrency}")
+
+        async def work(index: int, chunk: str):
+            async with semaphore:
+                try:
+                    text = await asyncio.wait_for(
+                        extract(build_extract_messages(question, chunk, index, total), model),
+                        timeout=self.chunk_timeout
+                    )
+                    return index, (text or "").strip() or None
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Map-reduce chunk {index + 1}/{total} failed: {e}")
+                    return index, None
+
+        pending = {asyncio.create_task(work(i, c)) for i, c in enumerate(chunks)}
+        done_count = 0
+        yield {"type": "progress", "phase": "map", "done": 0, "total": total}
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.warning(f"Map-reduce deadline reached with {len(pending)} chunks pending")
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=min(remaining, self.progress_interval), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    index, text = task.result()
+                    results[index] = text
+                    done_count += 1
+                yield {"type": "progress", "phase": "map", "done": done_count, "total": total}
+        finally:
+            for task in pending:
+                task.cancel()
+
+        failed = sum(1 for r in results if r is None)
+        yield {"type": "progress", "phase": "reduce", "done": total - failed, "total": total, "failed": failed}
+        yield {"type": "reduced", "content": self.reduce(chunks, results, model), "chunks": total, "failed": failed}
+
+    def reduce(self, chunks: List[str], results: List[Optional[str]], model: str) -> str:
+        """
+        Combines the map results in input order within reduce_tokens.
+        Chunks without a result contribute a truncated excerpt instead.
+        """
+        total = len(chunks)
+        share = max(1, self.reduce_tokens // max(1, total))
+        parts = []
+        for index, (chunk, result) in enumerate(zip(chunks, results)):
+            body = result if result is not None else truncate_to_tokens(chunk, share, model)
+            parts.append(f"--- Deel {index + 1}/{total} ---\n{body}")
+        return truncate_to_tokens("\n\n".join(parts), self.reduce_tokens, model)
@@ -0,0 +1,225 @@
+"""
+Memory Inspector Module
+
+This module helps pin down memory growth in a live worker. It wraps
+tracemalloc (start/stop, named snapshots, top allocation sites and the diff
+between two snapshots) and reports the size of known in-process structures
+(caches, limiter state, sessions) with a bounded deep sizeof, so a leak can
+be traced to a structure or an allocation site without a redeploy.
+
+tracemalloc is off until it is started: tracing slows allocations down and
+costs memory itself, so it is meant to run for a while around a suspected
+leak and then be stopped again.
+
+Snapshots, the deep sizeof walk and the per-type counts are meant to run in a
+worker thread (asyncio.to_thread) so the event loop keeps serving streams.
+That only helps partly: the work is pure Python and C holding the GIL, so
+other coroutines still slow down while it runs (seconds on a big heap), it
+just no longer blocks them outright. Structures are read while the loop may
+change them, so sizes are a best-effort view, not an atomic one.
+
+Key features:
+- Named tracemalloc snapshots (bounded number, oldest dropped)
+- Top allocation sites per snapshot and diffs between two snapshots
+- Registry of in-process structures with entry counts and deep sizes
+- Process RSS (current and peak) and optional instance counts per type
+"""
+
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY = ("lineno", "filename", "traceback")
+
+# Allocations of the inspector itself are not interesting
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def deep_sizeof(obj: Any, max_objects: int = 200_000) -> Dict[str, Any]:
+    """
+    Approximate retained size of obj and everything it references.
+
+    Walks containers, instance __dict__s and __slots__; shared objects are
+    counted once. Modules, classes and functions are not followed.
+
+    Returns:
+        {"bytes": ..., "objects": ..., "truncated": bool}
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        if len(seen) >= max_objects:
+            return {"bytes": total, "objects": len(seen), "truncated": True}
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        if isinstance(current, (str, bytes, bytearray, int, float, bool)) or current is None:
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        else:
+            if hasattr(current, "__dict__"):
+                stack.append(current.__dict__)
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+    return {"bytes": total, "objects": len(seen), "truncated": False}
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """Current and peak resident set size in bytes (None where unavailable)."""
+    rss = peak = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource  # Not available on Windows
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != "darwin":
+            peak *= 1024  # Linux reports kilobytes
+    except (ImportError, OSError):
+        pass
+    return {"rss_bytes": rss, "peak_rss_bytes": peak}
+
+
+def _format_stat(stat, diff: bool = False) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    entry = {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count
+    }
+    if len(stat.traceback) > 1:
+        entry["traceback"] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+    if diff:
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+class MemoryInspector:
+    """
+    tracemalloc snapshots plus sizes of registered structures.
+
+    Attributes:
+        max_snapshots: Named snapshots kept (the oldest is dropped)
+        snapshots: Snapshots by name, oldest first
+        structures: Name -> callable returning the structure to measure
+    """
+
+    def __init__(self, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self.snapshots: "OrderedDict[str, tracemalloc.Snapshot]" = OrderedDict()
+        self.structures: Dict[str, Callable[[], Any]] = {}
+
+    def register(self, name: str, getter: Callable[[], Any]):
+        """Registers a structure; getter is called at report time (late binding)."""
+        self.structures[name] = getter
+
+    def structure_sizes(self) -> Dict[str, Dict[str, Any]]:
+        sizes = {}
+        for name, getter in self.structures.items():
+            try:
+                target = getter()
+                size = deep_sizeof(target)
+                sizes[name] = {
+                    "entries": len(target) if hasattr(target, "__len__") else None,
+                    "bytes": size["bytes"],
+                    "truncated": size["truncated"]
+                }
+            except Exception as e:
+                sizes[name] = {"error": str(e)}
+        return sizes
+
+    def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+            logger.info(f"tracemalloc started with {frames} frames")
+
+    def stop(self):
+        """Stops tracing; snapshots taken so far stay available."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("tracemalloc stopped")
+
+    def take_snapshot(self, name: str) -> tracemalloc.Snapshot:
+        """
+        Takes a named snapshot (replacing one with the same name).
+
+        Raises:
+            RuntimeError: When tracemalloc is not tracing
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        self.snapshots.pop(name, None)
+        self.snapshots[name] = snapshot
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return snapshot
+
+    def _get(self, name: str) -> tracemalloc.Snapshot:
+        if name not in self.snapshots:
+            raise KeyError(f"Unknown snapshot: {name}")
+        return self.snapshots[name]
+
+    def top(self, name: str, limit: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+        """Largest allocation sites of a snapshot."""
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+        stats = self._get(name).statistics(group_by)
+        return {
+            "snapshot": name,
+            "total_kb": round(sum(stat.size for stat in stats) / 1024, 1),
+            "top": [_format_stat(stat) for stat in stats[:limit]]
+        }
+
+    def diff(self, base: str, target: str, limit: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+        """Allocation sites that grew (or shrank) most from base to target."""
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+        stats = self._get(target).compare_to(self._get(base), group_by)
+        return {
+            "base": base,
+            "target": target,
+            "total_diff_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+            "top": [_format_stat(stat, diff=True) for stat in stats[:limit]]
+        }
+
+    def type_counts(self, limit: int = 30) -> List[Dict[str, Any]]:
+        """Live instances per type (walks the whole GC heap: slow on big workers)."""
+        counts = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+        return [{"type": name, "count": count} for name, count in counts.most_common(limit)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "process": process_memory(),
+            "tracemalloc": {
+                "tracing": tracing,
+                "traced_kb": round(current / 1024, 1),
+                "peak_kb": round(peak / 1024, 1),
+                "overhead_kb": round(tracemalloc.get_tracemalloc_memory() / 1024, 1),
+                "snapshots": list(self.snapshots)
+            },
+            "structures": self.structure_sizes()
+        }
@@ -0,0 +1,180 @@
+"""
+Metrics Module
+
+This module keeps low-overhead counters and fixed-bucket histograms for the
+chat pipeline and renders them in the Prometheus text exposition format
+(served at /metrics). An observation is a dict lookup on the label tuple,
+a bisect over the bucket bounds and two additions, well under a microsecond;
+nothing is allocated after the first observation of a label combination.
+
+Key features:
+- Counter and Histogram with positional label values
+- Fixed buckets per histogram (cumulative only when rendered)
+- Prometheus text format 0.0.4 with HELP/TYPE lines and escaped labels
+- Global registry with the chat metrics (latency, TTFT, inter-token gap,
+  tokens per second, provider latency, cache hits)
+"""
+
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+GAP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """
+    Monotonic counter per label combination.
+
+    Attributes:
+        name: Metric name (including the _total suffix)
+        labelnames: Label names, in the order values are passed
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram per label combination.
+
+    Attributes:
+        name: Metric name
+        buckets: Upper bounds (ascending; +Inf is implicit)
+        labelnames: Label names, in the order values are passed
+        series: Label tuple -> [bucket counts..., +Inf count, sum]
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+        self._size = len(self.buckets) + 2
+
+    def observe(self, value: float, *labels: str):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * self._size
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def count(self, *labels: str) -> int:
+        row = self.series.get(labels)
+        return int(sum(row[:-1])) if row else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, row in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            cumulative += row[-2]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets, labelnames))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry with the chat pipeline metrics
+registry = MetricsRegistry()
+
+requests_total = registry.counter(
+    "dub5_chat_requests_total", "Chat generations by outcome (ok, error, timeout, cached)",
+    ("provider", "model", "personality", "status")
+)
+request_duration = registry.histogram(
+    "dub5_chat_request_duration_seconds", "Duration of a chat generation", LATENCY_BUCKETS,
+    ("provider", "model", "personality")
+)
+ttft_seconds = registry.histogram(
+    "dub5_chat_ttft_seconds", "Time to first token", LATENCY_BUCKETS,
+    ("provider", "model", "personality")
+)
+inter_token_gap = registry.histogram(
+    "dub5_chat_inter_token_gap_seconds", "Gap between consecutive upstream chunks", GAP_BUCKETS,
+    ("provider", "model")
+)
+tokens_per_second = registry.histogram(
+    "dub5_chat_tokens_per_second", "Output tokens per second after the first token", RATE_BUCKETS,
+    ("provider", "model")
+)
+provider_latency = registry.histogram(
+    "dub5_provider_latency_seconds", "Duration of one upstream provider attempt", LATENCY_BUCKETS,
+    ("provider", "outcome")
+)
+cache_requests = registry.counter(
+    "dub5_chat_cache_requests_total", "Response cache lookups", ("result",)
+)
@@ -0,0 +1,203 @@
+"""
+Model Router Module
+
+This module picks the upstream model when a client asks for model "auto".
+Candidate models from MODELS (served by a stable provider) are scored on live
+time-to-first-token percentiles, error rate and a static cost weight, subject
+to the SLO of the requested thinking mode.
+
+Key features:
+- Sliding window of live samples per model (count and age bounded)
+- Static priors from MODEL_PROFILES until enough samples exist
+- Per-thinking-mode SLOs (quality tier, p95 latency, error rate, cost weight)
+- Explainable decisions that are sent to the client in the metadata event
+- Injectable clock so recorded traces can be replayed offline
+"""
+
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional
+
+from api.models import MODELS, STABLE_PROVIDERS, MODEL_PROFILES
+from api.thinking_modes import THINKING_MODES, DEFAULT_THINKING_MODE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RoutingDecision:
+    """
+    Outcome of routing one request.
+
+    Attributes:
+        model: Selected model
+        thinking_mode: Thinking mode whose SLO was applied
+        score: Score of the selected model (lower is better)
+        slo_met: False when no candidate met the SLO and the best effort was taken
+        reason: Short human readable explanation
+        candidates: Per-candidate stats and scores
+    """
+    model: str
+    thinking_mode: str
+    score: float
+    slo_met: bool
+    reason: str
+    candidates: List[Dict] = field(default_factory=list)
+
+    def to_dict(self, include_candidates: bool = False) -> Dict:
+        data = asdict(self)
+        if not include_candidates:
+            data.pop("candidates")
+        return data
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class ModelRouter:
+    """
+    Latency- and cost-aware router for the "auto" model.
+
+    Attributes:
+        candidates: Models the router may pick
+        window: Maximum number of samples kept per model
+        max_age: Samples older than this many seconds are ignored
+        min_samples: Samples needed before live stats replace the priors
+        preferred_bonus: Score bonus for the personality's recommended model
+    """
+
+    def __init__(
+        self,
+        candidates: Optional[Iterable[str]] = None,
+        profiles: Optional[Dict[str, Dict]] = None,
+        modes: Optional[Dict[str, Dict]] = None,
+        window: int = 100,
+        max_age: float = 600.0,
+        min_samples: int = 5,
+        preferred_bonus: float = 0.1,
+        clock=time.time
+    ):
+        self.profiles = profiles or MODEL_PROFILES
+        self.modes = modes or THINKING_MODES
+        if candidates is None:
+            candidates = [m for m, provider in MODELS.items() if provider in STABLE_PROVIDERS]
+        self.candidates = [m for m in candidates if m in self.profiles]
+        self.window = window
+        self.max_age = max_age
+        self.min_samples = min_samples
+        self.preferred_bonus = preferred_bonus
+        self.clock = clock
+        # model -> deque of (timestamp, ttft or None, ok)
+        self.samples: Dict[str, deque] = {m: deque(maxlen=window) for m in self.candidates}
+
+    def record(self, model: str, ttft: Optional[float], ok: bool):
+        """
+        Records the outcome of one upstream generation.
+
+        Args:
+            model: Model that was used
+            ttft: Seconds to the first token (None if no token arrived)
+            ok: Whether the generation produced an answer
+        """
+        if model in self.samples:
+            self.samples[model].append((self.clock(), ttft, ok))
+
+    def stats(self, model: str) -> Dict:
+        """
+        Returns p50/p95 time to first token and error rate for a model.
+        """
+        cutoff = self.clock() - self.max_age
+        recent = [s for s in self.samples.get(model, ()) if s[0] >= cutoff]
+        latencies = sorted(s[1] for s in recent if s[1] is not None)
+        errors = sum(1 for s in recent if not s[2])
+        prior = self.profiles[model]["prior_ttft"]
+        live = len(latencies) >= self.min_samples
+        return {
+            "p50": percentile(latencies, 0.5) if live else prior,
+            "p95": percentile(latencies, 0.95) if live else prior * 2,
+            # Smoothed towards zero so a single failure does not ban a model
+            "error_rate": errors / (len(recent) + 2 * self.min_samples),
+            "samples": len(recent),
+            "live": live
+        }
+
+    def route(self, thinking_mode: str, preferred: Optional[str] = None, exclude: Iterable[str] = ()) -> RoutingDecision:
+        """
+        Picks a model for a request in the given thinking mode.
+
+        Args:
+            thinking_mode: Thinking mode of the request (selects the SLO)
+            preferred: Model recommended by the personality (small bonus)
+            exclude: Models that must not be picked
+
+        Returns:
+            RoutingDecision
+        """
+        if thinking_mode not in self.modes:
+            thinking_mode = DEFAULT_THINKING_MODE
+        slo = self.modes[thinking_mode]["slo"]
+
+        scored = []
+        for model in self.candidates:
+            if model in exclude:
+                continue
+            profile = self.profiles[model]
+            stats = self.stats(model)
+            score = (
+                stats["p50"] / slo["ttft_p95"]
+                + 0.5 * stats["p95"] / slo["ttft_p95"]
+                + 3.0 * stats["error_rate"]
+                + slo["cost_weight"] * profile["cost"]
+            )
+            if model == preferred:
+                score -= self.preferred_bonus
+            eligible = (
+                profile["quality"] >= slo["min_quality"]
+                and stats["p95"] <= slo["ttft_p95"]
+                and stats["error_rate"] <= slo["max_error_rate"]
+            )
+            scored.append({
+                "model": model,
+                "score": round(score, 4),
+                "eligible": eligible,
+                "quality": profile["quality"],
+                **{k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()}
+            })
+
+        if not scored:
+            raise ValueError("No candidate models available for routing")
+
+        eligible = [c for c in scored if c["eligible"]]
+        if eligible:
+            best = min(eligible, key=lambda c: c["score"])
+            reason = f"best score within {thinking_mode} SLO (p95 {best['p95']:.2f}s, errors {best['error_rate']:.0%})"
+        else:
+            # Nobody meets the SLO: best effort among models of sufficient quality
+            pool = [c for c in scored if c["quality"] >= slo["min_quality"]] or scored
+            best = min(pool, key=lambda c: c["score"])
+            reason = f"no model meets the {thinking_mode} SLO, best effort"
+            logger.warning(f"Model router: {reason} ({best['model']})")
+
+        return RoutingDecision(
+            model=best["model"],
+            thinking_mode=thinking_mode,
+            score=best["score"],
+            slo_met=bool(eligible),
+            reason=reason,
+            candidates=sorted(scored, key=lambda c: c["score"])
+        )
+
+    def get_status(self) -> Dict[str, Dict]:
+        """Returns the live stats of every candidate model."""
+        return {model: self.stats(model) for model in self.candidates}
+
+
+# Global router instance
+model_router = ModelRouter()
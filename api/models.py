@@ -29,3 +29,15 @@ STABLE_PROVIDERS = [
 SEARCH_PROVIDERS = [
     "search" # This is a placeholder for a dedicated search model/provider
 ]
+
+# Static routing profile per model (used by the "auto" router):
+# relative cost, quality tier (1-3) and expected time to first token in
+# seconds before live measurements are available
+MODEL_PROFILES = {
+    "gpt-4o": {"cost": 1.0, "quality": 3, "prior_ttft": 1.5},
+    "gpt-4o-mini": {"cost": 0.15, "quality": 2, "prior_ttft": 0.8},
+    "claude-3-haiku": {"cost": 0.25, "quality": 2, "prior_ttft": 1.0},
+    "mistral": {"cost": 0.2, "quality": 2, "prior_ttft": 1.2},
+    "llama": {"cost": 0.2, "quality": 2, "prior_ttft": 1.2},
+    "deepseek": {"cost": 0.3, "quality": 3, "prior_ttft": 2.0}
+}
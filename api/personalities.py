@@ -1,5 +1,8 @@
 # api/personalities.py
 
+import sys
+from dataclasses import dataclass
+
 from api.config import Config
 
 DEFAULT_PERSONALITY = "general"
@@ -39,7 +42,82 @@ When generating code, always follow these rules:
 9.  **No External Libraries (unless specified)**: Avoid using external libraries or CDNs unless the user explicitly asks for them.
 """
 
-PERSONALITIES = {
-    "general": "You are a helpful AI assistant.",
-    "coder": BUILDER_SYSTEM_PROMPT,
-}
\ No newline at end of file
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """
+    A prompt prepared once at startup.
+
+    Attributes:
+        text: Prompt text (interned)
+    """
+    text: str
+
+
+def compile_prompt(text: str) -> CompiledPrompt:
+    return CompiledPrompt(text=sys.intern(text))
+
+
+@dataclass(frozen=True)
+class Personality:
+    """
+    Everything the entry points need to know about a personality.
+
+    Attributes:
+        name: Personality name as sent by the frontend
+        prompt: Full prompt used by the main app (chatbot_backup)
+        compact_prompt: Short prompt used by the lightweight Vercel handlers
+        recommended_model: Model used when the client asks for "auto"
+        coalesce_chars: Stream chunks are merged until this many characters...
+        coalesce_delay: ...or this many seconds have passed since the last flush
+    """
+    name: str
+    prompt: CompiledPrompt
+    compact_prompt: CompiledPrompt
+    recommended_model: str = "gpt-4o"
+    coalesce_chars: int = 24
+    coalesce_delay: float = 0.05
+
+
+CODER_COMPACT_PROMPT = """You are DUB5, an AI editor that creates and modifies web applications. 
+            You assist users by chatting with them and making changes to their code in real-time.
+            Generate complete, standalone HTML, CSS, and JavaScript files.
+            Always provide full code with proper structure."""
+
+# Single source of truth for all entry points (chatbot_backup, index, chatbot)
+PERSONALITY_REGISTRY = {
+    p.name: p for p in [
+        Personality(
+            name="general",
+            prompt=compile_prompt("You are a helpful AI assistant."),
+            compact_prompt=compile_prompt("You are a helpful AI assistant. Be friendly and helpful."),
+        ),
+        Personality(
+            name="coder",
+            prompt=compile_prompt(BUILDER_SYSTEM_PROMPT),
+            compact_prompt=compile_prompt(CODER_COMPACT_PROMPT),
+            # Code is rendered per block, larger batches mean fewer re-renders
+            coalesce_chars=96,
+            coalesce_delay=0.1,
+        ),
+        Personality(
+            name="teacher",
+            prompt=compile_prompt("You are an educational AI tutor. Explain concepts clearly and encourage learning."),
+            compact_prompt=compile_prompt("You are an educational AI tutor. Explain concepts clearly and encourage learning."),
+            recommended_model="gpt-4o-mini",
+        ),
+        Personality(
+            name="writer",
+            prompt=compile_prompt("You are a creative writing assistant. Help with writing, editing, and creative ideas."),
+            compact_prompt=compile_prompt("You are a creative writing assistant. Help with writing, editing, and creative ideas."),
+            coalesce_chars=48,
+        ),
+    ]
+}
+
+# Name -> full prompt text (kept for existing imports)
+PERSONALITIES = {name: p.prompt.text for name, p in PERSONALITY_REGISTRY.items()}
+
+
+def get_personality(name: str) -> Personality:
+    """Returns the personality, or the default one for unknown names."""
+    return PERSONALITY_REGISTRY.get(name) or PERSONALITY_REGISTRY[DEFAULT_PERSONALITY]
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Profiler Module
+
+This module samples the Python stacks of a live worker on demand, so hot code
+can be found in production without redeploying. A background thread reads
+sys._current_frames() at a fixed interval and counts each stack; the result
+is returned as collapsed stacks ("thread;module:function;... count"), the
+input format of flamegraph.pl, speedscope and similar tools.
+
+The event loop thread is sampled like any other thread: time spent waiting
+for I/O shows up as the selector call, so a flame graph shows both CPU hot
+spots and how busy the loop is. Nothing is installed in the interpreter
+(no sys.setprofile), so code that is not sampled runs at full speed.
+
+Key features:
+- Off by default; one session at a time
+- Runs for N seconds or until N chat requests have finished (bounded by a maximum duration)
+- Bounded overhead: minimum interval, maximum stack depth and number of distinct stacks
+- Measures its own sampling time (reported as overhead)
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profiling session is already running."""
+
+
+class SamplingProfiler:
+    """
+    Thread-stack sampling profiler.
+
+    Attributes:
+        max_duration: Longest allowed session in seconds
+        min_interval: Shortest allowed sampling interval in seconds
+        max_depth: Frames kept per stack (the outermost frames are dropped)
+        max_stacks: Distinct stacks kept; further new stacks count as "[truncated]"
+        stacks: Sample count per collapsed stack of the last session
+    """
+
+    def __init__(
+        self,
+        max_duration: float = 60.0,
+        min_interval: float = 0.001,
+        max_depth: int = 64,
+        max_stacks: int = 10000
+    ):
+        self.max_duration = max_duration
+        self.min_interval = min_interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+        self.requests_left: Optional[int] = None
+        self._labels: Dict[object, str] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float, interval: float = 0.005, requests: Optional[int] = None):
+        """
+        Starts sampling in a background thread.
+
+        Args:
+            duration: Seconds to sample (capped at max_duration)
+            interval: Seconds between samples (at least min_interval)
+            requests: Stop earlier once this many requests have finished
+
+        Raises:
+            ProfilerBusy: When a session is already running
+        """
+        if self.running:
+            raise ProfilerBusy("A profiling session is already running")
+        duration = min(max(duration, 0.0), self.max_duration)
+        interval = max(interval, self.min_interval)
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.requests_left = requests
+        self._labels = {}
+        self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, args=(duration, interval), name="dub5-profiler", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Profiler started: {duration}s, interval {interval * 1000:.1f}ms, requests={requests}")
+
+    def stop(self):
+        self._stop.set()
+
+    def request_done(self):
+        """Counts a finished request towards a request-bounded session."""
+        if self.requests_left is not None and self.running:
+            self.requests_left -= 1
+            if self.requests_left <= 0:
+                self._stop.set()
+
+    async def profile(self, duration: float, interval: float = 0.005, requests: Optional[int] = None) -> str:
+        """Runs one session without blocking the event loop and returns the collapsed stacks."""
+        self.start(duration, interval, requests)
+        try:
+            while self.running:
+                await asyncio.sleep(0.05)
+        finally:
+            # Client gone: stop sampling as well
+            self.stop()
+        return self.collapsed()
+
+    def _run(self, duration: float, interval: float):
+        deadline = self.started_at + duration
+        own_id = threading.get_ident()
+        while not self._stop.wait(interval):
+            if time.perf_counter() >= deadline:
+                break
+            self._sample(own_id)
+        self.elapsed = time.perf_counter() - self.started_at
+        logger.info(f"Profiler stopped after {self.elapsed:.1f}s with {self.samples} samples")
+
+    def _label(self, frame) -> str:
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            module = frame.f_globals.get("__name__", "?")
+            label = self._labels[code] = f"{module}:{code.co_name}"
+        return label
+
+    def _sample(self, own_id: int):
+        start = time.perf_counter()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            thread_name = self._thread_names.get(thread_id)
+            if thread_name is None:
+                self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+                thread_name = self._thread_names.get(thread_id, f"thread-{thread_id}")
+            key: Tuple[str, ...] = (thread_name, *reversed(stack))
+            if key not in self.stacks and len(self.stacks) >= self.max_stacks:
+                key = (thread_name, "[truncated]")
+            self.stacks[key] += 1
+        self.samples += 1
+        self.sampling_time += time.perf_counter() - start
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one "frame;frame;... count" line per stack (most samples first)."""
+        return "".join(
+            f"{';'.join(frame.replace(';', ':') for frame in stack)} {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+    def get_stats(self) -> Dict:
+        elapsed = (time.perf_counter() - self.started_at) if self.running else self.elapsed
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "elapsed_s": round(elapsed, 3),
+            # Share of the wall time spent sampling (the GIL is held meanwhile)
+            "overhead": round(self.sampling_time / elapsed, 4) if elapsed else 0.0
+        }
+
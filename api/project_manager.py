@@ -5,4 +5,10 @@ class ProjectManager:
         """
         print(f"Mock ProjectManager: Updating file {path} for session {session_id}")
 
+    def get_project_context(self, session_id: str) -> str:
+        """
+        Placeholder for describing the current project files to the model.
+        """
+        return ""
+
 project_manager = ProjectManager()
@@ -0,0 +1,155 @@
+"""
+Prompt Registry Module
+
+This module precomputes the static part of every system prompt. The prefix
+for each personality × thinking-mode combination (base prompt, role and mode
+instructions) is assembled once at startup together with its token count and
+hash, so a request only appends its dynamic parts (project context, web
+search, RAG).
+
+Key features:
+- Interned prefix text per personality and thinking mode
+- Token count and content hash computed once per prefix
+- Bounded cache for prefixes built on a custom system prompt
+- Prompt hash for cache keys that also covers dynamic additions
+- System prompt token count from the precomputed prefix count
+"""
+
+import logging
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from api.config import Config
+from api.personalities import PERSONALITIES, DEFAULT_PERSONALITY
+from api.thinking_modes import THINKING_MODES, DEFAULT_THINKING_MODE
+from api.tokenizer import content_hash, get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    """
+    Static system prompt prefix for one personality and thinking mode.
+
+    Attributes:
+        personality: Personality name
+        thinking_mode: Thinking mode name
+        text: Full prefix text (interned)
+        tokens: Token count of the text
+        hash: Hex content hash of the text
+    """
+    personality: str
+    thinking_mode: str
+    text: str
+    tokens: int
+    hash: str
+
+
+def assemble_prefix(base_prompt: str, personality: str, personality_prompt: str, thinking_mode: str, mode_prompt: str) -> str:
+    """Builds the static system prompt text (same layout chatbot_response always used)."""
+    return f"{base_prompt}\n\nROL: {personality.upper()}\n{personality_prompt}\n\nMODUS: {thinking_mode.upper()}\n{mode_prompt}"
+
+
+def prompt_hash(prefix: PromptPrefix, dynamic: str = "") -> str:
+    """
+    Returns the hash identifying a complete system prompt.
+
+    Without dynamic additions this is the precomputed prefix hash, so the
+    common case costs nothing.
+    """
+    if not dynamic:
+        return prefix.hash
+    return content_hash(prefix.hash + dynamic).hex()
+
+
+def system_prompt_tokens(prefix: PromptPrefix, dynamic: str = "", model: Optional[str] = None) -> int:
+    """
+    Returns the token count of prefix.text + dynamic.
+
+    Only the dynamic part is tokenized; the prefix count was computed at
+    startup. Models with another encoding than the default count the whole text.
+    """
+    tokenizer = get_tokenizer(model)
+    if tokenizer is not get_tokenizer():
+        return tokenizer.count(prefix.text + dynamic)
+    return prefix.tokens + (tokenizer.count(dynamic) if dynamic else 0)
+
+
+class PromptRegistry:
+    """
+    Precomputed system prompt prefixes.
+
+    Attributes:
+        base_prompt: Default base system prompt
+        prefixes: (personality, thinking_mode) -> PromptPrefix
+        max_custom: Maximum number of prefixes kept for custom base prompts
+    """
+
+    def __init__(
+        self,
+        base_prompt: str,
+        personalities: Dict[str, str],
+        thinking_modes: Dict[str, dict],
+        max_custom: int = 256
+    ):
+        self.base_prompt = base_prompt
+        self.personalities = personalities
+        self.thinking_modes = thinking_modes
+        self.max_custom = max_custom
+        self._custom: "OrderedDict[Tuple[bytes, str, str], PromptPrefix]" = OrderedDict()
+        self.prefixes: Dict[Tuple[str, str], PromptPrefix] = {
+            (personality, mode): self._build(base_prompt, personality, mode)
+            for personality in personalities
+            for mode in thinking_modes
+        }
+        logger.info(f"Prompt registry: {len(self.prefixes)} prefixes precomputed")
+
+    def _build(self, base_prompt: str, personality: str, thinking_mode: str) -> PromptPrefix:
+        text = sys.intern(assemble_prefix(
+            base_prompt,
+            personality,
+            self.personalities[personality],
+            thinking_mode,
+            self.thinking_modes[thinking_mode]["system_add"]
+        ))
+        return PromptPrefix(
+            personality=personality,
+            thinking_mode=thinking_mode,
+            text=text,
+            tokens=get_tokenizer().count(text),
+            hash=content_hash(text).hex()
+        )
+
+    def get(self, personality: str, thinking_mode: str, base_prompt: Optional[str] = None) -> PromptPrefix:
+        """
+        Returns the prefix for a personality and thinking mode.
+
+        Args:
+            personality: Personality name (unknown names use the default)
+            thinking_mode: Thinking mode name (unknown names use the default)
+            base_prompt: Custom base prompt replacing the default one
+        """
+        if personality not in self.personalities:
+            personality = DEFAULT_PERSONALITY
+        if thinking_mode not in self.thinking_modes:
+            thinking_mode = DEFAULT_THINKING_MODE
+        if not base_prompt or base_prompt == self.base_prompt:
+            return self.prefixes[(personality, thinking_mode)]
+
+        key = (content_hash(base_prompt), personality, thinking_mode)
+        prefix = self._custom.get(key)
+        if prefix is None:
+            prefix = self._build(base_prompt, personality, thinking_mode)
+            self._custom[key] = prefix
+            if len(self._custom) > self.max_custom:
+                self._custom.popitem(last=False)
+        else:
+            self._custom.move_to_end(key)
+        return prefix
+
+
+# Global prompt registry (built once at import/startup)
+prompt_registry = PromptRegistry(Config.DUB5_SYSTEM_PROMPT, PERSONALITIES, THINKING_MODES)
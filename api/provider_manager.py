@@ -2,17 +2,132 @@
 Provider Manager Module
 
 This module implements the ProviderManager class for managing AI provider
-selection, failure tracking, and cooldown logic.
+selection, failure tracking, and cooldown logic, plus a status-aware
+classifier for upstream failures (rate limits and Retry-After are honoured
+with exact "not before" times instead of the outage cooldown).
 
 Validates Requirements: 8.1, 8.3, 8.4
 """
 
+import asyncio
 import time
 import logging
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
 from typing import Dict, Optional
 
+from api.concurrency_limiter import ProviderLimiters
+
+try:
+    import httpx
+    NETWORK_ERRORS = (httpx.TransportError, asyncio.TimeoutError, ConnectionError)
+except ImportError:
+    NETWORK_ERRORS = (asyncio.TimeoutError, ConnectionError)
+
 logger = logging.getLogger(__name__)
 
+# Wait after a 429 without Retry-After, and the longest Retry-After we honour
+DEFAULT_RATE_LIMIT_DELAY = 10.0
+MAX_RETRY_AFTER = 600.0
+
+
+class UpstreamHTTPError(Exception):
+    """
+    Non-success HTTP response from an upstream provider.
+    
+    Attributes:
+        status_code: HTTP status of the response
+        retry_after: Seconds from the Retry-After header (None if absent)
+    """
+    
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass
+class FailureInfo:
+    """
+    Classification of one upstream failure.
+    
+    Attributes:
+        kind: "rate_limited", "unavailable", "server_error", "client_error",
+              "network" or "unknown"
+        status_code: HTTP status, if the failure was an HTTP response
+        delay: Seconds the provider must not be used (None: no exact delay)
+        outage: Whether this counts as a provider failure (strikes/cooldown)
+        overload: Whether this signals that the provider is overloaded
+    """
+    kind: str
+    status_code: Optional[int] = None
+    delay: Optional[float] = None
+    outage: bool = True
+    overload: bool = False
+
+
+def parse_retry_after(value, now: Optional[float] = None) -> Optional[float]:
+    """
+    Parses a Retry-After header (delta seconds or an HTTP date).
+    
+    Args:
+        value: Header value
+        now: Current unix time (defaults to time.time())
+    
+    Returns:
+        Optional[float]: Seconds to wait (0..MAX_RETRY_AFTER), None if unparseable
+    """
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    elif isinstance(value, str) and value.strip():
+        value = value.strip()
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - (now if now is not None else time.time())
+            except (TypeError, ValueError, IndexError):
+                return None
+    else:
+        return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def classify_failure(error: BaseException) -> FailureInfo:
+    """
+    Classifies an upstream failure by HTTP status, Retry-After and error type.
+    
+    - 429: rate limited, wait exactly Retry-After (or a short default);
+      not an outage
+    - 503: unavailable; with Retry-After wait exactly that, without it it
+      counts as an outage
+    - other 5xx: outage
+    - other 4xx: the request was refused, not the provider's fault
+    - connection errors and timeouts: outage
+    
+    Args:
+        error: Exception raised while calling the provider
+    
+    Returns:
+        FailureInfo: How the failure should be handled
+    """
+    if isinstance(error, UpstreamHTTPError):
+        status = error.status_code
+        if status == 429:
+            delay = error.retry_after if error.retry_after is not None else DEFAULT_RATE_LIMIT_DELAY
+            return FailureInfo("rate_limited", status, delay, outage=False, overload=True)
+        if status == 503:
+            return FailureInfo("unavailable", status, error.retry_after, outage=error.retry_after is None, overload=True)
+        if status >= 500:
+            return FailureInfo("server_error", status, error.retry_after, overload=True)
+        return FailureInfo("client_error", status, outage=False)
+    # g4f raises its own RateLimitError without a status code
+    if type(error).__name__ == "RateLimitError":
+        return FailureInfo("rate_limited", 429, DEFAULT_RATE_LIMIT_DELAY, outage=False, overload=True)
+    if isinstance(error, NETWORK_ERRORS):
+        return FailureInfo("network", overload=True)
+    return FailureInfo("unknown")
+
 
 class ProviderManager:
     """
@@ -26,47 +141,58 @@ class ProviderManager:
         failure_counts: Dictionary tracking consecutive failures per provider
         cooldown_until: Dictionary tracking cooldown expiry timestamps per provider
         last_success: Dictionary tracking last successful use timestamp per provider
+        not_before: Dictionary of exact "do not use before" timestamps (Retry-After)
+        limiters: Concurrency limiters of the providers (reported in the status)
     """
     
-    def __init__(self, providers: Optional[list] = None):
+    def __init__(self, providers: Optional[list] = None, limiters: Optional[ProviderLimiters] = None):
         """
         Initialize the ProviderManager.
         
         Args:
             providers: List of provider names. Defaults to ["g4f", "pollinations"]
+            limiters: Per-provider concurrency limiters used for these providers
         """
         self.providers = providers or ["g4f", "pollinations"]
         self.failure_counts: Dict[str, int] = {p: 0 for p in self.providers}
         self.cooldown_until: Dict[str, float] = {p: 0.0 for p in self.providers}
         self.last_success: Dict[str, float] = {p: 0.0 for p in self.providers}
+        self.not_before: Dict[str, float] = {p: 0.0 for p in self.providers}
+        self.last_failure_kind: Dict[str, Optional[str]] = {p: None for p in self.providers}
+        self.limiters = limiters
         
         logger.info(f"ProviderManager initialized with providers: {self.providers}")
     
-    def get_next_provider(self) -> str:
+    def get_next_provider(self, exclude: Optional[list] = None) -> str:
         """
         Selects the next available provider based on health status.
         
         This method:
-        1. Filters out providers in cooldown
-        2. Prefers providers with lower failure counts
-        3. Falls back to any available provider if all are in cooldown
+        1. Skips providers already tried for the current request
+        2. Filters out providers in cooldown or before their "not before" time
+        3. Prefers providers with lower failure counts
+        4. Falls back to any available provider if all are in cooldown
+        
+        Args:
+            exclude: Provider names already tried for this request (optional)
         
         Returns:
             str: Name of the provider to use
         """
         current_time = time.time()
+        candidates = [p for p in self.providers if p not in (exclude or [])] or self.providers
         
         # Filter providers not in cooldown
         available_providers = [
-            p for p in self.providers
-            if current_time >= self.cooldown_until[p]
+            p for p in candidates
+            if current_time >= self.blocked_until(p)
         ]
         
         if not available_providers:
             # All providers are in cooldown, use the one closest to recovery
             logger.warning("All providers in cooldown, selecting provider with shortest cooldown")
             available_providers = [
-                min(self.providers, key=lambda p: self.cooldown_until[p])
+                min(candidates, key=self.blocked_until)
             ]
         
         # Select provider with lowest failure count
@@ -114,6 +240,31 @@ class ProviderManager:
                 f"after {self.failure_counts[provider]} consecutive failures"
             )
     
+    def defer(self, provider: str, seconds: float, reason: str = "retry_after") -> None:
+        """
+        Keeps a provider out of rotation for an exact duration.
+        
+        Used for rate limits and Retry-After: unlike record_failure there is
+        no strike count and no fixed cooldown, so the provider is used again
+        as soon as it allows it.
+        
+        Args:
+            provider: Name of the provider
+            seconds: How long the provider must not be used
+            reason: Failure kind, for logs and status
+        """
+        if provider not in self.providers:
+            logger.warning(f"Attempted to defer unknown provider: {provider}")
+            return
+        
+        self.not_before[provider] = max(self.not_before[provider], time.time() + seconds)
+        self.last_failure_kind[provider] = reason
+        logger.warning(f"Provider {provider} deferred for {seconds:.1f} seconds ({reason})")
+    
+    def blocked_until(self, provider: str) -> float:
+        """Returns the time from which the provider may be used again."""
+        return max(self.cooldown_until[provider], self.not_before[provider])
+    
     def record_success(self, provider: str) -> None:
         """
         Records a provider success and resets failure count.
@@ -158,7 +309,11 @@ class ProviderManager:
                 "failure_count": self.failure_counts[provider],
                 "in_cooldown": in_cooldown,
                 "cooldown_remaining": max(0, self.cooldown_until[provider] - current_time),
+                "not_before_remaining": max(0, self.not_before[provider] - current_time),
+                "last_failure_kind": self.last_failure_kind[provider],
                 "last_success": self.last_success[provider]
             }
+            if self.limiters is not None:
+                status[provider]["concurrency"] = self.limiters.get(provider).get_stats()
         
         return status
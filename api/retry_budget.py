@@ -0,0 +1,168 @@
+"""
+Retry Budget Module
+
+This module retries transient upstream failures that happen before the first
+token (connect errors, timeouts, 502/503/504). Opening a chat completion has
+no side effects, so that phase is safe to repeat; once the first token has
+been streamed nothing is retried (the provider fallback takes over).
+
+Retries are bounded three ways: a maximum number of attempts, the request
+deadline (the jittered backoff never sleeps past it) and a process-wide
+retry budget, so retries can never amplify an outage: within the sliding
+window retries stay at or below `ratio` of the requests (with a small floor
+for low traffic).
+
+Key features:
+- tenacity AsyncRetrying with full-jitter exponential backoff
+- Deadline-aware stop (the next sleep must fit before the deadline)
+- Sliding-window retry budget shared by all providers
+- Request, retry and budget-denied counts per provider
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from tenacity import AsyncRetrying, retry_if_exception, wait_random_exponential
+
+from api.provider_manager import classify_failure
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+def is_retryable(error: BaseException, max_retry_after: float = 2.0) -> bool:
+    """
+    Whether a pre-first-token failure is transient enough to retry.
+
+    Rate limits (429) and long Retry-After values are not retried here: the
+    provider is deferred and the request fails over instead.
+    """
+    failure = classify_failure(error)
+    if failure.kind == "network":
+        return True
+    if failure.status_code in RETRYABLE_STATUS:
+        return failure.delay is None or failure.delay <= max_retry_after
+    return False
+
+
+class RetryBudget:
+    """
+    Process-wide retry budget over a sliding window.
+
+    Attributes:
+        ratio: Maximum retries per request in the window
+        min_retries: Retries always allowed in the window (low traffic)
+        window: Window length in seconds
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 3, window: float = 60.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.clock = clock
+        self.requests: Deque[float] = deque()
+        self.retries: Deque[float] = deque()
+        self.per_provider: Dict[str, Dict[str, int]] = {}
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        for events in (self.requests, self.retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def _counts(self, provider: str) -> Dict[str, int]:
+        counts = self.per_provider.get(provider)
+        if counts is None:
+            counts = self.per_provider[provider] = {"requests": 0, "retries": 0, "denied": 0}
+        return counts
+
+    def record_request(self, provider: str):
+        self.requests.append(self.clock())
+        self._counts(provider)["requests"] += 1
+
+    def can_retry(self) -> bool:
+        now = self.clock()
+        self._trim(now)
+        return len(self.retries) < max(self.min_retries, self.ratio * len(self.requests))
+
+    def record_retry(self, provider: str):
+        self.retries.append(self.clock())
+        self._counts(provider)["retries"] += 1
+
+    def record_denied(self, provider: str):
+        self._counts(provider)["denied"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._trim(self.clock())
+        return {
+            "window": self.window,
+            "requests_in_window": len(self.requests),
+            "retries_in_window": len(self.retries),
+            "ratio": self.ratio,
+            "providers": {name: dict(counts) for name, counts in self.per_provider.items()}
+        }
+
+
+async def call_with_retry(
+    fn: Callable[[], Awaitable[Any]],
+    provider: str,
+    budget: RetryBudget,
+    deadline: float,
+    max_attempts: int = 3,
+    base_delay: float = 0.25,
+    max_delay: float = 2.0,
+    clock=time.monotonic
+) -> Any:
+    """
+    Runs a pre-first-token upstream call, retrying transient failures.
+
+    Args:
+        fn: Coroutine function that opens the upstream stream
+        provider: Provider name (for the per-provider counts)
+        budget: Shared retry budget
+        deadline: clock() value by which the first token is needed
+        max_attempts: Maximum number of attempts including the first
+        base_delay: Backoff multiplier (full jitter, exponential)
+        max_delay: Maximum single backoff
+
+    Returns:
+        Whatever fn returns; the last error is raised when retries stop
+    """
+    budget.record_request(provider)
+
+    def should_retry(error: BaseException) -> bool:
+        if not is_retryable(error, max_delay):
+            return False
+        if not budget.can_retry():
+            budget.record_denied(provider)
+            logger.warning(f"Retry budget exhausted, not retrying {provider}: {error}")
+            return False
+        return True
+
+    def stop(retry_state) -> bool:
+        # Upcoming sleep is already computed: it has to fit before the deadline
+        sleep = retry_state.upcoming_sleep or 0.0
+        return retry_state.attempt_number >= max_attempts or clock() + sleep >= deadline
+
+    def before_sleep(retry_state):
+        budget.record_retry(provider)
+        logger.info(
+            f"Retrying {provider} in {retry_state.upcoming_sleep:.2f}s "
+            f"(attempt {retry_state.attempt_number}): {retry_state.outcome.exception()}"
+        )
+
+    retrying = AsyncRetrying(
+        retry=retry_if_exception(should_retry),
+        wait=wait_random_exponential(multiplier=base_delay, max=max_delay),
+        stop=stop,
+        before_sleep=before_sleep,
+        reraise=True
+    )
+    return await retrying(fn)
+
+
+# Global budget shared by all requests of this worker
+retry_budget = RetryBudget()
@@ -0,0 +1,183 @@
+"""
+Stream Hub Module
+
+This module shares one upstream generation between all subscribers of the
+same session and turn. When a user has the same session open in several
+tabs or devices, the second request attaches to the running generation
+instead of starting a duplicate one.
+
+Key features:
+- One producer task per (session, turn) key, started by the first subscriber
+- Late subscribers catch up from the first frame
+- Independent bounded queue per subscriber; a slow subscriber falls back to
+  reading the frame history and never stalls the producer or other tabs
+- Producer is cancelled when the last subscriber leaves
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import AsyncGenerator, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+_END = object()
+
+
+def turn_key(
+    session_id: str,
+    messages: List[Dict[str, str]],
+    model: str,
+    personality: str,
+    web_search: bool = False,
+    image_data: Optional[str] = None
+) -> str:
+    """
+    Builds the hub key for a session and conversation turn.
+
+    Two requests share a generation only if they send the same conversation
+    with the same options within the same session.
+    """
+    digest = hashlib.sha256(
+        json.dumps([model, personality, web_search, image_data, messages], sort_keys=True).encode("utf-8")
+    ).hexdigest()[:32]
+    return f"{session_id}:{digest}"
+
+
+class _Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.next_index = 0
+        # Lagging subscribers read directly from the broadcast history
+        self.lagging = True
+
+
+class Broadcast:
+    """
+    A running generation and its subscribers.
+
+    Attributes:
+        key: Hub key of the generation
+        frames: Every frame produced so far (used for catch-up)
+        subscribers: Currently attached subscribers
+        done: True once the source generator is exhausted
+    """
+
+    def __init__(self, key: str, source: AsyncGenerator, queue_size: int):
+        self.key = key
+        self.source = source
+        self.queue_size = queue_size
+        self.frames: List = []
+        self.subscribers: List[_Subscriber] = []
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+
+    def _publish(self, item) -> None:
+        index = len(self.frames)
+        if item is not _END:
+            self.frames.append(item)
+        for sub in self.subscribers:
+            if sub.lagging:
+                continue
+            try:
+                sub.queue.put_nowait(_END if item is _END else (index, item))
+            except asyncio.QueueFull:
+                # Drop to history mode instead of blocking everyone else
+                sub.lagging = True
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+
+    async def run(self) -> None:
+        try:
+            async for frame in self.source:
+                self._publish(frame)
+        except Exception as e:
+            logger.error(f"Shared generation {self.key} failed: {e}", exc_info=True)
+        finally:
+            self.done = True
+            self._publish(_END)
+            await self.source.aclose()
+
+    async def subscribe(self) -> AsyncGenerator:
+        sub = _Subscriber(self.queue_size)
+        self.subscribers.append(sub)
+        try:
+            while True:
+                if sub.lagging:
+                    if sub.next_index < len(self.frames):
+                        frame = self.frames[sub.next_index]
+                        sub.next_index += 1
+                        yield frame
+                        continue
+                    if self.done:
+                        return
+                    # Caught up: switch back to live delivery
+                    sub.lagging = False
+
+                item = await sub.queue.get()
+                if item is _END:
+                    return
+                index, frame = item
+                if index < sub.next_index:
+                    continue
+                sub.next_index = index + 1
+                yield frame
+        finally:
+            self.subscribers.remove(sub)
+
+
+class StreamHub:
+    """
+    Registry of running broadcasts keyed by session and turn.
+
+    Attributes:
+        queue_size: Frames buffered per subscriber before it lags
+        broadcasts: Running generations by key
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self.broadcasts: Dict[str, Broadcast] = {}
+
+    async def subscribe(self, key: str, factory: Callable[[], AsyncGenerator]) -> AsyncGenerator:
+        """
+        Yields the frames of the generation for key, starting it if needed.
+
+        Args:
+            key: Hub key from turn_key()
+            factory: Creates the source generator when no broadcast is running
+
+        Yields:
+            Frames from the shared generation, starting with the first frame
+        """
+        broadcast = self.broadcasts.get(key)
+        if broadcast is None or broadcast.done:
+            broadcast = Broadcast(key, factory(), self.queue_size)
+            self.broadcasts[key] = broadcast
+            broadcast.task = asyncio.create_task(broadcast.run())
+            broadcast.task.add_done_callback(lambda _: self._release(broadcast))
+        else:
+            logger.info(f"Attaching subscriber to running generation {key}")
+
+        frames = broadcast.subscribe()
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            await frames.aclose()
+            if not broadcast.subscribers and not broadcast.done:
+                # Nobody is listening anymore, stop the upstream generation
+                logger.info(f"Last subscriber left generation {key}, cancelling")
+                broadcast.task.cancel()
+
+    def _release(self, broadcast: Broadcast) -> None:
+        if self.broadcasts.get(broadcast.key) is broadcast:
+            del self.broadcasts[broadcast.key]
+
+    def active_count(self) -> int:
+        return len(self.broadcasts)
+
+
+stream_hub = StreamHub()
@@ -2,9 +2,23 @@
 
 DEFAULT_THINKING_MODE = "balanced"
 
+# "slo" is used by the auto model router: minimum quality tier, p95 time to
+# first token (seconds), maximum error rate and how much cost counts
 THINKING_MODES = {
-    "balanced": {"model": "openai", "system_add": ""},
-    "concise": {"model": "openai", "system_add": " Be extremely concise."},
-    "reason": {"model": "mistral", "system_add": " Use step-by-step reasoning."},
-    "deep": {"model": "llama", "system_add": " Provide deep, detailed analysis."}
+    "balanced": {
+        "model": "openai", "system_add": "",
+        "slo": {"min_quality": 2, "ttft_p95": 8.0, "max_error_rate": 0.15, "cost_weight": 0.5}
+    },
+    "concise": {
+        "model": "openai", "system_add": " Be extremely concise.",
+        "slo": {"min_quality": 1, "ttft_p95": 4.0, "max_error_rate": 0.2, "cost_weight": 1.0}
+    },
+    "reason": {
+        "model": "mistral", "system_add": " Use step-by-step reasoning.",
+        "slo": {"min_quality": 3, "ttft_p95": 15.0, "max_error_rate": 0.15, "cost_weight": 0.2}
+    },
+    "deep": {
+        "model": "llama", "system_add": " Provide deep, detailed analysis.",
+        "slo": {"min_quality": 3, "ttft_p95": 20.0, "max_error_rate": 0.15, "cost_weight": 0.1}
+    }
 }
@@ -9,18 +9,22 @@ Key features:
 - Periodic heartbeats every 10 seconds during streaming
 - Timeout enforcement at 50 seconds (10 second buffer before Vercel's 60s limit)
 - Graceful stream termination with duration tracking
+- Optional checkpointing shortly before the deadline so the response can be
+  resumed in a follow-up invocation
 """
 
 import asyncio
 import json
 import time
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Callable, Optional
 
 
 async def with_timeout_protection(
     generator: AsyncGenerator,
     max_duration: int = 50,
-    heartbeat_interval: int = 10
+    heartbeat_interval: int = 10,
+    checkpoint_callback: Optional[Callable[[float], Optional[dict]]] = None,
+    checkpoint_margin: float = 5
 ) -> AsyncGenerator:
     """
     Wraps an async generator with timeout and heartbeat management.
@@ -36,6 +40,11 @@ async def with_timeout_protection(
         generator: Source async generator that yields SSE-formatted chunks
         max_duration: Maximum duration in seconds before forced termination (default: 50)
         heartbeat_interval: Interval in seconds between heartbeat messages (default: 10)
+        checkpoint_callback: Called with the elapsed time when the deadline is
+            reached; the returned dict is merged into the timeout message
+            (e.g. a continuation token). Enables checkpointing mode.
+        checkpoint_margin: Seconds before max_duration at which to checkpoint,
+            leaving time to persist state (default: 5)
         
     Yields:
         str: SSE-formatted chunks from the generator, heartbeat messages, or timeout messages
@@ -50,6 +59,9 @@ async def with_timeout_protection(
     """
     start_time = time.time()
     last_heartbeat = start_time
+    deadline = max_duration
+    if checkpoint_callback is not None:
+        deadline = max(0, max_duration - checkpoint_margin)
     
     # Send immediate heartbeat to prevent Vercel timeout
     yield ": heartbeat\n\n"
@@ -60,12 +72,18 @@ async def with_timeout_protection(
             elapsed = current_time - start_time
             
             # Check if we've exceeded the maximum duration
-            if elapsed > max_duration:
-                yield f"data: {json.dumps({
+            if elapsed > deadline:
+                # The chunk that crossed the deadline is already pulled from the
+                # generator: pass it on first, so the checkpoint includes it
+                yield chunk
+                timeout_message = {
                     'type': 'timeout',
                     'content': 'Request exceeded time limit',
                     'elapsed': elapsed
-                })}\n\n"
+                }
+                if checkpoint_callback is not None:
+                    timeout_message.update(checkpoint_callback(elapsed) or {})
+                yield f"data: {json.dumps(timeout_message)}\n\n"
                 break
             
             # Send periodic heartbeat to keep connection alive
@@ -0,0 +1,266 @@
+"""
+Time Series Module
+
+This module keeps recent admin analytics in fixed-size ring buffers, so the
+admin dashboard can show what happened in the last minutes or hours instead
+of only lifetime counters. There is one ring per resolution (per second for
+the last five minutes, per minute for the last day); every slot remembers
+which interval it belongs to and is zeroed when the ring wraps around, so
+memory is constant and no cleanup task is needed.
+
+Each slot holds counters (requests, errors, tokens, cache hits and lookups)
+and a small latency histogram; p50/p95 are read from the merged histograms
+of a window (bucket upper bound, like Prometheus' histogram_quantile without
+interpolation).
+
+Key features:
+- array-backed rings, constant memory (about 320 KB with the defaults)
+- Window queries ("30s", "15m", "1h", "24h") with per-slot points and a summary
+- Error rate, cache hit rate and p50/p95 latency per slot and per window
+- Compact binary snapshot (zlib) to persist the rings across cold starts
+"""
+
+import math
+import struct
+import sys
+import time
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional, Union
+
+# Latency histogram upper bounds in milliseconds (the last bucket is open)
+LATENCY_BUCKETS_MS = [50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 30000, 60000, math.inf]
+
+FIELDS = ("requests", "errors", "tokens", "cache_hits", "cache_lookups")
+REQUESTS, ERRORS, TOKENS, CACHE_HITS, CACHE_LOOKUPS = range(len(FIELDS))
+
+SNAPSHOT_MAGIC = b"DUB5TS"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<6sHH")
+_SERIES_HEADER = struct.Struct("<dIHH")
+
+_WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(window: Union[str, int, float]) -> float:
+    """Parses "90", "30s", "15m", "1h" or "1d" into seconds."""
+    if isinstance(window, (int, float)):
+        seconds = float(window)
+    else:
+        text = str(window).strip().lower()
+        unit = _WINDOW_UNITS.get(text[-1:]) if text else None
+        try:
+            seconds = float(text[:-1]) * unit if unit else float(text)
+        except ValueError:
+            raise ValueError(f"Invalid window: {window!r}")
+    if seconds <= 0 or math.isinf(seconds) or math.isnan(seconds):
+        raise ValueError(f"Invalid window: {window!r}")
+    return seconds
+
+
+def _latency_bucket(latency: float) -> int:
+    latency_ms = latency * 1000
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS) - 1
+
+
+def _percentile(histogram: List[int], q: float) -> Optional[float]:
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for bound, n in zip(LATENCY_BUCKETS_MS, histogram):
+        cumulative += n
+        if cumulative >= rank:
+            # Open bucket: report the largest finite bound
+            return float(bound if bound != math.inf else LATENCY_BUCKETS_MS[-2])
+    return float(LATENCY_BUCKETS_MS[-2])
+
+
+def _summarize(counts: List[int], histogram: List[int]) -> Dict[str, Any]:
+    requests, errors, tokens, cache_hits, cache_lookups = counts
+    return {
+        "requests": requests,
+        "errors": errors,
+        "tokens": tokens,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "cache_hit_rate": round(cache_hits / cache_lookups, 4) if cache_lookups else None,
+        "p50_ms": _percentile(histogram, 0.5),
+        "p95_ms": _percentile(histogram, 0.95)
+    }
+
+
+class RingSeries:
+    """
+    Ring buffer of fixed-width time slots.
+
+    Attributes:
+        resolution: Slot width in seconds
+        slots: Number of slots (covers resolution * slots seconds)
+        stamps: Interval index each slot currently holds (-1: never used)
+        counters: FIELDS counters per slot, flattened
+        latency: LATENCY_BUCKETS_MS counts per slot, flattened
+    """
+
+    def __init__(self, resolution: float, slots: int):
+        self.resolution = resolution
+        self.slots = slots
+        self.stamps = array("q", [-1]) * slots
+        self.counters = array("q", [0]) * (slots * len(FIELDS))
+        self.latency = array("q", [0]) * (slots * len(LATENCY_BUCKETS_MS))
+
+    def _slot(self, now: float) -> int:
+        index = int(now // self.resolution)
+        pos = index % self.slots
+        if self.stamps[pos] != index:
+            # Slot of an older interval: reuse it for this one
+            self.stamps[pos] = index
+            base = pos * len(FIELDS)
+            self.counters[base:base + len(FIELDS)] = array("q", [0]) * len(FIELDS)
+            base = pos * len(LATENCY_BUCKETS_MS)
+            self.latency[base:base + len(LATENCY_BUCKETS_MS)] = array("q", [0]) * len(LATENCY_BUCKETS_MS)
+        return pos
+
+    def add(self, now: float, field: int, amount: int = 1):
+        self.counters[self._slot(now) * len(FIELDS) + field] += amount
+
+    def add_latency(self, now: float, latency: float):
+        self.latency[self._slot(now) * len(LATENCY_BUCKETS_MS) + _latency_bucket(latency)] += 1
+
+    def query(self, now: float, count: int) -> Dict[str, Any]:
+        """Points for the last `count` slots (oldest first) and their summary."""
+        count = max(1, min(int(count), self.slots))
+        current = int(now // self.resolution)
+        points = []
+        totals = [0] * len(FIELDS)
+        merged = [0] * len(LATENCY_BUCKETS_MS)
+        for index in range(current - count + 1, current + 1):
+            pos = index % self.slots
+            if self.stamps[pos] == index:
+                base = pos * len(FIELDS)
+                counts = list(self.counters[base:base + len(FIELDS)])
+                base = pos * len(LATENCY_BUCKETS_MS)
+                histogram = list(self.latency[base:base + len(LATENCY_BUCKETS_MS)])
+            else:
+                counts = [0] * len(FIELDS)
+                histogram = [0] * len(LATENCY_BUCKETS_MS)
+            for i, n in enumerate(counts):
+                totals[i] += n
+            for i, n in enumerate(histogram):
+                merged[i] += n
+            points.append({"t": index * self.resolution, **_summarize(counts, histogram)})
+        return {"resolution": self.resolution, "points": points, "summary": _summarize(totals, merged)}
+
+
+class TimeSeriesStore:
+    """
+    Per-second and per-minute rings fed with the same events.
+
+    Attributes:
+        seconds: Per-second ring (default: last 5 minutes)
+        minutes: Per-minute ring (default: last 24 hours)
+    """
+
+    def __init__(self, second_slots: int = 300, minute_slots: int = 1440, clock=time.time):
+        self.seconds = RingSeries(1, second_slots)
+        self.minutes = RingSeries(60, minute_slots)
+        self.clock = clock
+
+    @property
+    def series(self) -> List[RingSeries]:
+        return [self.seconds, self.minutes]
+
+    def record(self, tokens: int = 0, is_error: bool = False, latency: Optional[float] = None):
+        """
+        Records tokens; with a latency it also counts a finished request.
+
+        Args:
+            tokens: Tokens to add
+            is_error: Whether the finished request failed
+            latency: Duration of a finished request in seconds
+        """
+        now = self.clock()
+        for ring in self.series:
+            if tokens:
+                ring.add(now, TOKENS, tokens)
+            if latency is not None:
+                ring.add(now, REQUESTS)
+                ring.add_latency(now, latency)
+                if is_error:
+                    ring.add(now, ERRORS)
+
+    def record_cache(self, hit: bool):
+        now = self.clock()
+        for ring in self.series:
+            ring.add(now, CACHE_LOOKUPS)
+            if hit:
+                ring.add(now, CACHE_HITS)
+
+    def query(self, window: Union[str, int, float] = "1h") -> Dict[str, Any]:
+        """
+        Returns the points and summary of a window.
+
+        The per-second ring answers windows it covers; longer windows use the
+        per-minute ring (capped at its length).
+        """
+        seconds = parse_window(window)
+        ring = self.seconds if seconds <= self.seconds.resolution * self.seconds.slots else self.minutes
+        result = ring.query(self.clock(), math.ceil(seconds / ring.resolution))
+        result["window"] = seconds
+        return result
+
+    def snapshot(self) -> bytes:
+        """Serializes all rings into a compact binary snapshot."""
+        parts = [_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(self.series))]
+        for ring in self.series:
+            parts.append(_SERIES_HEADER.pack(ring.resolution, ring.slots, len(FIELDS), len(LATENCY_BUCKETS_MS)))
+            for data in (ring.stamps, ring.counters, ring.latency):
+                if sys.byteorder != "little":
+                    data = array(data.typecode, data)
+                    data.byteswap()
+                parts.append(data.tobytes())
+        return zlib.compress(b"".join(parts), 6)
+
+    def restore(self, blob: bytes):
+        """
+        Loads a snapshot made by snapshot().
+
+        Raises:
+            ValueError: When the snapshot is corrupt or has another layout
+        """
+        try:
+            raw = zlib.decompress(blob)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt snapshot: {e}")
+        if len(raw) < _HEADER.size:
+            raise ValueError("Corrupt snapshot: truncated header")
+        magic, version, count = _HEADER.unpack_from(raw, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or count != len(self.series):
+            raise ValueError("Snapshot has an unsupported format")
+        offset = _HEADER.size
+        restored = []
+        for ring in self.series:
+            if len(raw) < offset + _SERIES_HEADER.size:
+                raise ValueError("Corrupt snapshot: truncated series")
+            layout = _SERIES_HEADER.unpack_from(raw, offset)
+            if layout != (ring.resolution, ring.slots, len(FIELDS), len(LATENCY_BUCKETS_MS)):
+                raise ValueError(f"Snapshot layout {layout} does not match this store")
+            offset += _SERIES_HEADER.size
+            arrays = []
+            for current in (ring.stamps, ring.counters, ring.latency):
+                size = len(current) * current.itemsize
+                if len(raw) < offset + size:
+                    raise ValueError("Corrupt snapshot: truncated data")
+                data = array(current.typecode)
+                data.frombytes(raw[offset:offset + size])
+                if sys.byteorder != "little":
+                    data.byteswap()
+                arrays.append(data)
+                offset += size
+            restored.append(arrays)
+        # Only swap in once everything parsed (never a half-restored store)
+        for ring, (stamps, counters, latency) in zip(self.series, restored):
+            ring.stamps, ring.counters, ring.latency = stamps, counters, latency
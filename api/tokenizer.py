@@ -0,0 +1,198 @@
+"""
+Tokenizer Module
+
+This module provides a pure-Python byte-level BPE token counter used for
+analytics and context budgeting. Merge tables are loaded from a local vocab
+file (no network access), and counts are memoized so repeated history
+messages cost a dictionary lookup instead of a re-encode.
+
+Only one encoding ships today: every model in MODEL_ENCODINGS maps to
+dub5-bpe, so counts are the same for all models and only approximate the
+provider's own tokenizer. The mapping is the place to add a model-specific
+vocab later.
+
+Key features:
+- GPT-style pre-tokenization followed by byte-level BPE merges
+- Per-model encodings resolved through MODEL_ENCODINGS
+- Per-word cache for the BPE step and an LRU memo keyed by content hash
+- Long pre-tokens are split into bounded pieces (linear time on crafted input)
+- Batch counting of a whole message list in one pass
+- Character-based estimate if the vocab file cannot be loaded
+"""
+
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+# Encoding name -> vocab file with the BPE merge table
+ENCODINGS = {
+    "dub5-bpe": DATA_DIR / "token_vocab.json",
+}
+
+DEFAULT_ENCODING = "dub5-bpe"
+
+# Model -> encoding; models not listed use DEFAULT_ENCODING
+MODEL_ENCODINGS = {
+    "gpt-4o": "dub5-bpe",
+    "gpt-4o-mini": "dub5-bpe",
+    "openai": "dub5-bpe",
+    "mistral": "dub5-bpe",
+    "llama": "dub5-bpe",
+    "deepseek": "dub5-bpe",
+    "claude-3-haiku": "dub5-bpe",
+}
+
+# Pre-tokenizer: contractions, words with a leading space, short digit runs,
+# punctuation runs and whitespace (GPT-2 style, using stdlib re classes)
+PRETOKENIZE_PATTERN = r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+"""
+
+# Longer pre-tokens (whitespace runs, very long "words") are counted in pieces
+# of this size: the BPE merge loop is quadratic in the length of its input
+MAX_PRETOKEN_CHARS = 64
+
+# Chat formatting overhead (per message and for priming the reply)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+def content_hash(text: str) -> bytes:
+    """Returns a compact digest used as memo key for a text."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class BPETokenizer:
+    """
+    Byte-level BPE token counter for one encoding.
+
+    Attributes:
+        name: Encoding name
+        ranks: Merge rank per symbol pair (lower merges first)
+        memo_size: Maximum number of texts kept in the LRU memo
+    """
+
+    def __init__(self, name: str, merges: List[List[str]], pattern: str = PRETOKENIZE_PATTERN, memo_size: int = 4096):
+        self.name = name
+        self.ranks: Dict[tuple, int] = {(a, b): i for i, (a, b) in enumerate(merges)}
+        self.pattern = re.compile(pattern)
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[bytes, int]" = OrderedDict()
+        self._word_cache: Dict[str, int] = {}
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    @classmethod
+    def from_file(cls, name: str, path: Path) -> "BPETokenizer":
+        with open(path, "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        return cls(name, vocab["merges"], vocab.get("pattern", PRETOKENIZE_PATTERN))
+
+    def _bpe_count(self, word: str) -> int:
+        # Symbols are bytes mapped to latin-1 characters, matching the vocab file
+        symbols = list(word.encode("utf-8").decode("latin-1"))
+        ranks = self.ranks
+        while len(symbols) > 1:
+            best = None
+            best_rank = None
+            for i in range(len(symbols) - 1):
+                rank = ranks.get((symbols[i], symbols[i + 1]))
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best, best_rank = i, rank
+            if best is None:
+                break
+            symbols[best:best + 2] = [symbols[best] + symbols[best + 1]]
+        return len(symbols)
+
+    def _encode_count(self, text: str) -> int:
+        cache = self._word_cache
+        total = 0
+        for word in self.pattern.findall(text):
+            if len(word) > MAX_PRETOKEN_CHARS:
+                pieces = [word[i:i + MAX_PRETOKEN_CHARS] for i in range(0, len(word), MAX_PRETOKEN_CHARS)]
+            else:
+                pieces = (word,)
+            for piece in pieces:
+                count = cache.get(piece)
+                if count is None:
+                    count = self._bpe_count(piece)
+                    if len(cache) < 200_000:
+                        cache[piece] = count
+                total += count
+        return total
+
+    def count(self, text: str) -> int:
+        """
+        Counts the tokens in text, using the LRU memo for repeated texts.
+        """
+        if not text:
+            return 0
+        key = content_hash(text)
+        memo = self._memo
+        count = memo.get(key)
+        if count is not None:
+            memo.move_to_end(key)
+            self.memo_hits += 1
+            return count
+        self.memo_misses += 1
+        count = self._encode_count(text)
+        memo[key] = count
+        if len(memo) > self.memo_size:
+            memo.popitem(last=False)
+        return count
+
+    def count_batch(self, texts: Iterable[str]) -> List[int]:
+        """Counts several texts in one pass, sharing the memo and word cache."""
+        return [self.count(text) for text in texts]
+
+
+class EstimateTokenizer:
+    """Fallback counter (about four characters per token) when no vocab is available."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def count(self, text: str) -> int:
+        return (len(text) + 3) // 4 if text else 0
+
+    def count_batch(self, texts: Iterable[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+
+_tokenizers: Dict[str, object] = {}
+
+
+def get_tokenizer(model: Optional[str] = None):
+    """
+    Returns the (lazily loaded) tokenizer for a model.
+
+    Args:
+        model: Model name; unknown or missing models use DEFAULT_ENCODING
+
+    Returns:
+        BPETokenizer, or EstimateTokenizer if the vocab file cannot be loaded
+    """
+    encoding = MODEL_ENCODINGS.get(model, DEFAULT_ENCODING)
+    tokenizer = _tokenizers.get(encoding)
+    if tokenizer is None:
+        try:
+            tokenizer = BPETokenizer.from_file(encoding, ENCODINGS[encoding])
+        except Exception as e:
+            logger.warning(f"Could not load token vocab for {encoding}, using estimate: {e}")
+            tokenizer = EstimateTokenizer(encoding)
+        _tokenizers[encoding] = tokenizer
+    return tokenizer
+
+
+def message_text(message) -> str:
+    """Returns the countable text of a chat message content field."""
+    content = message.get("content", "") if isinstance(message, dict) else message
+    if isinstance(content, str):
+        return content
+    return json.dumps(content)
@@ -0,0 +1,257 @@
+"""
+Tracing Module
+
+This module records where the time of a chat request goes. A Trace is
+carried in a contextvar from the ASGI middleware through the endpoint, the
+prompt building and the streaming generators (tasks copy the context, so
+the stream sees the trace of the request that started it). Code marks its
+stages with span() or record(); when no trace is active both are a single
+contextvar lookup.
+
+Stages that finish before the response starts (body, validation, admission,
+prompt, RAG, files) are sent in a Server-Timing header; the streaming stages
+(queue, connect, TTFT, streaming) follow in a final SSE "timing" event.
+A sample of the finished traces is kept in memory and optionally appended
+to a JSON lines file.
+
+Key features:
+- Request-scoped Trace in a contextvar, no-op outside traced requests
+- Pure ASGI middleware: measures body receive and parse/validation time
+  and injects Server-Timing into the response headers
+- Spans with start offset, duration and an optional description
+- Sampled export to a bounded in-memory buffer and a JSON lines file
+"""
+
+import json
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class Span:
+    """One timed stage of a trace (times in seconds, relative to the trace start)."""
+
+    __slots__ = ("name", "start", "duration", "desc")
+
+    def __init__(self, name: str, start: float, duration: float, desc: str = ""):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.desc = desc
+
+    def to_dict(self) -> Dict[str, Any]:
+        span = {"name": self.name, "start_ms": round(self.start * 1000, 2), "dur_ms": round(self.duration * 1000, 2)}
+        if self.desc:
+            span["desc"] = self.desc
+        return span
+
+
+class Trace:
+    """
+    Timings of one request.
+
+    Attributes:
+        trace_id: Random id (also sent to the client in the timing event)
+        name: What is traced, e.g. "POST /api/chatbot"
+        start: perf_counter() at request arrival
+        sampled: Whether the finished trace is exported
+        spans: Recorded stages, in completion order
+        attrs: Extra fields for the export (model, status, ...)
+    """
+
+    def __init__(self, name: str = "", sampled: bool = False):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.sampled = sampled
+        self.spans: List[Span] = []
+        self.attrs: Dict[str, Any] = {}
+        self.body_done: Optional[float] = None
+        self.end: Optional[float] = None
+
+    def add(self, name: str, start: float, duration: float, desc: str = ""):
+        """Adds a stage; start is a perf_counter() value."""
+        self.spans.append(Span(name, start - self.start, duration, desc))
+
+    def elapsed(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def server_timing(self) -> str:
+        """Server-Timing header value for the stages recorded so far."""
+        parts = []
+        for span in self.spans:
+            part = span.name
+            if span.desc:
+                part += f';desc="{span.desc}"'
+            parts.append(f"{part};dur={span.duration * 1000:.1f}")
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def timing_event(self) -> Dict[str, Any]:
+        """Payload of the final SSE timing event."""
+        return {
+            "type": "timing",
+            "trace_id": self.trace_id,
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.wall_start,
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "spans": [span.to_dict() for span in self.spans],
+            **self.attrs
+        }
+
+
+@contextmanager
+def span(name: str, desc: str = "") -> Iterator[None]:
+    """Times the enclosed block as a stage of the current trace (if any)."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start, desc)
+
+
+def record(name: str, start: float, desc: str = ""):
+    """Adds a stage that began at perf_counter() value `start` and ends now."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, start, time.perf_counter() - start, desc)
+
+
+def annotate(**attrs: Any):
+    """Adds fields (model, provider, status, ...) to the current trace export."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+class TraceExporter:
+    """
+    Keeps sampled traces in memory and appends them to a JSON lines file.
+
+    Attributes:
+        sample_rate: Fraction of traces that is exported (0 disables export)
+        path: JSON lines file ("" keeps traces in memory only)
+        recent: Last exported traces (bounded)
+    """
+
+    def __init__(self, sample_rate: float = 0.0, path: str = "", capacity: int = 200):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.exported = 0
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def export(self, trace: Trace):
+        if not trace.sampled:
+            return
+        data = trace.to_dict()
+        self.recent.append(data)
+        self.exported += 1
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(data) + "\n")
+            except OSError as e:
+                logger.warning(f"Trace not written to {self.path}: {e}")
+
+    def jsonl(self) -> str:
+        return "".join(json.dumps(data) + "\n" for data in self.recent)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that traces requests to the given paths.
+
+    The body span covers receiving the request body; "validate" runs from the
+    complete body until the endpoint starts (JSON parsing and pydantic
+    validation happen there). Server-Timing is added to the response headers.
+    """
+
+    def __init__(self, app, paths: Sequence[str], exporter: TraceExporter, server_timing: bool = True):
+        self.app = app
+        self.paths = set(paths)
+        self.exporter = exporter
+        self.server_timing = server_timing
+
+    def _traced(self, scope) -> bool:
+        if scope["type"] != "http":
+            return False
+        path = scope.get("path", "")
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            return path in self.paths or path[len(root_path):] in self.paths
+        return path in self.paths
+
+    async def __call__(self, scope, receive, send):
+        if not self._traced(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope.get('method', '')} {scope.get('path', '')}", sampled=self.exporter.should_sample())
+        token = current_trace.set(trace)
+        body_start = None
+
+        async def timed_receive():
+            nonlocal body_start
+            message = await receive()
+            if message["type"] == "http.request":
+                if body_start is None:
+                    body_start = trace.start
+                if not message.get("more_body", False):
+                    now = time.perf_counter()
+                    trace.add("body", body_start, now - body_start)
+                    trace.body_done = now
+            return message
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                trace.attrs["status"] = message.get("status")
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    # Browsers only expose Server-Timing cross-origin with this header
+                    headers.append((b"timing-allow-origin", b"*"))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, timed_receive, timed_send)
+        finally:
+            trace.end = time.perf_counter()
+            current_trace.reset(token)
+            self.exporter.export(trace)
+
+
+def mark_endpoint_start():
+    """
+    Called first thing in a traced endpoint: closes the "validate" stage
+    (from the complete body until the endpoint runs).
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return
+    if trace.body_done is not None:
+        trace.add("validate", trace.body_done, time.perf_counter() - trace.body_done)
@@ -0,0 +1,43 @@
+"""
+Benchmark: prompt-complexity classifier overhead per request.
+
+Measures api/complexity_classifier.py predict() on prompts of increasing
+size (long prompts are only scanned up to max_chars) and prints the
+per-call latency.
+
+Usage: python scripts/bench_complexity_classifier.py [iterations]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from api.complexity_classifier import ComplexityClassifier
+
+PROMPTS = {
+    "greeting": "hoi!",
+    "question": "Hoe werkt een warmtepomp en is het de moeite waard voor een rijtjeshuis?",
+    "code": "Fix this error in my Flask app:\n```python\n@app.route('/')\ndef index():\n    return users['name']\n```\nKeyError: 'name'",
+    "essay (2k chars)": "Schrijf een uitgebreide analyse van de Gouden Eeuw. " * 40,
+    "document (50k chars)": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 900,
+}
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    classifier = ComplexityClassifier.from_file()
+    print(f"{'prompt':<22}{'chars':>8}{'us/call':>10}  prediction")
+    for name, prompt in PROMPTS.items():
+        classifier.predict(prompt)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            prediction = classifier.predict(prompt)
+        per_call = (time.perf_counter() - start) / iterations * 1e6
+        print(f"{name:<22}{len(prompt):>8}{per_call:>10.1f}  {prediction.thinking_mode} ({prediction.confidence:.2f})")
+
+
+if __name__ == "__main__":
+    main()
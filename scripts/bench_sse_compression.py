@@ -0,0 +1,159 @@
+"""
+Benchmark: bytes on the wire and CPU cost of SSE stream compression.
+
+Simulates a typical coder-personality answer (multi-file HTML/CSS/JS)
+streamed as token-sized chunk events, and compares:
+- identity (no compression)
+- gzip with a sync flush after every frame
+- gzip with sync flushes at coalesced frame boundaries (N frames per flush)
+- gzip of the whole body (lower bound, not streamable)
+
+Usage: python scripts/bench_sse_compression.py [repeats]
+"""
+
+import gzip
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from api.compression import StreamCompressor
+
+CODER_ANSWER = '''BEGIN_FILE:index.html
+```html
+<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>Task Board</title>
+  <link rel="stylesheet" href="style.css">
+</head>
+<body>
+  <header class="app-header">
+    <h1>Task Board</h1>
+    <button id="add-task" class="btn btn-primary" aria-label="Add task">Add task</button>
+  </header>
+  <main class="board">
+    <section class="column" data-status="todo"><h2>To do</h2><ul class="task-list"></ul></section>
+    <section class="column" data-status="doing"><h2>In progress</h2><ul class="task-list"></ul></section>
+    <section class="column" data-status="done"><h2>Done</h2><ul class="task-list"></ul></section>
+  </main>
+  <script src="script.js"></script>
+</body>
+</html>
+```
+END_FILE
+BEGIN_FILE:style.css
+```css
+* { box-sizing: border-box; margin: 0; padding: 0; }
+body { font-family: system-ui, sans-serif; background: #f4f5f7; color: #172b4d; }
+.app-header { display: flex; justify-content: space-between; align-items: center; padding: 1rem 2rem; background: #0052cc; color: #fff; }
+.btn { border: none; border-radius: 4px; padding: 0.5rem 1rem; cursor: pointer; font-size: 1rem; }
+.btn-primary { background: #fff; color: #0052cc; }
+.board { display: grid; grid-template-columns: repeat(3, 1fr); gap: 1rem; padding: 2rem; }
+.column { background: #ebecf0; border-radius: 6px; padding: 1rem; min-height: 300px; }
+.task-list { list-style: none; display: flex; flex-direction: column; gap: 0.5rem; }
+.task { background: #fff; border-radius: 4px; padding: 0.75rem; box-shadow: 0 1px 2px rgba(9, 30, 66, 0.25); }
+@media (max-width: 768px) { .board { grid-template-columns: 1fr; } }
+```
+END_FILE
+BEGIN_FILE:script.js
+```javascript
+// Task board with local storage persistence
+const STORAGE_KEY = 'task-board';
+
+function loadTasks() {
+  try {
+    return JSON.parse(localStorage.getItem(STORAGE_KEY)) || [];
+  } catch (error) {
+    console.error('Could not load tasks', error);
+    return [];
+  }
+}
+
+function saveTasks(tasks) {
+  localStorage.setItem(STORAGE_KEY, JSON.stringify(tasks));
+}
+
+function renderTasks(tasks) {
+  document.querySelectorAll('.column').forEach((column) => {
+    const list = column.querySelector('.task-list');
+    list.innerHTML = '';
+    tasks.filter((task) => task.status === column.dataset.status).forEach((task) => {
+      const item = document.createElement('li');
+      item.className = 'task';
+      item.textContent = task.title;
+      item.draggable = true;
+      item.addEventListener('dragstart', (event) => event.dataTransfer.setData('text/plain', task.id));
+      list.appendChild(item);
+    });
+  });
+}
+
+document.getElementById('add-task').addEventListener('click', () => {
+  const title = prompt('Task title');
+  if (!title) return;
+  const tasks = loadTasks();
+  tasks.push({ id: Date.now().toString(), title, status: 'todo' });
+  saveTasks(tasks);
+  renderTasks(tasks);
+});
+
+renderTasks(loadTasks());
+```
+END_FILE
+'''
+
+
+def make_frames(text, seed=0):
+    """Splits text into token-sized chunks framed as SSE chunk events."""
+    rng = random.Random(seed)
+    frames = []
+    i = 0
+    while i < len(text):
+        size = rng.randint(2, 8)
+        frames.append(f"data: {json.dumps({'type': 'chunk', 'content': text[i:i + size]})}\n\n".encode("utf-8"))
+        i += size
+    return frames
+
+
+def run_streaming(frames, per_flush):
+    compressor = StreamCompressor("gzip")
+    total = 0
+    for i in range(0, len(frames), per_flush):
+        total += len(compressor.compress(b"".join(frames[i:i + per_flush])))
+    return total + len(compressor.finish())
+
+
+def measure(fn, repeats):
+    start = time.process_time()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.process_time() - start) / repeats
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    answer = CODER_ANSWER * 2  # ~6 KB, a typical multi-file answer
+    frames = make_frames(answer)
+    raw = sum(len(f) for f in frames)
+
+    print(f"Answer: {len(answer)} chars, {len(frames)} frames, {raw} bytes uncompressed SSE")
+    print(f"{'mode':<28}{'bytes':>10}{'ratio':>9}{'cpu ms':>10}{'us/frame':>10}")
+
+    rows = [("identity", lambda: raw)]
+    for per_flush in (1, 4, 16, 64):
+        rows.append((f"gzip sync flush / {per_flush} frames", lambda n=per_flush: run_streaming(frames, n)))
+    rows.append(("gzip whole body", lambda: len(gzip.compress(b"".join(frames), 6))))
+
+    for name, fn in rows:
+        size, cpu = measure(fn, repeats)
+        print(f"{name:<28}{size:>10}{raw / size:>8.1f}x{cpu * 1000:>10.3f}{cpu * 1e6 / len(frames):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: token counting throughput on a ~100k-token chat history.
+
+Compares the BPE counter in api/tokenizer.py in three states:
+- cold: fresh tokenizer, every word goes through the BPE merge loop
+- warm words: word cache filled, but the texts themselves are new
+- memo: the same history counted again (next turn of the conversation)
+and the old len(text.split()) placeholder as a baseline.
+
+Usage: python scripts/bench_token_counter.py [target_tokens]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from api.tokenizer import BPETokenizer, ENCODINGS, DEFAULT_ENCODING
+from api.context_manager import count_messages_tokens
+
+
+def build_history(target_tokens, tokenizer):
+    sources = [p.read_text(encoding="utf-8", errors="ignore") for p in sorted(ROOT.glob("docs/*.md"))]
+    sources += [(ROOT / "public" / "chatbot.html").read_text(encoding="utf-8", errors="ignore")]
+    messages = []
+    total = 0
+    turn = 0
+    while total < target_tokens:
+        text = sources[turn % len(sources)]
+        # Vary every message so texts are distinct (no memo hits on the cold run)
+        offset = (turn * 997) % max(1, len(text) - 4000)
+        content = f"[turn {turn}] " + text[offset:offset + 4000]
+        messages.append({"role": "user" if turn % 2 == 0 else "assistant", "content": content})
+        total += tokenizer.count(content)
+        turn += 1
+    return messages
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    path = ENCODINGS[DEFAULT_ENCODING]
+    messages = build_history(target, BPETokenizer.from_file(DEFAULT_ENCODING, path))
+    texts = [m["content"] for m in messages]
+    chars = sum(len(t) for t in texts)
+
+    cold = BPETokenizer.from_file(DEFAULT_ENCODING, path)
+    tokens, t_cold = timed(lambda: sum(cold.count_batch(texts)))
+
+    warm = BPETokenizer.from_file(DEFAULT_ENCODING, path)
+    warm._word_cache = dict(cold._word_cache)
+    _, t_warm = timed(lambda: sum(warm.count_batch(texts)))
+
+    _, t_memo = timed(lambda: sum(cold.count_batch(texts)))
+    _, t_split = timed(lambda: sum(len(t.split()) for t in texts))
+    _, t_messages = timed(lambda: count_messages_tokens(messages))
+
+    print(f"History: {len(messages)} messages, {chars} chars, {tokens} tokens")
+    print(f"{'mode':<22}{'ms':>10}{'tokens/s':>14}")
+    for name, seconds in [
+        ("cold", t_cold),
+        ("warm words", t_warm),
+        ("memo (next turn)", t_memo),
+        ("messages API (cold)", t_messages),
+        ("split() baseline", t_split),
+    ]:
+        print(f"{name:<22}{seconds * 1000:>10.2f}{tokens / seconds:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
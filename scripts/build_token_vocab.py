@@ -0,0 +1,91 @@
+"""
+Builds data/token_vocab.json, the BPE merge table used by api/tokenizer.py.
+
+Trains byte-level BPE merges on the text in this repository (docs, prompts,
+frontend code and backend code), which matches the mix of prose and
+HTML/CSS/JS/Python that flows through the chatbot.
+
+Usage: python scripts/build_token_vocab.py [num_merges]
+"""
+
+import json
+import re
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from api.tokenizer import PRETOKENIZE_PATTERN, ENCODINGS, DEFAULT_ENCODING
+
+CORPUS_GLOBS = ["docs/*.md", "README.md", "public/*.html", "api/*.py"]
+
+
+def load_word_counts():
+    pattern = re.compile(PRETOKENIZE_PATTERN)
+    counts = Counter()
+    for glob in CORPUS_GLOBS:
+        for path in sorted(ROOT.glob(glob)):
+            counts.update(pattern.findall(path.read_text(encoding="utf-8", errors="ignore")))
+    return counts
+
+
+def train(word_counts, num_merges):
+    words = [list(w.encode("utf-8").decode("latin-1")) for w in word_counts]
+    freqs = list(word_counts.values())
+
+    pair_counts = Counter()
+    pair_words = defaultdict(set)
+    for idx, symbols in enumerate(words):
+        for pair in zip(symbols, symbols[1:]):
+            pair_counts[pair] += freqs[idx]
+            pair_words[pair].add(idx)
+
+    merges = []
+    for _ in range(num_merges):
+        if not pair_counts:
+            break
+        pair, count = max(pair_counts.items(), key=lambda item: (item[1], item[0]))
+        if count < 2:
+            break
+        merges.append(list(pair))
+        merged = pair[0] + pair[1]
+
+        for idx in list(pair_words[pair]):
+            symbols = words[idx]
+            freq = freqs[idx]
+            for old in zip(symbols, symbols[1:]):
+                pair_counts[old] -= freq
+                if pair_counts[old] <= 0:
+                    del pair_counts[old]
+            new_symbols = []
+            i = 0
+            while i < len(symbols):
+                if i < len(symbols) - 1 and (symbols[i], symbols[i + 1]) == pair:
+                    new_symbols.append(merged)
+                    i += 2
+                else:
+                    new_symbols.append(symbols[i])
+                    i += 1
+            words[idx] = new_symbols
+            for new in zip(new_symbols, new_symbols[1:]):
+                pair_counts[new] += freq
+                pair_words[new].add(idx)
+        pair_words.pop(pair, None)
+
+    return merges
+
+
+def main():
+    num_merges = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    word_counts = load_word_counts()
+    merges = train(word_counts, num_merges)
+    out = ENCODINGS[DEFAULT_ENCODING]
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"name": DEFAULT_ENCODING, "pattern": PRETOKENIZE_PATTERN, "merges": merges}, f, ensure_ascii=True, separators=(",", ":"))
+    print(f"Wrote {len(merges)} merges from {len(word_counts)} distinct words to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Replay evaluation of the "auto" model router.
+
+Replays a trace of requests against routing policies and reports latency,
+errors, SLO violations and cost per policy. Each trace record holds the
+outcome every candidate model would have had at that moment, so policies can
+be compared on the same traffic:
+
+    {"t": 12.5, "thinking_mode": "balanced",
+     "outcomes": {"gpt-4o": {"ttft": 1.8, "ok": true}, "gpt-4o-mini": {"ttft": null, "ok": false}, ...}}
+
+Without a trace file a synthetic one is generated (log-normal latencies around
+the MODEL_PROFILES priors, with a slowdown and an error burst mid-way).
+
+Policies:
+- router: ModelRouter, learning only from the outcomes of the models it picked
+- fixed: the former if-chain (concise -> gpt-4o-mini, everything else -> gpt-4o)
+
+Usage: python scripts/eval_model_router.py [trace.jsonl] [--requests N] [--seed S]
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from api.model_router import ModelRouter, percentile
+from api.models import MODEL_PROFILES
+from api.thinking_modes import THINKING_MODES
+
+MODE_MIX = [("balanced", 0.6), ("concise", 0.2), ("reason", 0.1), ("deep", 0.1)]
+
+
+def synthetic_trace(requests, seed):
+    rng = random.Random(seed)
+    models = list(MODEL_PROFILES)
+    trace = []
+    for i in range(requests):
+        t = i * 2.0
+        phase = i / requests
+        mode = rng.choices([m for m, _ in MODE_MIX], weights=[w for _, w in MODE_MIX])[0]
+        outcomes = {}
+        for model in models:
+            median = MODEL_PROFILES[model]["prior_ttft"]
+            error_rate = 0.03
+            # Incident: the cheap tier slows down, gpt-4o throws errors
+            if 0.4 <= phase < 0.6 and model == "gpt-4o-mini":
+                median *= 6
+            if 0.6 <= phase < 0.8 and model == "gpt-4o":
+                error_rate = 0.5
+            ok = rng.random() >= error_rate
+            ttft = median * math.exp(rng.gauss(0, 0.4)) if ok else None
+            outcomes[model] = {"ttft": ttft, "ok": ok}
+        trace.append({"t": t, "thinking_mode": mode, "outcomes": outcomes})
+    return trace
+
+
+def load_trace(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def fixed_policy(mode):
+    return "gpt-4o-mini" if mode == "concise" else "gpt-4o"
+
+
+def evaluate(trace, policy):
+    now = {"t": 0.0}
+    router = ModelRouter(clock=lambda: now["t"])
+    ttfts, errors, violations, cost = [], 0, 0, 0.0
+    picks = {}
+
+    for record in trace:
+        now["t"] = record["t"]
+        mode = record["thinking_mode"]
+        if policy == "router":
+            model = router.route(mode).model
+        else:
+            model = fixed_policy(mode)
+        outcome = record["outcomes"][model]
+        router.record(model, outcome["ttft"], outcome["ok"])
+
+        picks[model] = picks.get(model, 0) + 1
+        cost += MODEL_PROFILES[model]["cost"]
+        slo = THINKING_MODES[mode]["slo"]
+        if not outcome["ok"]:
+            errors += 1
+            violations += 1
+        else:
+            ttfts.append(outcome["ttft"])
+            if outcome["ttft"] > slo["ttft_p95"]:
+                violations += 1
+
+    ttfts.sort()
+    n = len(trace)
+    return {
+        "p50": percentile(ttfts, 0.5),
+        "p95": percentile(ttfts, 0.95),
+        "errors": errors / n,
+        "slo_violations": violations / n,
+        "cost": cost / n,
+        "picks": picks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("trace", nargs="?", help="JSONL trace file (synthetic if omitted)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args.requests, args.seed)
+    print(f"Replaying {len(trace)} requests")
+    print(f"{'policy':<8}{'p50 s':>8}{'p95 s':>8}{'errors':>9}{'SLO miss':>10}{'cost':>8}  picks")
+    for policy in ("router", "fixed"):
+        r = evaluate(trace, policy)
+        picks = ", ".join(f"{m}={c}" for m, c in sorted(r["picks"].items(), key=lambda x: -x[1]))
+        print(f"{policy:<8}{r['p50']:>8.2f}{r['p95']:>8.2f}{r['errors']:>9.1%}{r['slo_violations']:>10.1%}{r['cost']:>8.2f}  {picks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Trains data/complexity_model.json, the prompt-complexity model used by
+api/complexity_classifier.py.
+
+The labelled seed prompts below (Dutch and English, like the chatbot's
+traffic) cover the four thinking modes:
+- concise: greetings, thanks, one-line facts
+- balanced: everyday questions that need a normal answer
+- reason: code, debugging, maths and logic (step-by-step work)
+- deep: long-form analysis, comparisons and essays
+
+Training is multinomial logistic regression with SGD on hashed features.
+Pass extra labelled data as JSONL ({"text": ..., "label": ...}) to extend it.
+
+Usage: python scripts/train_complexity_classifier.py [extra.jsonl]
+"""
+
+import json
+import math
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from api.complexity_classifier import MODEL_PATH, extract_features, hash_features
+
+CLASSES = ["concise", "balanced", "reason", "deep"]
+DIM = 4096
+EPOCHS = 40
+LEARNING_RATE = 0.3
+L2 = 1e-4
+MAX_CHARS = 600
+
+SEED_DATA = {
+    "concise": [
+        "hoi", "hallo", "hey", "hi", "hello", "goedemorgen", "good morning", "dank je", "bedankt!",
+        "thanks", "thank you so much", "ok", "oké top", "ja", "nee", "yes please", "no thanks",
+        "hoe gaat het?", "how are you?", "wie ben jij?", "who are you?", "wat is je naam?",
+        "hoe laat is het in Tokio?", "wat is de hoofdstad van Frankrijk?", "what is the capital of Spain?",
+        "hoeveel is 2+2?", "vertaal 'dog' naar het Nederlands", "translate 'huis' to English",
+        "doei", "bye", "goedenavond", "lol", "haha nice", "cool", "top, dankjewel", "prima",
+        "welke dag is het vandaag?", "wat betekent LOL?", "spell 'necessary'", "is a tomato a fruit?",
+    ],
+    "balanced": [
+        "hoe maak ik pannenkoeken?", "how do I make pancakes?", "wat is fotosynthese?",
+        "what is photosynthesis?", "geef me tips om beter te slapen", "give me some tips for better sleep",
+        "schrijf een korte mail aan mijn baas dat ik morgen later kom",
+        "write a short email to my landlord about a broken heater",
+        "wat zijn leuke dingen om te doen in Amsterdam?", "what are fun things to do in Rome?",
+        "leg uit wat een API is", "explain what a VPN does", "wat is het verschil tussen weer en klimaat?",
+        "wat is the difference between a virus and bacteria?", "hoe kan ik geld besparen op boodschappen?",
+        "schrijf een gedicht over de zee", "write a birthday message for my sister",
+        "welke boeken raad je aan over productiviteit?", "recommend a few sci-fi movies",
+        "hoe werkt een warmtepomp?", "how does a heat pump work?", "wat moet ik meenemen op vakantie?",
+        "maak een boodschappenlijst voor een week gezond eten", "give me a simple workout plan for beginners",
+        "wat is inflatie?", "what is a mortgage?", "hoe begin ik met hardlopen?", "vat deze alinea samen",
+        "help me met een naam voor mijn kat", "suggest a name for my bakery",
+    ],
+    "reason": [
+        "fix deze Python error: TypeError: 'NoneType' object is not subscriptable",
+        "why does my React component re-render infinitely with useEffect?",
+        "schrijf een functie in JavaScript die een array sorteert zonder sort()",
+        "write a Python function that checks if a string is a palindrome",
+        "los op: 3x + 5 = 20", "solve for x: 2x^2 - 8 = 0", "bereken de afgeleide van x^3 + 2x",
+        "what is the integral of sin(x) * x?", "bewijs dat de wortel van 2 irrationeel is",
+        "prove that there are infinitely many primes", "debug deze SQL query: SELECT * FROM users WHERE",
+        "```python\ndef add(a, b):\n    return a - b\n```\nwat is hier fout?",
+        "const x = arr.map(i => i * 2);\nwhy is x undefined?", "hoe implementeer ik een binary search tree in Java?",
+        "maak een HTML pagina met een formulier en validatie in JavaScript", "build a todo app with HTML, CSS and JS",
+        "een trein vertrekt om 14:05 en rijdt 120 km/u, wanneer komt hij aan na 300 km?",
+        "if all bloops are razzies and all razzies are lazzies, are all bloops lazzies?",
+        "optimaliseer deze functie, hij is O(n^2)", "refactor this class to use dependency injection",
+        "waarom krijg ik een CORS error bij mijn fetch request?", "explain step by step how quicksort works on [5,3,8,1]",
+        "schrijf een regex die e-mailadressen valideert", "convert this callback code to async/await",
+        "hoeveel combinaties zijn er met 5 dobbelstenen die samen 12 zijn?", "calculate the compound interest on 1000 at 5% for 10 years",
+        "<div class='box'></div> hoe centreer ik deze div?", "mijn docker container start niet: exit code 137",
+        "write unit tests for this function", "fix the bug: IndexError: list index out of range",
+    ],
+    "deep": [
+        "schrijf een uitgebreid essay over de gevolgen van de industriële revolutie",
+        "write a detailed essay on the causes of the first world war",
+        "vergelijk het economisch beleid van Keynes en Hayek grondig",
+        "compare in depth the political systems of the US and the Netherlands",
+        "analyseer de voor- en nadelen van kernenergie uitgebreid met bronnen",
+        "analyse the long-term impact of artificial intelligence on the labour market",
+        "geef een diepgaande analyse van de klimaatcrisis en mogelijke oplossingen",
+        "give a comprehensive overview of the history of the Roman empire",
+        "leg in detail uit hoe de architectuur van een moderne microservices applicatie werkt",
+        "explain thoroughly the philosophical differences between Kant and Nietzsche",
+        "schrijf een businessplan voor een duurzame kledingwinkel met marktanalyse",
+        "write a full research proposal about sleep and memory consolidation",
+        "wat zijn de ethische implicaties van genetische modificatie bij mensen? ga diep in op alle kanten",
+        "discuss the strengths and weaknesses of different approaches to monetary policy in detail",
+        "maak een uitgebreide vergelijking tussen PostgreSQL, MongoDB en Cassandra voor grote systemen",
+        "critically evaluate the arguments for and against universal basic income",
+        "schrijf een hoofdstuk voor mijn scriptie over sociale media en identiteit",
+        "provide an in-depth literature review on transformer models",
+        "analyseer dit gedicht uitgebreid: thema's, stijl, context en betekenis",
+        "give me a detailed strategic analysis of Tesla's competitive position",
+        "beschrijf uitgebreid de geschiedenis van de Nederlandse Gouden Eeuw en de nalatenschap",
+        "explain the full lifecycle of a star in great detail, from nebula to remnant",
+        "evalueer kritisch het onderwijsbeleid van de afgelopen twintig jaar",
+        "write a long, well-structured report on cybersecurity risks for hospitals",
+        "diepgaande analyse: waarom faalden de meeste dotcom bedrijven rond 2000?",
+        "compare and contrast capitalism and socialism with historical examples in depth",
+    ],
+}
+
+
+# Pasted context (mails, notes, documents) that users put under their question
+FILLER = (
+    "Beste allemaal, hierbij de notulen van het overleg van dinsdag. We hebben het gehad over de planning, "
+    "het budget en de taakverdeling voor het komende kwartaal. Dear team, please find attached the report "
+    "with the figures for last month and the open issues we still need to resolve before the deadline. "
+)
+
+
+def augment(data, seed=3):
+    # Light augmentation: casing and trailing punctuation vary a lot in chat,
+    # and anything with pasted context is never a one-liner
+    rng = random.Random(seed)
+    augmented = list(data)
+    for text, label in data:
+        augmented.append((text.capitalize(), label))
+        augmented.append((text.rstrip("?!."), label))
+        if label != "concise":
+            augmented.append((text + "\n\n" + FILLER * rng.randint(2, 40), label))
+    return augmented
+
+
+def load_data(extra_path=None):
+    data = [(text, label) for label, texts in SEED_DATA.items() for text in texts]
+    if extra_path:
+        with open(extra_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    data.append((record["text"], record["label"]))
+    return data
+
+
+def softmax(scores):
+    top = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def train(samples, seed=7):
+    rng = random.Random(seed)
+    vectors = [(hash_features(extract_features(text, MAX_CHARS), DIM), CLASSES.index(label)) for text, label in samples]
+    n = len(CLASSES)
+    bias = [0.0] * n
+    weights = {}
+    for epoch in range(EPOCHS):
+        rng.shuffle(vectors)
+        lr = LEARNING_RATE / (1 + epoch * 0.1)
+        for vector, target in vectors:
+            scores = list(bias)
+            for index, value in vector.items():
+                row = weights.get(index)
+                if row:
+                    for c in range(n):
+                        scores[c] += value * row[c]
+            probs = softmax(scores)
+            for c in range(n):
+                grad = probs[c] - (1.0 if c == target else 0.0)
+                bias[c] -= lr * grad
+                for index, value in vector.items():
+                    row = weights.setdefault(index, [0.0] * n)
+                    row[c] -= lr * (grad * value + L2 * row[c])
+    return bias, weights
+
+
+def accuracy(bias, weights, samples):
+    correct = 0
+    for text, label in samples:
+        scores = list(bias)
+        for index, value in hash_features(extract_features(text, MAX_CHARS), DIM).items():
+            row = weights.get(index)
+            if row:
+                for c in range(len(CLASSES)):
+                    scores[c] += value * row[c]
+        correct += CLASSES[scores.index(max(scores))] == label
+    return correct / len(samples)
+
+
+def main():
+    samples = load_data(sys.argv[1] if len(sys.argv) > 1 else None)
+
+    # Hold-out estimate (split before augmenting, so variants do not leak)
+    rng = random.Random(1)
+    shuffled = samples[:]
+    rng.shuffle(shuffled)
+    split = int(len(shuffled) * 0.8)
+    bias, weights = train(augment(shuffled[:split]))
+    print(f"Hold-out accuracy: {accuracy(bias, weights, shuffled[split:]):.1%} on {len(shuffled) - split} prompts")
+
+    samples = augment(samples)
+    bias, weights = train(samples)
+    print(f"Training accuracy: {accuracy(bias, weights, samples):.1%} on {len(samples)} prompts")
+    compact = {str(k): [round(w, 4) for w in row] for k, row in sorted(weights.items()) if any(abs(w) >= 1e-3 for w in row)}
+    with open(MODEL_PATH, "w", encoding="utf-8") as f:
+        json.dump(
+            {"name": "complexity-v1", "dim": DIM, "classes": CLASSES, "max_chars": MAX_CHARS,
+             "bias": [round(b, 4) for b in bias], "weights": compact},
+            f, separators=(",", ":")
+        )
+    print(f"Wrote {len(compact)} weight rows to {MODEL_PATH}")
+
+
+if __name__ == "__main__":
+    main()
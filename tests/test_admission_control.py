@@ -0,0 +1,325 @@
+"""
+Unit tests for the admission_control module.
+
+Tests verify:
+- The lag monitor records event-loop scheduling delay into its histogram
+- Requests are admitted below the thresholds and rejected above them
+- A short overload clears within the admission queue
+- Users over their stream cap are rejected at once; queued users are served fairly by weight
+- Session identities share a per-IP cap and only configured API keys count as identity
+- /api/chatbot answers 503 (saturated) or 429 (user cap) with Retry-After
+- Slots are released when a streaming body is never read
+- WebSocket streams and batch items are shed like /api/chatbot requests
+"""
+
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api.admission_control import AdmissionController, LagMonitor, Overloaded
+
+
+class TestLagMonitor:
+    """Tests for lag measurement."""
+
+    def test_histogram_buckets(self):
+        monitor = LagMonitor()
+        monitor.record(0.0005)
+        monitor.record(0.03)
+        monitor.record(5.0)
+        stats = monitor.get_stats()
+        assert stats["histogram"]["<=1ms"] == 1
+        assert stats["histogram"]["<=50ms"] == 1
+        assert stats["histogram"]["+inf"] == 1
+        assert stats["max_ms"] == 5000.0
+
+    @pytest.mark.anyio
+    async def test_blocked_loop_is_measured(self):
+        monitor = LagMonitor(interval=0.01)
+        monitor.ensure_started()
+        await asyncio.sleep(0.03)
+        time.sleep(0.08)  # Blocks the event loop
+        await asyncio.sleep(0.02)
+        monitor.stop()
+        assert monitor.max >= 0.05
+        assert monitor.current_lag() >= 0.05
+
+
+class TestAdmissionController:
+    """Tests for admission decisions."""
+
+    @pytest.mark.anyio
+    async def test_inflight_limit(self):
+        controller = AdmissionController(LagMonitor(), max_inflight=1, queue_timeout=0.05)
+        await controller.admit()
+        with pytest.raises(Overloaded) as exc:
+            await controller.admit()
+        assert exc.value.reason == "inflight"
+        assert controller.get_stats()["rejected"]["inflight"] == 1
+        controller.release()
+        await controller.admit()
+        assert controller.inflight == 1
+
+    @pytest.mark.anyio
+    async def test_lag_limit(self):
+        monitor = LagMonitor()
+        controller = AdmissionController(monitor, max_lag=0.1, queue_timeout=0.0, retry_after=7)
+        monitor.record(0.5)
+        with pytest.raises(Overloaded) as exc:
+            await controller.admit()
+        assert (exc.value.reason, exc.value.retry_after) == ("lag", 7)
+        assert controller.inflight == 0
+
+    @pytest.mark.anyio
+    async def test_queue_absorbs_short_overload(self):
+        controller = AdmissionController(LagMonitor(), max_inflight=1, queue_timeout=1.0, poll_interval=0.01)
+        await controller.admit()
+        asyncio.get_running_loop().call_later(0.05, controller.release)
+        await controller.admit()
+        assert controller.admitted == 2
+
+    @pytest.mark.anyio
+    async def test_track_releases_at_stream_end(self):
+        controller = AdmissionController(LagMonitor())
+        slot = await controller.admit()
+
+        async def stream():
+            yield "a"
+            yield "b"
+
+        assert [x async for x in slot.track(stream())] == ["a", "b"]
+        assert controller.inflight == 0
+
+    @pytest.mark.anyio
+    async def test_release_is_idempotent(self):
+        controller = AdmissionController(LagMonitor())
+        slot = await controller.admit("alice")
+        await controller.admit("alice")
+
+        async def stream():
+            yield "a"
+
+        tracked = slot.track(stream())
+        # Body never iterated: the guard releases, the stream end does not release again
+        slot.release()
+        assert [x async for x in tracked] == ["a"]
+        slot.release()
+        assert controller.inflight == 1
+        assert controller.user_load == {"alice": 1}
+
+
+class TestPerUserScheduling:
+    """Tests for per-user caps and weighted fair admission."""
+
+    @pytest.mark.anyio
+    async def test_group_cap_spans_users(self):
+        controller = AdmissionController(LagMonitor(), max_per_user=4, max_per_group=2)
+        first = await controller.admit("session:a", group="ip:1")
+        await controller.admit("session:b", group="ip:1")
+        with pytest.raises(Overloaded) as rejected:
+            await controller.admit("session:c", group="ip:1")
+        assert rejected.value.reason == "group_limit"
+        await controller.admit("session:c", group="ip:2")
+
+        first.release()
+        await controller.admit("session:c", group="ip:1")
+        assert controller.group_load == {"ip:1": 2, "ip:2": 1}
+        assert "session:a" not in controller.user_load
+
+    @pytest.mark.anyio
+    async def test_user_cap_rejects_immediately(self):
+        controller = AdmissionController(LagMonitor(), max_per_user=2, queue_timeout=5)
+        await controller.admit("alice")
+        await controller.admit("alice")
+        with pytest.raises(Overloaded) as exc:
+            await controller.admit("alice")
+        assert exc.value.reason == "user_limit"
+        await controller.admit("bob")
+        controller.release("alice")
+        await controller.admit("alice")
+        assert controller.user_load == {"alice": 2, "bob": 1}
+
+    @pytest.mark.anyio
+    async def test_weighted_fair_order(self):
+        controller = AdmissionController(LagMonitor(), max_inflight=1, max_per_user=5, poll_interval=0.001)
+        await controller.admit("holder")
+        order = []
+
+        async def request(user, n, weight=1.0):
+            await controller.admit(user, weight)
+            order.append(f"{user}{n}")
+            await asyncio.sleep(0.005)
+            controller.release(user)
+
+        # The standard user queues first, the gold user (double weight) later
+        tasks = [asyncio.create_task(request("std", i)) for i in range(2)]
+        await asyncio.sleep(0.005)
+        tasks += [asyncio.create_task(request("gold", i, weight=2.0)) for i in range(2)]
+        await asyncio.sleep(0.005)
+        controller.release("holder")
+        await asyncio.gather(*tasks)
+
+        assert order == ["gold0", "std0", "gold1", "std1"]
+        assert controller.user_load == {}
+        assert controller.waiting == []
+
+    @pytest.mark.anyio
+    async def test_cancelled_waiter_releases_load(self):
+        controller = AdmissionController(LagMonitor(), max_inflight=0, queue_timeout=5, poll_interval=0.001)
+        waiter = asyncio.create_task(controller.admit("alice"))
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.user_load == {}
+        assert controller.waiting == []
+
+
+def test_chatbot_rejects_when_saturated():
+    """A saturated worker answers 503 with Retry-After."""
+    from api import chatbot_backup
+
+    chatbot_backup.limiter.clients.clear()
+    saturated = AdmissionController(LagMonitor(), max_inflight=0, queue_timeout=0.0, retry_after=3)
+    with patch('api.chatbot_backup.admission', saturated):
+        response = TestClient(chatbot_backup.app).post("/api/chatbot", json={"input": "Hoi"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+    assert saturated.get_stats()["rejected"]["inflight"] == 1
+
+
+def test_chatbot_rejects_user_over_cap():
+    """A user at the stream cap gets 429 without touching upstream."""
+    from api import chatbot_backup
+
+    chatbot_backup.limiter.clients.clear()
+    capped = AdmissionController(LagMonitor(), max_per_user=0, retry_after=1)
+    with patch('api.chatbot_backup.admission', capped), \
+         patch('api.chatbot_backup.open_chat_stream') as open_stream:
+        response = TestClient(chatbot_backup.app).post("/api/chatbot", json={"input": "Hoi", "session_id": "abc"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    open_stream.assert_not_called()
+
+
+def test_admission_identity():
+    from api.chatbot_backup import UserInput, admission_identity, parse_key_weights
+
+    assert parse_key_weights("a:2, b:0.5,broken,c:x") == {"a": 2.0, "b": 0.5}
+
+    class FakeRequest:
+        def __init__(self, headers):
+            self.headers = headers
+            self.client = type("Client", (), {"host": "1.2.3.4"})()
+
+    assert admission_identity(UserInput(input="x"), FakeRequest({})) == ("ip:1.2.3.4", 1.0, None)
+    assert admission_identity(UserInput(input="x", session_id="s1"), FakeRequest({})) == ("session:s1", 1.0, "ip:1.2.3.4")
+    with patch.dict('api.chatbot_backup.API_KEY_WEIGHTS', {"secret": 2.0}):
+        key, weight, group = admission_identity(UserInput(input="x", session_id="s1"), FakeRequest({"X-API-Key": "secret"}))
+        assert key.startswith("key:") and "secret" not in key
+        assert (weight, group) == (2.0, None)
+        # Unknown keys are no identity: the session (bound to its IP) counts
+        unknown = admission_identity(UserInput(input="x", session_id="s1"), FakeRequest({"X-API-Key": "random"}))
+        assert unknown == ("session:s1", 1.0, "ip:1.2.3.4")
+
+
+def test_rotating_session_ids_hit_ip_cap():
+    """New session ids per request do not get a fresh allowance beyond the IP cap."""
+    from api import chatbot_backup
+
+    chatbot_backup.limiter.clients.clear()
+    capped = AdmissionController(LagMonitor(), max_per_user=4, max_per_group=2, retry_after=1)
+    capped.group_load["ip:testclient"] = 2  # Two sessions of this IP are streaming
+    with patch('api.chatbot_backup.admission', capped), \
+         patch('api.chatbot_backup.open_chat_stream') as open_stream:
+        response = TestClient(chatbot_backup.app).post(
+            "/api/chatbot", json={"input": "Hoi", "session_id": "fresh-random-id"},
+            headers={"X-API-Key": "made-up"}
+        )
+    assert response.status_code == 429
+    assert capped.rejected["group_limit"] == 1
+    open_stream.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_slot_released_when_body_never_read():
+    """A client that disconnects before the stream starts does not leak its slot."""
+    from api import chatbot_backup
+
+    chatbot_backup.limiter.clients.clear()
+    controller = AdmissionController(LagMonitor())
+    started = []
+
+    async def never_read(user_input):
+        started.append(1)
+        yield "data: {}\n\n"
+
+    messages = [{"type": "http.request", "body": b'{"input": "Hoi"}', "more_body": False}]
+
+    async def receive():
+        # Disconnect right after the body, before the response body is iterated
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            await asyncio.sleep(0.05)  # Client is gone before the body is sent
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/chatbot", "raw_path": b"/api/chatbot", "root_path": "",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")],
+        "client": ("10.0.0.1", 1234), "server": ("testserver", 80)
+    }
+    with patch('api.chatbot_backup.admission', controller), \
+         patch('api.chatbot_backup.open_chat_stream', lambda user_input: never_read(user_input)):
+        await chatbot_backup.app(scope, receive, send)
+
+    assert controller.admitted == 1
+    assert not started
+    assert controller.inflight == 0
+    assert controller.user_load == {}
+
+
+def lagging_controller():
+    controller = AdmissionController(LagMonitor(), queue_timeout=0.0, retry_after=3)
+    controller.monitor.record(5.0)
+    controller.monitor.ensure_started = lambda: None
+    return controller
+
+
+def test_websocket_stream_is_shed_on_lag():
+    from api import chatbot_backup
+
+    chatbot_backup.limiter.clients.clear()
+    controller = lagging_controller()
+    with patch('api.chatbot_backup.admission', controller), \
+         patch('api.chatbot_backup.open_chat_stream') as open_stream:
+        with TestClient(chatbot_backup.app).websocket_connect("/api/ws") as ws:
+            ws.send_json({"type": "chat", "stream_id": "a", "input": "Hoi"})
+            event = ws.receive_json()
+
+    assert event["type"] == "error" and event["stream_id"] == "a"
+    assert event["status"] == 503 and event["retry_after"] == 3
+    assert controller.rejected["lag"] == 1
+    open_stream.assert_not_called()
+
+
+def test_batch_items_are_shed_on_lag():
+    from api import chatbot_backup
+
+    chatbot_backup.limiter.clients.clear()
+    controller = lagging_controller()
+    with patch('api.chatbot_backup.admission', controller), \
+         patch('api.chatbot_backup.open_chat_stream') as open_stream:
+        response = TestClient(chatbot_backup.app).post(
+            "/api/chatbot/batch", json={"items": [{"input": "een"}, {"input": "twee"}]}
+        )
+
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["status_code"] for r in results] == [503, 503]
+    assert all(r["status"] == "error" for r in results)
+    assert controller.rejected["lag"] == 2 and controller.inflight == 0
+    open_stream.assert_not_called()
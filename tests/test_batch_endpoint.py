@@ -0,0 +1,124 @@
+"""
+Integration tests for the /api/chatbot/batch endpoint.
+
+Tests verify:
+- Results stream as NDJSON in completion order with their batch index
+- The concurrency cap is honoured
+- Per-item latency and provider metadata are reported
+- Failing items do not abort the rest of the batch
+- Items go through admission with the per-user stream cap
+"""
+
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api.admission_control import AdmissionController, LagMonitor
+
+from api import chatbot_backup
+from api.config import Config
+
+
+@pytest.fixture
+def client():
+    chatbot_backup.limiter.clients.clear()
+    with patch('api.chatbot_backup.chat_cache') as mock_cache:
+        mock_cache.get.return_value = None
+        yield TestClient(chatbot_backup.app)
+
+
+def make_fetcher(state):
+    async def fake_fetch_chunks(messages, *args, **kwargs):
+        prompt = messages[-1]["content"]
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            await asyncio.sleep(float(prompt.split()[-1]))
+            if prompt.startswith("fail"):
+                yield Exception("All AI providers unavailable")
+                return
+            yield {"provider": "pollinations", "upstream": "pollinations"}
+            yield f"answer to {prompt}"
+            yield None
+        finally:
+            state["active"] -= 1
+    return fake_fetch_chunks
+
+
+def post_batch(client, items, **extra):
+    response = client.post("/api/chatbot/batch", json={"items": items, **extra})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+class TestBatchEndpoint:
+    """Tests for concurrent batch execution."""
+
+    def test_results_in_completion_order(self, client):
+        """Test that faster items are returned first with their index."""
+        state = {"active": 0, "max_active": 0}
+        with patch('api.chatbot_backup.fetch_chunks_async', make_fetcher(state)):
+            results = post_batch(client, [{"input": "slow 0.3"}, {"input": "fast 0.01"}])
+
+        assert [r["index"] for r in results] == [1, 0]
+        assert results[0]["content"] == "answer to fast 0.01"
+        assert results[0]["status"] == "ok"
+        assert results[0]["provider"] == "pollinations"
+        assert results[0]["latency"] >= results[0]["ttft"] >= 0
+
+    def test_concurrency_cap(self, client):
+        """Test that no more than the requested number of items run at once."""
+        state = {"active": 0, "max_active": 0}
+        items = [{"input": "item 0.05"} for _ in range(6)]
+        with patch('api.chatbot_backup.fetch_chunks_async', make_fetcher(state)):
+            results = post_batch(client, items, concurrency=2)
+
+        assert len(results) == 6
+        assert state["max_active"] == 2
+        assert sorted(r["index"] for r in results) == list(range(6))
+
+    def test_failing_item_reported(self, client):
+        """Test that an item error is reported without failing the batch."""
+        state = {"active": 0, "max_active": 0}
+        with patch('api.chatbot_backup.fetch_chunks_async', make_fetcher(state)):
+            results = post_batch(client, [{"input": "fail 0.01"}, {"input": "ok 0.02"}])
+
+        by_index = {r["index"]: r for r in results}
+        assert by_index[0]["status"] == "error"
+        assert "unavailable" in by_index[0]["error"]
+        assert by_index[1]["status"] == "ok"
+
+    def test_batch_size_limit(self, client):
+        """Test that oversized and empty batches are rejected."""
+        items = [{"input": "x"}] * (Config.BATCH_MAX_ITEMS + 1)
+        assert client.post("/api/chatbot/batch", json={"items": items}).status_code == 413
+        assert client.post("/api/chatbot/batch", json={"items": []}).status_code == 400
+
+    def test_items_count_towards_user_cap(self, client):
+        """Test that a user at the stream cap gets 429 results for every item."""
+        capped = AdmissionController(LagMonitor(), max_per_user=1, retry_after=1)
+        capped.user_load["session:s1"] = 1  # An /api/chatbot stream of this user is running
+        state = {"active": 0, "max_active": 0}
+        with patch('api.chatbot_backup.admission', capped), \
+             patch('api.chatbot_backup.fetch_chunks_async', make_fetcher(state)):
+            results = post_batch(client, [{"input": "a 0.01", "session_id": "s1"}, {"input": "b 0.01", "session_id": "s1"}])
+
+        assert [r["status_code"] for r in results] == [429, 429]
+        assert capped.rejected["user_limit"] == 2
+        assert state["max_active"] == 0
+
+    def test_concurrency_fits_user_cap(self, client):
+        """Test that a batch runs no wider than the cap, so it never rejects its own items."""
+        capped = AdmissionController(LagMonitor(), max_per_user=1)
+        state = {"active": 0, "max_active": 0}
+        items = [{"input": "item 0.02", "session_id": "s1"} for _ in range(3)]
+        with patch('api.chatbot_backup.admission', capped), \
+             patch('api.chatbot_backup.fetch_chunks_async', make_fetcher(state)):
+            results = post_batch(client, items, concurrency=3)
+
+        assert [r["status"] for r in results] == ["ok"] * 3
+        assert state["max_active"] == 1
+        assert capped.admitted == 3 and capped.inflight == 0
@@ -0,0 +1,80 @@
+"""
+Unit tests for the complexity_classifier module.
+
+Tests verify:
+- Feature extraction and hashing are deterministic and bounded
+- The shipped model separates trivial prompts from code questions
+- Low confidence and a missing model file fall back to the default mode
+- Model "auto" with the default thinking mode uses the classifier
+"""
+
+from api.complexity_classifier import (
+    ComplexityClassifier,
+    MODE_TIERS,
+    extract_features,
+    hash_features,
+    load_classifier,
+)
+from api.thinking_modes import DEFAULT_THINKING_MODE
+
+
+class TestFeatures:
+    """Tests for feature extraction and hashing."""
+
+    def test_words_bigrams_and_shape(self):
+        features = extract_features("def add(a, b): return a + b")
+        assert "w:def" in features
+        assert "b:def_add" in features
+        assert "shape:code" in features
+
+    def test_only_head_is_scanned(self):
+        features = extract_features("hoi " + "woord " * 5000 + "einde", max_chars=100)
+        assert "w:einde" not in features
+        assert "len:15" in features
+
+    def test_hashing_is_deterministic(self):
+        features = extract_features("Hoe werkt een warmtepomp?")
+        first = hash_features(features, 4096)
+        assert first == hash_features(features, 4096)
+        assert all(0 <= index < 4096 for index in first)
+
+
+class TestClassifier:
+    """Tests for predictions of the shipped and hand-built models."""
+
+    def test_shipped_model(self):
+        classifier = load_classifier()
+        greeting = classifier.predict("hoi!")
+        assert greeting.thinking_mode == "concise"
+        assert greeting.tier == "fast"
+        code = classifier.predict("fix deze error: TypeError: 'NoneType' object is not subscriptable in mijn functie")
+        assert code.tier == "strong"
+
+    def test_low_confidence_falls_back(self):
+        classifier = ComplexityClassifier(["concise", "deep"], 16, [0.0, 0.0], {}, min_confidence=0.6)
+        prediction = classifier.predict("anything")
+        assert prediction.thinking_mode == DEFAULT_THINKING_MODE
+        assert prediction.tier == MODE_TIERS[DEFAULT_THINKING_MODE]
+        assert prediction.confidence == 0.5
+
+    def test_missing_model_file(self, tmp_path):
+        classifier = load_classifier(tmp_path / "missing.json")
+        assert classifier.predict("hoi").thinking_mode == DEFAULT_THINKING_MODE
+
+
+class TestAutoThinkingMode:
+    """Tests for the classifier in build_chat_messages."""
+
+    def test_default_mode_is_classified(self):
+        from api.chatbot_backup import UserInput, build_chat_messages
+
+        plan = build_chat_messages(UserInput(input="hoi", model="auto"))
+        assert plan.routing["classifier"]["thinking_mode"] == "concise"
+        assert plan.routing["thinking_mode"] == "concise"
+
+    def test_explicit_mode_is_kept(self):
+        from api.chatbot_backup import UserInput, build_chat_messages
+
+        plan = build_chat_messages(UserInput(input="hoi", model="auto", thinking_mode="deep"))
+        assert "classifier" not in plan.routing
+        assert plan.routing["thinking_mode"] == "deep"
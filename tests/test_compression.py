@@ -0,0 +1,177 @@
+"""
+Unit tests for the compression module and the non-streaming chat mode.
+
+Tests verify:
+- Accept-Encoding negotiation honours preferences and q-values
+- Bodies round-trip through gzip and deflate
+- stream=false returns one JSON body, compressed when negotiated
+- SSE streams are sync-flushed at coalesced frame boundaries
+"""
+
+import asyncio
+import gzip
+import json
+import zlib
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api import chatbot_backup
+from api.compression import negotiate_encoding, compress_body, compress_sse_stream
+
+
+class TestNegotiateEncoding:
+    """Tests for Accept-Encoding negotiation."""
+
+    def test_missing_header(self):
+        assert negotiate_encoding(None) is None
+        assert negotiate_encoding("") is None
+
+    def test_prefers_gzip(self):
+        assert negotiate_encoding("gzip, deflate, br") == "gzip"
+
+    def test_q_values(self):
+        assert negotiate_encoding("gzip;q=0.2, deflate") == "deflate"
+        assert negotiate_encoding("gzip;q=0, deflate;q=0") is None
+
+    def test_wildcard(self):
+        assert negotiate_encoding("*") == "gzip"
+        assert negotiate_encoding("br") is None
+
+
+class TestCompressBody:
+    """Tests for one-shot body compression."""
+
+    def test_round_trip(self):
+        data = b"<div>hello</div>" * 100
+        assert gzip.decompress(compress_body(data, "gzip")) == data
+        assert zlib.decompress(compress_body(data, "deflate")) == data
+        assert compress_body(data, None) == data
+
+
+class TestCompressSseStream:
+    """Tests for streaming SSE compression."""
+
+    @pytest.mark.anyio
+    async def test_each_piece_decodes_to_whole_frames(self):
+        """Test that every flushed piece decodes up to a frame boundary."""
+        async def frames():
+            for i in range(20):
+                yield f"data: {json.dumps({'type': 'chunk', 'content': f'part {i}'})}\n\n"
+                await asyncio.sleep(0)
+
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decoded = b""
+        async for piece in compress_sse_stream(frames(), "gzip"):
+            decoded += decoder.decompress(piece)
+            assert decoded.endswith(b"\n\n") or decoded == b""
+
+        assert decoded.count(b"data: ") == 20
+
+    @pytest.mark.anyio
+    async def test_burst_is_coalesced(self):
+        """Test that frames produced together share one flush."""
+        async def burst():
+            for i in range(50):
+                yield f"data: {i}\n\n"
+
+        pieces = [p async for p in compress_sse_stream(burst(), "deflate")]
+        assert len(pieces) < 50
+        assert zlib.decompress(b"".join(pieces)).count(b"data: ") == 50
+
+    @pytest.mark.anyio
+    async def test_heartbeat_flushed_promptly(self):
+        """Test that a lone heartbeat is delivered before the next frame exists."""
+        release = asyncio.Event()
+
+        async def frames():
+            yield ": heartbeat\n\n"
+            await release.wait()
+            yield "data: late\n\n"
+
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        stream = compress_sse_stream(frames(), "gzip")
+        first = await asyncio.wait_for(stream.__anext__(), timeout=1)
+        assert decoder.decompress(first) == b": heartbeat\n\n"
+
+        release.set()
+        rest = b"".join([p async for p in stream])
+        assert decoder.decompress(rest) == b"data: late\n\n"
+
+
+async def long_fetch_chunks(*args, **kwargs):
+    yield {"provider": "pollinations", "upstream": "pollinations"}
+    yield "<html>" + "<p>code</p>" * 200
+    yield "</html>"
+    yield None
+
+
+async def failing_fetch_chunks(*args, **kwargs):
+    yield Exception("All AI providers unavailable")
+
+
+@pytest.fixture
+def client():
+    chatbot_backup.limiter.clients.clear()
+    with patch('api.chatbot_backup.chat_cache') as mock_cache:
+        mock_cache.get.return_value = None
+        yield TestClient(chatbot_backup.app)
+
+
+class TestJsonCompletionMode:
+    """Tests for stream=false on /api/chatbot."""
+
+    def test_gzip_json_body(self, client):
+        """Test that the full answer is returned as gzip-encoded JSON."""
+        with patch('api.chatbot_backup.fetch_chunks_async', long_fetch_chunks):
+            response = client.post(
+                "/api/chatbot",
+                json={"input": "Build a page", "stream": False},
+                headers={"Accept-Encoding": "gzip"}
+            )
+
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"] == "application/json"
+        data = response.json()
+        assert data["type"] == "completion"
+        assert data["content"].startswith("<html>")
+        assert data["content"].endswith("</html>")
+        assert data["finish_reason"] == "stop"
+        assert data["provider"] == "pollinations"
+
+    def test_identity_when_not_accepted(self, client):
+        """Test that the body is not compressed without Accept-Encoding."""
+        with patch('api.chatbot_backup.fetch_chunks_async', long_fetch_chunks):
+            response = client.post(
+                "/api/chatbot",
+                json={"input": "Build a page", "stream": False},
+                headers={"Accept-Encoding": "identity"}
+            )
+
+        assert "content-encoding" not in response.headers
+        assert json.loads(response.content)["content"].endswith("</html>")
+
+    def test_sse_stream_compressed(self, client):
+        """Test that the streaming response is gzip-encoded when accepted."""
+        with patch('api.chatbot_backup.fetch_chunks_async', long_fetch_chunks):
+            response = client.post(
+                "/api/chatbot",
+                json={"input": "Build a page"},
+                headers={"Accept-Encoding": "gzip"}
+            )
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert '"type": "chunk"' in response.text
+        assert response.text.endswith("\n\n")
+
+    def test_provider_failure(self, client):
+        """Test that an upstream failure maps to a 502 error body."""
+        with patch('api.chatbot_backup.fetch_chunks_async', failing_fetch_chunks):
+            response = client.post("/api/chatbot", json={"input": "Hi", "stream": False})
+
+        assert response.status_code == 502
+        data = response.json()
+        assert data["error_code"] == "PROVIDER_FAILURE"
+        assert data["retry_after"] == 60
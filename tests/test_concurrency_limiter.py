@@ -0,0 +1,242 @@
+"""
+Unit tests for the concurrency_limiter module.
+
+Tests verify:
+- No more slots are handed out than the limit
+- Waiting keys are served round-robin, so a heavy session cannot starve others
+- Queue timeouts and cancelled waiters leave no stale state behind
+- Adaptive limits grow on healthy completions and shrink on inflated TTFT or overload
+- Normal TTFT variance does not shrink the limit
+- A saturated provider fails over without being recorded as failed
+"""
+
+import asyncio
+import math
+import random
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from api.concurrency_limiter import FairLimiter, ProviderLimiters, QueueTimeout
+from api.provider_manager import ProviderManager
+
+
+class TestFairLimiter:
+    """Tests for slot accounting and fairness."""
+
+    @pytest.mark.anyio
+    async def test_limit_is_enforced(self):
+        limiter = FairLimiter("p", limit=2, max_wait=0.05)
+        await limiter.acquire("a")
+        await limiter.acquire("b")
+        with pytest.raises(QueueTimeout):
+            await limiter.acquire("c")
+        limiter.release()
+        await limiter.acquire("c")
+        stats = limiter.get_stats()
+        assert stats["active"] == 2
+        assert stats["timeouts"] == 1
+        assert stats["queued"] == 0
+
+    @pytest.mark.anyio
+    async def test_round_robin_over_keys(self):
+        limiter = FairLimiter("p", limit=1, max_wait=5)
+        await limiter.acquire("holder")
+        order = []
+
+        async def request(key, n):
+            await limiter.acquire(key)
+            order.append(f"{key}{n}")
+            limiter.release()
+
+        # The heavy session queues three requests before the light one arrives
+        tasks = [asyncio.create_task(request("heavy", i)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("light", 0)))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["heavy0", "light0", "heavy1", "heavy2"]
+        assert limiter.active == 0
+        assert limiter.get_stats()["peak_queue"] == 4
+
+    @pytest.mark.anyio
+    async def test_cancelled_waiter_is_removed(self):
+        limiter = FairLimiter("p", limit=1, max_wait=5)
+        await limiter.acquire("a")
+        waiter = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.queued == 0
+        limiter.release()
+        assert limiter.active == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def adaptive_limiter(limit=4, **kwargs):
+    clock = FakeClock()
+    return FairLimiter("p", limit, adaptive=True, clock=clock, **kwargs), clock
+
+
+class TestAdaptiveLimit:
+    """Tests for AIMD limit changes."""
+
+    def test_additive_increase_up_to_max(self):
+        limiter, _ = adaptive_limiter(limit=4, max_limit=6)
+        for _ in range(5):
+            limiter.record_success(1.0)
+        assert limiter.capacity == 5
+        for _ in range(50):
+            limiter.record_success(1.0)
+        assert limiter.capacity == 6
+
+    def test_inflated_ttft_decreases(self):
+        limiter, _ = adaptive_limiter(limit=10, min_samples=3)
+        for _ in range(3):
+            limiter.record_success(1.0)
+        before = limiter.limit
+        limiter.record_success(5.0)
+        assert limiter.limit == pytest.approx(before * 0.9)
+        assert limiter.decreases == 1
+
+    def test_variable_latency_does_not_collapse(self):
+        # Realistic TTFTs: log-normal around 0.8s with a long tail
+        rng = random.Random(7)
+        limiter, clock = adaptive_limiter(limit=8, max_limit=32)
+        for _ in range(2000):
+            clock.now += 0.1
+            limiter.record_success(rng.lognormvariate(math.log(0.8), 0.5))
+        assert limiter.capacity >= 8
+
+    def test_sustained_inflation_still_decreases(self):
+        limiter, clock = adaptive_limiter(limit=16)
+        for _ in range(50):
+            limiter.record_success(0.8)
+        for _ in range(5):
+            clock.now += 2
+            limiter.record_success(4.0)
+        assert limiter.capacity < 16
+
+    def test_overload_halves_once_per_interval(self):
+        limiter, clock = adaptive_limiter(limit=8)
+        limiter.record_overload()
+        limiter.record_overload()
+        assert limiter.capacity == 4
+        clock.now += 2
+        limiter.record_overload()
+        limiter.record_overload()
+        clock.now += 2
+        limiter.record_overload()
+        assert limiter.capacity == 1
+        assert limiter.get_stats()["overloads"] == 5
+
+    def test_fixed_limit_does_not_move(self):
+        limiter = FairLimiter("p", 4)
+        limiter.record_overload()
+        limiter.record_success(1.0)
+        assert limiter.capacity == 4
+
+    @pytest.mark.anyio
+    async def test_growth_admits_waiters(self):
+        limiter, _ = adaptive_limiter(limit=1)
+        await limiter.acquire("a")
+        waiter = asyncio.create_task(limiter.acquire("b", timeout=5))
+        await asyncio.sleep(0)
+        limiter.record_success(0.5)
+        await waiter
+        assert limiter.active == 2
+
+
+class TestProviderLimiters:
+    """Tests for the per-provider registry."""
+
+    def test_limits_per_provider(self):
+        limiters = ProviderLimiters({"g4f": 3}, default_limit=5)
+        assert limiters.get("g4f").limit == 3
+        assert limiters.get("pollinations").limit == 5
+        assert limiters.get("g4f") is limiters.get("g4f")
+
+    def test_adaptive_options(self):
+        limiters = ProviderLimiters({"g4f": 3}, adaptive={"max_limit": 10})
+        assert limiters.get("g4f").adaptive
+        assert limiters.get("g4f").max_limit == 10
+        assert not ProviderLimiters().get("g4f").adaptive
+
+    def test_status_in_provider_manager(self):
+        manager = ProviderManager(providers=["g4f"], limiters=ProviderLimiters({"g4f": 3}))
+        assert manager.get_provider_status()["g4f"]["concurrency"]["limit"] == 3
+        assert "concurrency" not in ProviderManager(providers=["g4f"]).get_provider_status()["g4f"]
+
+
+@pytest.mark.anyio
+async def test_saturated_provider_fails_over():
+    """A full queue moves on to the next provider without a failure record."""
+    from api.chatbot_backup import fetch_chunks_async
+
+    limiters = ProviderLimiters(default_limit=1, max_wait=0.01)
+    await limiters.get("g4f").acquire("someone-else")
+    manager = ProviderManager(providers=["g4f", "pollinations"])
+
+    async def fake_acquire_pollinations(key, timeout=None):
+        raise QueueTimeout("pollinations busy")
+
+    limiters.get("pollinations").acquire = fake_acquire_pollinations
+
+    with patch('api.chatbot_backup.provider_limiters', limiters):
+        chunks = [c async for c in fetch_chunks_async(
+            [{"role": "user", "content": "Hi"}], "gpt-4o", False, "general", None, False, "s1",
+            provider_manager=manager
+        )]
+
+    assert isinstance(chunks[-1], Exception)
+    assert "busy" in str(chunks[-1])
+    assert manager.failure_counts == {"g4f": 0, "pollinations": 0}
+    assert limiters.get("g4f").get_stats()["timeouts"] == 1
+
+
+@pytest.mark.anyio
+async def test_ttft_excludes_retry_backoff():
+    """The adaptive limit sees the TTFT of the successful call, not earlier backoff."""
+    from api.chatbot_backup import fetch_chunks_async
+
+    limiters = ProviderLimiters(adaptive={})
+    manager = ProviderManager(providers=["pollinations"])
+
+    async def body():
+        yield b'data: {"choices": [{"delta": {"content": "Hoi"}}]}\n'
+        yield b'data: [DONE]\n'
+
+    response = MagicMock()
+    response.is_success = True
+    response.status_code = 200
+    response.aiter_bytes = body
+    http = MagicMock()
+    http.stream.return_value.__aenter__ = AsyncMock(return_value=response)
+    http.stream.return_value.__aexit__ = AsyncMock(return_value=None)
+
+    async def retry_after_backoff(fn, *args, **kwargs):
+        await asyncio.sleep(0.3)  # Backoff after a failed first attempt
+        return await fn()
+
+    with patch('api.chatbot_backup.provider_limiters', limiters), \
+         patch('api.chatbot_backup.call_with_retry', retry_after_backoff), \
+         patch('httpx.AsyncClient') as client_class:
+        client_class.return_value.__aenter__ = AsyncMock(return_value=http)
+        client_class.return_value.__aexit__ = AsyncMock(return_value=None)
+        chunks = [c async for c in fetch_chunks_async(
+            [{"role": "user", "content": "Hi"}], "gpt-4o", False, "general", None, False, "s1",
+            provider_manager=manager
+        )]
+
+    assert "Hoi" in chunks
+    ttfts = list(limiters.get("pollinations").ttfts)
+    assert len(ttfts) == 1 and ttfts[0] < 0.3
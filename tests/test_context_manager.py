@@ -0,0 +1,156 @@
+"""
+Unit tests for the context_manager module.
+
+Tests verify:
+- The system prompt and newest message are always kept
+- History is packed newest-first within the token budget
+- Oversize file contexts are truncated while keeping the question
+- An oversize system prompt is trimmed; the user turn is never sent empty
+- Per-session counts are reused, so a new turn only counts new messages
+"""
+
+import pytest
+
+from api.context_manager import (
+    FILES_MARKER,
+    MIN_NEWEST_TOKENS,
+    ContextOverflowError,
+    TokenLedger,
+    context_budget,
+    count_messages_tokens,
+    smart_context_manager,
+    truncate_file_context,
+    token_ledger,
+)
+from api.tokenizer import get_tokenizer
+
+
+def history(turns, words=50):
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"message {i} " + "lorem ipsum dolor " * words})
+    return messages
+
+
+class TestContextBudget:
+    """Tests for per-model budgets."""
+
+    def test_budgets(self):
+        assert context_budget("gpt-4o") == 8000
+        assert context_budget("claude-3-haiku") == 8000
+        assert context_budget("mistral") == 4000
+        assert context_budget(None) == 4000
+
+
+class TestSmartContextManager:
+    """Tests for budgeted packing."""
+
+    def test_small_history_untouched(self):
+        messages = history(4, words=5)
+        packed, tokens = smart_context_manager(messages, "gpt-4o", max_tokens=4000)
+        assert packed == messages
+        assert tokens == count_messages_tokens(messages, "gpt-4o")
+
+    def test_packs_newest_first_within_budget(self):
+        messages = history(40)
+        packed, tokens = smart_context_manager(messages, "gpt-4o", max_tokens=1000)
+
+        assert tokens <= 1000
+        assert packed[0] == messages[0]
+        assert packed[-1] == messages[-1]
+        # The kept history is a contiguous window ending at the newest message
+        assert packed[1:] == messages[len(messages) - len(packed) + 1:]
+        assert len(packed) < len(messages)
+
+    def test_truncates_oversize_file_context(self):
+        question = "Wat staat er in dit bestand?"
+        big_file = "\n\n--- INHOUD BESTAND: data.txt ---\n" + "regel met tekst " * 3000
+        small_file = "\n\n--- INHOUD BESTAND: notes.txt ---\nkort"
+        content = question + FILES_MARKER + big_file + small_file
+        messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": content}]
+
+        packed, tokens = smart_context_manager(messages, "mistral", max_tokens=500)
+
+        assert tokens <= 500
+        assert packed[-1]["content"].startswith(question)
+        assert "notes.txt ---\nkort" in packed[-1]["content"]
+        assert "weggelaten" in packed[-1]["content"]
+        assert messages[-1]["content"] == content
+
+    def test_oversize_system_prompt_keeps_question(self):
+        question = "Wat is de hoofdstad van Frankrijk?"
+        messages = [
+            {"role": "system", "content": "Regel voor het model. " * 9000},
+            {"role": "user", "content": question}
+        ]
+        packed, tokens = smart_context_manager(messages, "mistral", max_tokens=4000)
+
+        assert tokens <= 4000
+        assert packed[-1]["content"] == question
+        assert packed[0]["role"] == "system"
+        assert "weggelaten" in packed[0]["content"]
+
+    def test_oversize_system_prompt_leaves_room_for_large_input(self):
+        messages = [
+            {"role": "system", "content": "context " * 9000},
+            {"role": "user", "content": "vraag " * 2000}
+        ]
+        packed, tokens = smart_context_manager(messages, "mistral", max_tokens=4000)
+
+        assert tokens <= 4000
+        assert get_tokenizer().count(packed[-1]["content"]) >= MIN_NEWEST_TOKENS - 10
+
+    def test_budget_too_small_raises(self):
+        messages = [{"role": "user", "content": "hallo " * 100}]
+        with pytest.raises(ContextOverflowError):
+            smart_context_manager(messages, "mistral", max_tokens=5)
+
+    def test_truncate_file_context_keeps_small_content(self):
+        assert truncate_file_context("hallo", 100) == "hallo"
+        assert get_tokenizer().count(truncate_file_context("woord " * 2000, 100)) <= 100
+
+
+class TestTokenLedger:
+    """Tests for incremental per-session counts."""
+
+    def test_new_turn_counts_only_new_messages(self):
+        ledger = TokenLedger()
+        messages = history(20)
+        first = ledger.message_counts(messages, "gpt-4o", session_id="s1")
+        assert ledger.counted == len(messages)
+
+        messages = messages + [{"role": "user", "content": "volgende vraag"}]
+        second = ledger.message_counts(messages, "gpt-4o", session_id="s1")
+        assert ledger.counted == len(messages)
+        assert ledger.reused == len(messages) - 1
+        assert second[:-1] == first
+
+    def test_changed_message_is_recounted(self):
+        ledger = TokenLedger()
+        messages = history(4)
+        ledger.message_counts(messages, "gpt-4o", session_id="s1")
+        messages[0] = {"role": "system", "content": "Another system prompt"}
+        counts = ledger.message_counts(messages, "gpt-4o", session_id="s1")
+        assert ledger.reused == len(messages) - 1
+        assert counts[0] == get_tokenizer("gpt-4o").count("Another system prompt") + 3
+
+    def test_known_first_count_is_not_tokenized(self):
+        ledger = TokenLedger()
+        messages = history(4)
+        counts = ledger.message_counts(messages, "gpt-4o", first_tokens=1234)
+        assert counts[0] == 1234 + 3
+        assert ledger.counted == len(messages) - 1
+
+    def test_sessions_are_bounded(self):
+        ledger = TokenLedger(max_sessions=2)
+        for session in ("a", "b", "c"):
+            ledger.message_counts(history(1), "gpt-4o", session_id=session)
+        assert len(ledger.sessions) == 2
+
+    def test_smart_context_manager_uses_global_ledger(self):
+        messages = history(6)
+        smart_context_manager(messages, "gpt-4o", session_id="ledger-test")
+        before = token_ledger.counted
+        smart_context_manager(messages + [{"role": "user", "content": "nog iets"}], "gpt-4o", session_id="ledger-test")
+        assert token_ledger.counted == before + 1
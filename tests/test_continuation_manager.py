@@ -0,0 +1,166 @@
+"""
+Unit tests for the continuation_manager module.
+
+Tests verify:
+- Checkpoints round-trip through the file and memory stores
+- Tokens are single-use and bound to their session
+- Resumed generations join partial answers across segments
+- with_timeout_protection emits a continuation token near the deadline
+"""
+
+import asyncio
+import json
+import pytest
+from api.continuation_manager import (
+    CONTINUE_PROMPT,
+    ContinuationManager,
+    FileContinuationStore,
+    MemoryContinuationStore,
+    build_resume_messages
+)
+from api.timeout_manager import with_timeout_protection
+
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "Write a long page"}
+]
+
+
+class TestContinuationManager:
+    """Tests for checkpoint creation and resumption."""
+
+    def test_file_store_round_trip(self, tmp_path):
+        """Test that a checkpoint written to disk can be resumed."""
+        manager = ContinuationManager(store=FileContinuationStore(str(tmp_path)))
+        state = manager.checkpoint(MESSAGES, "<html>", "gpt-4o", "coder", "s1")
+
+        resumed = manager.resume(state.token, "s1")
+        assert resumed is not None
+        assert resumed.messages == MESSAGES
+        assert resumed.partial_response == "<html>"
+        assert resumed.personality == "coder"
+
+    def test_token_is_single_use(self):
+        """Test that a token cannot be resumed twice."""
+        manager = ContinuationManager(store=MemoryContinuationStore())
+        state = manager.checkpoint(MESSAGES, "partial", "gpt-4o", "general", "s1")
+
+        assert manager.resume(state.token, "s1") is not None
+        assert manager.resume(state.token, "s1") is None
+
+    def test_foreign_session_rejected(self):
+        """Test that a token only resumes for the session that created it."""
+        manager = ContinuationManager(store=MemoryContinuationStore())
+        state = manager.checkpoint(MESSAGES, "partial", "gpt-4o", "general", "s1")
+
+        assert manager.resume(state.token, "other") is None
+
+    def test_foreign_session_does_not_consume_token(self):
+        """Test that the owner can still resume after a foreign session tried the token."""
+        manager = ContinuationManager(store=MemoryContinuationStore())
+        state = manager.checkpoint(MESSAGES, "partial", "gpt-4o", "general", "s1")
+
+        assert manager.resume(state.token, "other") is None
+        resumed = manager.resume(state.token, "s1")
+        assert resumed is not None and resumed.partial_response == "partial"
+
+    def test_expired_token_rejected(self):
+        """Test that checkpoints older than the ttl are not resumed."""
+        manager = ContinuationManager(store=MemoryContinuationStore(), ttl=0)
+        state = manager.checkpoint(MESSAGES, "partial", "gpt-4o", "general", "s1")
+        manager.store.entries[state.token]["created_at"] -= 1
+
+        assert manager.resume(state.token, "s1") is None
+
+    def test_empty_partial_not_checkpointed(self):
+        """Test that nothing is persisted when no text was generated."""
+        manager = ContinuationManager(store=MemoryContinuationStore())
+        assert manager.checkpoint(MESSAGES, "", "gpt-4o", "general", "s1") is None
+        assert manager.store.entries == {}
+
+    def test_segments_are_joined(self):
+        """Test that a second checkpoint keeps the original conversation."""
+        manager = ContinuationManager(store=MemoryContinuationStore())
+        first = manager.checkpoint(MESSAGES, "part one ", "gpt-4o", "coder", "s1")
+        resumed = manager.resume(first.token, "s1")
+
+        second = manager.checkpoint(
+            build_resume_messages(resumed), "part two", "gpt-4o", "coder", "s1", previous=resumed
+        )
+        assert second.messages == MESSAGES
+        assert second.partial_response == "part one part two"
+        assert second.segments == 2
+
+    def test_build_resume_messages(self):
+        """Test that the resume prompt is built server-side."""
+        manager = ContinuationManager(store=MemoryContinuationStore())
+        state = manager.checkpoint(MESSAGES, "partial", "gpt-4o", "general", "s1")
+
+        messages = build_resume_messages(state)
+        assert messages[:2] == MESSAGES
+        assert messages[2] == {"role": "assistant", "content": "partial"}
+        assert messages[3] == {"role": "user", "content": CONTINUE_PROMPT}
+
+
+class TestTimeoutCheckpointing:
+    """Tests for checkpointing mode in with_timeout_protection."""
+
+    @pytest.mark.anyio
+    async def test_checkpoint_fields_in_timeout_message(self):
+        """Test that the callback result is merged into the timeout message."""
+        async def slow_generator():
+            for i in range(100):
+                yield f"data: chunk{i}\n\n"
+                await asyncio.sleep(0.1)
+
+        calls = []
+
+        def checkpoint(elapsed):
+            calls.append(elapsed)
+            return {"resumable": True, "continuation_token": "abc"}
+
+        chunks = []
+        async for chunk in with_timeout_protection(
+            slow_generator(), max_duration=1.5, checkpoint_callback=checkpoint, checkpoint_margin=1
+        ):
+            chunks.append(chunk)
+
+        assert len(calls) == 1
+        assert calls[0] < 1.5
+
+        timeout_chunk = next(c for c in chunks if '"timeout"' in c)
+        data = json.loads(timeout_chunk.replace("data: ", "").strip())
+        assert data["continuation_token"] == "abc"
+        assert data["resumable"] is True
+
+    @pytest.mark.anyio
+    async def test_chunk_crossing_deadline_is_checkpointed(self):
+        """Test that the chunk pulled after the deadline ends up in the partial answer."""
+        produced = []
+
+        async def slow_generator():
+            for i in range(100):
+                await asyncio.sleep(0.1)
+                produced.append(f"deel{i} ")
+                yield produced[-1]
+
+        manager = ContinuationManager(store=MemoryContinuationStore())
+        received = []
+
+        def checkpoint(elapsed):
+            state = manager.checkpoint(MESSAGES, "".join(received), "gpt-4o", "general", "s1")
+            return {"continuation_token": state.token}
+
+        token = None
+        async for chunk in with_timeout_protection(
+            slow_generator(), max_duration=1.5, checkpoint_callback=checkpoint, checkpoint_margin=1
+        ):
+            if chunk.startswith("data: ") and '"timeout"' in chunk:
+                token = json.loads(chunk[6:])["continuation_token"]
+            elif not chunk.startswith((":", "data: ")):
+                received.append(chunk)
+
+        state = manager.resume(token, "s1")
+        assert state.partial_response == "".join(produced)
+        assert produced[-1] in state.partial_response
@@ -0,0 +1,166 @@
+"""
+Unit tests for the history_summarizer module.
+
+Tests verify:
+- Dropped history is summarized in the background and reused on later turns
+- Summaries roll forward instead of re-reading the whole history
+- Edited histories do not reuse a summary of different messages
+- Failures of the summarizer never break a request
+"""
+
+import asyncio
+import pytest
+from api.history_summarizer import HistorySummarizer, SUMMARY_PREFIX, prefix_hashes
+
+
+def conversation(turns, words=60):
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"message {i} " + "lorem ipsum dolor " * words})
+    return messages
+
+
+class RecordingSummarizer:
+    def __init__(self, text="Gebruiker heet Sam."):
+        self.text = text
+        self.calls = []
+
+    async def __call__(self, messages, model):
+        self.calls.append(messages)
+        return self.text
+
+
+class TestPrefixHashes:
+    """Tests for history prefix hashing."""
+
+    def test_prefix_hashes_are_incremental(self):
+        messages = conversation(4)
+        hashes = prefix_hashes(messages)
+        assert len(hashes) == len(messages)
+        assert prefix_hashes(messages[:2]) == hashes[:2]
+        assert len(set(hashes)) == len(hashes)
+
+
+class TestHistorySummarizer:
+    """Tests for background summaries."""
+
+    def test_short_history_is_untouched(self):
+        summarizer = HistorySummarizer()
+        messages = conversation(2, words=5)
+        packed, _ = summarizer.apply(messages, "gpt-4o", 4000, session_id="s1")
+        assert packed == messages
+        assert "s1" not in summarizer.pending
+
+    @pytest.mark.anyio
+    async def test_summary_generated_after_turn_and_reused(self):
+        summarizer = HistorySummarizer()
+        summarize = RecordingSummarizer()
+        messages = conversation(30)
+
+        packed, _ = summarizer.apply(messages, "gpt-4o", 1000, session_id="s1")
+        assert not any(m["content"].startswith(SUMMARY_PREFIX) for m in packed)
+        assert summarizer.misses == 1
+        dropped = len(messages) - len(packed)
+
+        task = summarizer.refresh("s1", summarize)
+        assert task is not None
+        summary = await task
+        assert len(summarize.calls) == 1
+        assert "message 0" in summarize.calls[0][1]["content"]
+
+        next_turn = messages + [{"role": "assistant", "content": "ok"}, {"role": "user", "content": "en nu?"}]
+        packed, tokens = summarizer.apply(next_turn, "gpt-4o", 1000, session_id="s1")
+        assert tokens <= 1000
+        assert packed[0] == messages[0]
+        assert packed[1]["role"] == "system"
+        assert packed[1]["content"] == SUMMARY_PREFIX + "Gebruiker heet Sam."
+        assert packed[-1] == next_turn[-1]
+        assert summarizer.hits == 1
+        assert summary.covered == dropped
+
+    @pytest.mark.anyio
+    async def test_summary_rolls_forward(self):
+        summarizer = HistorySummarizer()
+        summarize = RecordingSummarizer()
+        messages = conversation(30)
+        summarizer.apply(messages, "gpt-4o", 1000, session_id="s1")
+        first = await summarizer.refresh("s1", summarize)
+
+        longer = conversation(40)
+        summarizer.apply(longer, "gpt-4o", 1000, session_id="s1")
+        second = await summarizer.refresh("s1", summarize)
+
+        assert second.covered > first.covered
+        transcript = summarize.calls[1][1]["content"]
+        assert transcript.startswith("Eerdere samenvatting:\nGebruiker heet Sam.")
+        assert "message 0 " not in transcript
+
+    @pytest.mark.anyio
+    async def test_edited_history_does_not_reuse_summary(self):
+        summarizer = HistorySummarizer()
+        messages = conversation(30)
+        summarizer.apply(messages, "gpt-4o", 1000, session_id="s1")
+        await summarizer.refresh("s1", RecordingSummarizer())
+
+        edited = [dict(m) for m in messages]
+        edited[1]["content"] = "een heel ander begin " * 60
+        packed, _ = summarizer.apply(edited, "gpt-4o", 1000, session_id="s1")
+        assert not any(m["content"].startswith(SUMMARY_PREFIX) for m in packed)
+
+    @pytest.mark.anyio
+    async def test_one_generation_per_session(self):
+        summarizer = HistorySummarizer()
+        release = asyncio.Event()
+
+        async def slow(messages, model):
+            await release.wait()
+            return "samenvatting"
+
+        messages = conversation(30)
+        summarizer.apply(messages, "gpt-4o", 1000, session_id="s1")
+        task = summarizer.refresh("s1", slow)
+        summarizer.apply(messages, "gpt-4o", 1000, session_id="s1")
+        assert summarizer.refresh("s1", slow) is None
+
+        release.set()
+        await task
+        assert summarizer.get_stats()["generated"] == 1
+
+    @pytest.mark.anyio
+    async def test_failure_is_swallowed(self):
+        summarizer = HistorySummarizer()
+
+        async def broken(messages, model):
+            raise RuntimeError("provider down")
+
+        summarizer.apply(conversation(30), "gpt-4o", 1000, session_id="s1")
+        assert await summarizer.refresh("s1", broken) is None
+        assert summarizer.failures == 1
+        assert "s1" not in summarizer.sessions
+
+    def test_default_session_is_not_summarized(self):
+        summarizer = HistorySummarizer()
+        summarizer.apply(conversation(30), "gpt-4o", 1000, session_id="default")
+        assert summarizer.pending == {}
+
+    def test_trimmed_system_prompt_does_not_shift_dropped_history(self):
+        summarizer = HistorySummarizer()
+        rules = {"role": "system", "content": [{"type": "text", "text": "rules " * 2000}]}
+        messages = conversation(6, words=20)
+        messages.insert(1, rules)
+
+        packed, _ = summarizer.apply(messages, "gpt-4o", 400, session_id="s1")
+        kept = len(packed) - 1
+        assert rules not in packed
+        assert packed[1:] == messages[-kept:]
+        assert summarizer.pending["s1"][0] == messages[2:-kept]
+
+    def test_pending_turns_are_bounded(self):
+        summarizer = HistorySummarizer(max_sessions=2)
+        for session_id in ("s1", "s2", "s3"):
+            summarizer.apply(conversation(30), "gpt-4o", 1000, session_id=session_id)
+        assert list(summarizer.pending) == ["s2", "s3"]
+
+        summarizer.discard("s2")
+        assert list(summarizer.pending) == ["s3"]
@@ -0,0 +1,185 @@
+"""
+Unit tests for the map_reduce module and the large-input chat path.
+
+Tests verify:
+- Chunks stay within the token limit and cover the whole input
+- Map calls run concurrently under the concurrency cap
+- Progress events are emitted before the reduced result
+- Failed or late chunks fall back to an excerpt instead of failing the request
+- Large chat inputs are condensed before the final answer is streamed
+"""
+
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api import chatbot_backup
+from api.map_reduce import MapReduceProcessor, chunk_text
+from api.tokenizer import get_tokenizer
+
+
+def document(paragraphs=40):
+    return "\n\n".join(f"Paragraaf {i}: " + "de kat zit op de mat " * 40 for i in range(paragraphs))
+
+
+async def collect(generator):
+    return [event async for event in generator]
+
+
+class TestChunkText:
+    """Tests for token-bounded chunking."""
+
+    def test_chunks_within_limit_and_complete(self):
+        text = document()
+        chunks = chunk_text(text, 500)
+        tokenizer = get_tokenizer()
+        assert len(chunks) > 1
+        assert all(tokenizer.count(c) <= 500 for c in chunks)
+        assert "".join(chunks) == text
+
+    def test_long_word_is_split(self):
+        chunks = chunk_text("x" * 20000, 100)
+        assert len(chunks) > 1
+        assert "".join(chunks) == "x" * 20000
+
+    def test_small_text_single_chunk(self):
+        assert chunk_text("kort", 100) == ["kort"]
+
+
+class TestMapReduceProcessor:
+    """Tests for the map and reduce phases."""
+
+    @pytest.mark.anyio
+    async def test_concurrency_cap_and_progress(self):
+        state = {"active": 0, "max_active": 0}
+
+        async def extract(messages, model):
+            state["active"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return "kern: " + messages[1]["content"].split("\n")[4][:12]
+
+        processor = MapReduceProcessor(concurrency=2, chunk_tokens=500)
+        events = await collect(processor.run("Waar zit de kat?", document(), extract, "gpt-4o-mini"))
+
+        reduced = events[-1]
+        map_events = [e for e in events if e.get("phase") == "map"]
+        assert reduced["type"] == "reduced"
+        assert reduced["failed"] == 0
+        assert state["max_active"] == 2
+        assert map_events[0]["done"] == 0
+        assert map_events[-1]["done"] == map_events[-1]["total"] == reduced["chunks"]
+        assert reduced["content"].index("Deel 1/") < reduced["content"].index("Deel 2/")
+        assert "kern: Paragraaf 0" in reduced["content"]
+
+    @pytest.mark.anyio
+    async def test_failed_chunk_falls_back_to_excerpt(self):
+        async def extract(messages, model):
+            if "DEEL 1/" in messages[1]["content"]:
+                raise RuntimeError("provider down")
+            return "samengevat"
+
+        processor = MapReduceProcessor(chunk_tokens=500)
+        events = await collect(processor.run("vraag", document(), extract, "gpt-4o-mini"))
+
+        assert events[-1]["failed"] == 1
+        assert "Paragraaf 0" in events[-1]["content"]
+        assert "samengevat" in events[-1]["content"]
+
+    @pytest.mark.anyio
+    async def test_deadline_cancels_slow_chunks(self):
+        cancelled = []
+
+        async def extract(messages, model):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return "te laat"
+
+        processor = MapReduceProcessor(chunk_tokens=500, deadline=0.05, progress_interval=0.01)
+        events = await collect(processor.run("vraag", document(10), extract, "gpt-4o-mini"))
+        await asyncio.sleep(0)
+
+        assert events[-1]["failed"] == events[-1]["chunks"]
+        assert cancelled
+
+    @pytest.mark.anyio
+    async def test_map_phase_capped_by_max_seconds(self):
+        async def extract(messages, model):
+            await asyncio.sleep(10)
+            return "te laat"
+
+        processor = MapReduceProcessor(chunk_tokens=500, deadline=25, progress_interval=0.01)
+        started = asyncio.get_running_loop().time()
+        events = await collect(processor.run("vraag", document(10), extract, "gpt-4o-mini", max_seconds=0.05))
+
+        assert asyncio.get_running_loop().time() - started < 1
+        assert events[-1]["failed"] == events[-1]["chunks"]
+
+
+class TestLargeInputChat:
+    """Tests for the large-input path of the chat endpoint."""
+
+    def test_large_input_is_condensed_before_answer(self):
+        chatbot_backup.limiter.clients.clear()
+        upstream_calls = []
+
+        async def fake_fetch(messages, model, *args, **kwargs):
+            upstream_calls.append(messages)
+            if messages[0]["content"].startswith("Je krijgt deel"):
+                yield "feit"
+            else:
+                yield "eindantwoord"
+            yield None
+
+        with patch('api.chatbot_backup.fetch_chunks_async', fake_fetch), \
+             patch('api.chatbot_backup.chat_cache') as mock_cache:
+            mock_cache.get.return_value = None
+            client = TestClient(chatbot_backup.app)
+            response = client.post("/api/chatbot", json={"input": document(), "session_id": "large-1"})
+
+        events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+        types = [e["type"] for e in events]
+        assert response.status_code == 200
+        assert types[0] == "progress"
+        assert types.index("metadata") > types.index("progress")
+        assert any(e["type"] == "chunk" and e["content"] == "eindantwoord" for e in events)
+
+        final_prompt = upstream_calls[-1][-1]["content"]
+        assert "VERKLEINDE INPUT" in final_prompt
+        assert len(final_prompt) < len(document())
+        assert len(upstream_calls) > 2
+
+    def test_answer_gets_remaining_budget(self):
+        chatbot_backup.limiter.clients.clear()
+        durations = []
+        original = chatbot_backup.stream_chat_completion
+
+        async def slow_fetch(messages, model, *args, **kwargs):
+            if messages[0]["content"].startswith("Je krijgt deel"):
+                await asyncio.sleep(0.2)
+                yield "feit"
+            else:
+                yield "eindantwoord"
+            yield None
+
+        def spy(*args, **kwargs):
+            durations.append(kwargs["max_duration"])
+            return original(*args, **kwargs)
+
+        with patch('api.chatbot_backup.fetch_chunks_async', slow_fetch), \
+             patch('api.chatbot_backup.stream_chat_completion', spy), \
+             patch('api.chatbot_backup.chat_cache') as mock_cache:
+            mock_cache.get.return_value = None
+            client = TestClient(chatbot_backup.app)
+            response = client.post("/api/chatbot", json={"input": document(), "session_id": "large-2"})
+
+        assert response.status_code == 200
+        # Map-fase en eindantwoord delen één deadline
+        assert durations and durations[0] <= chatbot_backup.STREAM_MAX_DURATION - 0.2
+
@@ -0,0 +1,137 @@
+"""
+Unit tests for the memory_inspector module.
+
+Tests verify:
+- deep_sizeof follows containers and objects, counts shared objects once and is bounded
+- Registered structures are reported with entry counts and sizes
+- Named tracemalloc snapshots show allocation sites and their growth in a diff
+- The admin memory endpoints are protected and map errors to status codes
+"""
+
+import asyncio
+import tracemalloc
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from api.memory_inspector import MemoryInspector, deep_sizeof, process_memory
+
+
+@pytest.fixture
+def inspector():
+    inspector = MemoryInspector(max_snapshots=2)
+    was_tracing = tracemalloc.is_tracing()
+    yield inspector
+    if not was_tracing:
+        inspector.stop()
+
+
+class TestDeepSizeof:
+    """Tests for the bounded deep size."""
+
+    def test_follows_containers(self):
+        small = deep_sizeof({"a": "x"})["bytes"]
+        big = deep_sizeof({"a": "x" * 100_000})["bytes"]
+        assert big - small >= 99_000
+
+    def test_shared_objects_counted_once(self):
+        payload = "y" * 50_000
+        once = deep_sizeof([payload])["bytes"]
+        twice = deep_sizeof([payload, payload])["bytes"]
+        assert twice - once < 100
+
+    def test_objects_and_truncation(self):
+        class Entry:
+            def __init__(self):
+                self.data = "z" * 10_000
+
+        assert deep_sizeof([Entry()])["bytes"] > 10_000
+        result = deep_sizeof(list(range(1000)), max_objects=10)
+        assert result["truncated"]
+
+
+class TestMemoryInspector:
+    """Tests for structures and snapshots."""
+
+    def test_structure_sizes(self, inspector):
+        cache = {"k1": "v" * 1000, "k2": "w"}
+        inspector.register("cache", lambda: cache)
+        inspector.register("broken", lambda: undefined_name)  # noqa: F821
+        sizes = inspector.structure_sizes()
+        assert sizes["cache"]["entries"] == 2
+        assert sizes["cache"]["bytes"] > 1000
+        assert "error" in sizes["broken"]
+
+    def test_snapshot_requires_tracing(self, inspector):
+        if tracemalloc.is_tracing():
+            pytest.skip("tracemalloc already running")
+        with pytest.raises(RuntimeError):
+            inspector.take_snapshot("before")
+
+    def test_snapshot_diff(self, inspector):
+        inspector.start(frames=1)
+        inspector.take_snapshot("before")
+        leak = [bytearray(1024) for _ in range(500)]
+        inspector.take_snapshot("after")
+
+        diff = inspector.diff("before", "after", limit=5)
+        assert diff["total_diff_kb"] >= 400
+        assert any("test_memory_inspector.py" in entry["location"] for entry in diff["top"])
+        assert inspector.top("after", limit=3)["top"]
+        with pytest.raises(KeyError):
+            inspector.top("missing")
+        with pytest.raises(ValueError):
+            inspector.top("after", group_by="bogus")
+
+        # Only the newest snapshots are kept
+        inspector.take_snapshot("third")
+        assert list(inspector.snapshots) == ["after", "third"]
+        assert len(leak) == 500
+
+    def test_process_memory(self):
+        memory = process_memory()
+        assert set(memory) == {"rss_bytes", "peak_rss_bytes"}
+
+
+def test_memory_endpoints():
+    from api import chatbot_backup
+
+    client = TestClient(chatbot_backup.app)
+    headers = {"X-Admin-Token": chatbot_backup.ADMIN_SECRET_KEY}
+    assert client.get("/api/admin/memory", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    report = client.get("/api/admin/memory", headers=headers).json()
+    for name in ("chat_cache", "rate_limiter_clients", "chat_history", "stream_hub"):
+        assert "entries" in report["structures"][name]
+
+    was_tracing = tracemalloc.is_tracing()
+    try:
+        assert client.post("/api/admin/memory/tracemalloc/start?frames=1", headers=headers).json()["tracing"]
+        assert client.post("/api/admin/memory/snapshots/a", headers=headers).status_code == 200
+        assert client.post("/api/admin/memory/snapshots/b?limit=3", headers=headers).status_code == 200
+        diff = client.get("/api/admin/memory/diff?base=a&target=b", headers=headers)
+        assert diff.status_code == 200
+        assert client.get("/api/admin/memory/diff?base=a&target=zzz", headers=headers).status_code == 404
+        assert client.get("/api/admin/memory/snapshots/a?group_by=x", headers=headers).status_code == 400
+    finally:
+        if not was_tracing:
+            client.post("/api/admin/memory/tracemalloc/stop", headers=headers)
+    assert not tracemalloc.is_tracing() or was_tracing
+
+
+def test_memory_report_runs_off_the_event_loop():
+    from api import chatbot_backup
+
+    def outside_loop():
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return True
+        return False
+
+    client = TestClient(chatbot_backup.app)
+    headers = {"X-Admin-Token": chatbot_backup.ADMIN_SECRET_KEY}
+    with patch.object(chatbot_backup.memory_inspector, "get_stats", lambda: {"off_loop": outside_loop()}), \
+         patch.object(chatbot_backup.memory_inspector, "type_counts", outside_loop):
+        report = client.get("/api/admin/memory?types=true", headers=headers).json()
+    assert report == {"off_loop": True, "types": True}
@@ -0,0 +1,114 @@
+"""
+Unit tests for the metrics module.
+
+Tests verify:
+- Counters and histograms keep one series per label combination
+- Histogram buckets are rendered cumulatively with +Inf, _sum and _count
+- Label values are escaped in the text format
+- /metrics serves the registry in the Prometheus text format
+- A failed stream is counted as an error (metrics and analytics)
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api.metrics import Counter, Histogram, MetricsRegistry
+
+
+class TestCounter:
+    """Tests for counters."""
+
+    def test_series_per_labels(self):
+        counter = Counter("x_total", "help", ("provider", "status"))
+        counter.inc("g4f", "ok")
+        counter.inc("g4f", "ok")
+        counter.inc("g4f", "error", amount=3)
+        assert counter.get("g4f", "ok") == 2
+        assert counter.get("g4f", "error") == 3
+        assert counter.get("pollinations", "ok") == 0
+
+    def test_escaping(self):
+        counter = Counter("x_total", "help", ("model",))
+        counter.inc('a"b\\c\nd')
+        assert counter.render() == ['x_total{model="a\\"b\\\\c\\nd"} 1']
+
+
+class TestHistogram:
+    """Tests for fixed-bucket histograms."""
+
+    def test_bucket_placement(self):
+        histogram = Histogram("lat_seconds", "help", (0.1, 1.0), ("provider",))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value, "g4f")
+        # Upper bounds are inclusive (le)
+        assert histogram.series[("g4f",)][:3] == [2, 1, 1]
+        assert histogram.count("g4f") == 4
+
+    def test_render_cumulative(self):
+        histogram = Histogram("lat_seconds", "help", (0.1, 1.0), ("provider",))
+        histogram.observe(0.05, "g4f")
+        histogram.observe(0.5, "g4f")
+        histogram.observe(5.0, "g4f")
+        assert histogram.render() == [
+            'lat_seconds_bucket{provider="g4f",le="0.1"} 1',
+            'lat_seconds_bucket{provider="g4f",le="1"} 2',
+            'lat_seconds_bucket{provider="g4f",le="+Inf"} 3',
+            'lat_seconds_sum{provider="g4f"} 5.55',
+            'lat_seconds_count{provider="g4f"} 3',
+        ]
+
+
+class TestRegistry:
+    """Tests for the registry and the exposition format."""
+
+    def test_render_help_and_type(self):
+        registry = MetricsRegistry()
+        registry.counter("a_total", "Things", ("k",)).inc("v")
+        registry.histogram("b_seconds", "Durations", (1.0,))
+        text = registry.render()
+        assert text.startswith("# HELP a_total Things\n# TYPE a_total counter\na_total{k=\"v\"} 1\n")
+        assert "# TYPE b_seconds histogram" in text
+        assert text.endswith("\n")
+
+    def test_duplicate_name_rejected(self):
+        registry = MetricsRegistry()
+        registry.counter("a_total", "Things")
+        with pytest.raises(ValueError):
+            registry.counter("a_total", "Things")
+
+
+def test_metrics_endpoint():
+    from api import chatbot_backup, metrics
+
+    metrics.cache_requests.inc("hit")
+    response = TestClient(chatbot_backup.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE dub5_chat_ttft_seconds histogram" in response.text
+    assert 'dub5_chat_cache_requests_total{result="hit"}' in response.text
+
+
+@pytest.mark.anyio
+async def test_failed_stream_is_counted_as_error():
+    from api import chatbot_backup, metrics
+
+    async def failing_fetch(*args, **kwargs):
+        yield {"provider": "pollinations", "upstream": "pollinations"}
+        yield "Hallo"
+        yield Exception("upstream broke")
+
+    labels = ("pollinations", "metrics-test", "general")
+    before = metrics.requests_total.get(*labels, "error")
+    with patch('api.chatbot_backup.fetch_chunks_async', failing_fetch), \
+         patch('api.chatbot_backup.analytics') as analytics, \
+         patch('api.chatbot_backup.history_summarizer'):
+        frames = [f async for f in chatbot_backup.stream_chat_completion(
+            [{"role": "user", "content": "metrics error test"}], "metrics-test", False,
+            "general", None, False, "metrics-session"
+        )]
+    assert any('"type": "error"' in f for f in frames)
+    assert metrics.requests_total.get(*labels, "error") == before + 1
+    assert metrics.ttft_seconds.count(*labels) >= 1
+    analytics.log_request.assert_called_once()
+    assert analytics.log_request.call_args.kwargs["is_error"] is True
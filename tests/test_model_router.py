@@ -0,0 +1,98 @@
+"""
+Unit tests for the model_router module.
+
+Tests verify:
+- Cold start decisions follow the static profiles and mode SLOs
+- Slow or failing models lose traffic and win it back once samples expire
+- A best-effort decision is made when no model meets the SLO
+- The routing decision is exposed for model "auto"
+"""
+
+from api.model_router import ModelRouter, percentile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(**kwargs):
+    clock = FakeClock()
+    return ModelRouter(clock=clock, **kwargs), clock
+
+
+class TestModelRouter:
+    """Tests for routing decisions."""
+
+    def test_percentile(self):
+        assert percentile([], 0.5) == 0.0
+        assert percentile([1.0, 2.0, 3.0], 0.5) == 2.0
+        assert percentile(list(map(float, range(100))), 0.95) == 94.0
+
+    def test_cold_start_respects_quality(self):
+        router, _ = make_router()
+        concise = router.route("concise")
+        deep = router.route("deep")
+
+        assert concise.model == "gpt-4o-mini"
+        assert concise.slo_met
+        assert router.profiles[deep.model]["quality"] == 3
+
+    def test_slow_model_loses_traffic(self):
+        router, _ = make_router()
+        for _ in range(10):
+            router.record("gpt-4o-mini", 12.0, True)
+
+        decision = router.route("concise")
+        assert decision.model != "gpt-4o-mini"
+        mini = next(c for c in decision.candidates if c["model"] == "gpt-4o-mini")
+        assert mini["live"] and not mini["eligible"]
+
+    def test_failing_model_excluded_until_samples_expire(self):
+        router, clock = make_router(max_age=60)
+        for _ in range(20):
+            router.record("gpt-4o-mini", None, False)
+        assert router.route("concise").model != "gpt-4o-mini"
+
+        clock.now += 61
+        assert router.route("concise").model == "gpt-4o-mini"
+
+    def test_best_effort_when_nothing_meets_slo(self):
+        router, _ = make_router()
+        for model in router.candidates:
+            for _ in range(10):
+                router.record(model, 30.0, True)
+
+        decision = router.route("deep")
+        assert not decision.slo_met
+        assert "best effort" in decision.reason
+        assert router.profiles[decision.model]["quality"] >= 3
+
+    def test_preferred_model_wins_ties(self):
+        router, _ = make_router(candidates=["mistral", "llama"])
+        assert router.route("balanced", preferred="llama").model == "llama"
+        assert router.route("balanced", preferred="mistral").model == "mistral"
+
+    def test_decision_dict_for_metadata(self):
+        router, _ = make_router()
+        data = router.route("balanced").to_dict()
+        assert set(data) == {"model", "thinking_mode", "score", "slo_met", "reason"}
+        assert "candidates" in router.route("balanced").to_dict(include_candidates=True)
+
+
+class TestAutoModelRouting:
+    """Tests for the auto model in build_chat_messages."""
+
+    def test_auto_model_uses_router(self):
+        from api.chatbot_backup import UserInput, build_chat_messages
+
+        plan = build_chat_messages(UserInput(input="Hoi", model="auto", thinking_mode="concise"))
+        assert plan.routing["model"] == plan.model
+        assert plan.routing["thinking_mode"] == "concise"
+
+        fixed = build_chat_messages(UserInput(input="Hoi", model="mistral"))
+        assert fixed.model == "mistral"
+        assert fixed.routing is None
@@ -0,0 +1,104 @@
+"""
+Unit tests for the personality registry.
+
+Tests verify:
+- Every personality carries compiled prompts and a performance profile
+- The legacy PERSONALITIES mapping is derived from the registry
+- Unknown personalities fall back to the default
+- stream_chat_completion coalesces chunks per personality profile
+"""
+
+import asyncio
+import json
+import sys
+import pytest
+from unittest.mock import patch
+
+from api.personalities import (
+    BUILDER_SYSTEM_PROMPT,
+    DEFAULT_PERSONALITY,
+    PERSONALITIES,
+    PERSONALITY_REGISTRY,
+    get_personality,
+)
+from api.tokenizer import get_tokenizer
+
+
+class TestPersonalityRegistry:
+    """Tests for the shared registry."""
+
+    def test_compiled_prompts(self):
+        for personality in PERSONALITY_REGISTRY.values():
+            for prompt in (personality.prompt, personality.compact_prompt):
+                assert prompt.text is sys.intern(prompt.text)
+
+    def test_personalities_mapping_matches_registry(self):
+        assert set(PERSONALITIES) == set(PERSONALITY_REGISTRY) >= {"general", "coder", "teacher", "writer"}
+        assert PERSONALITIES["coder"] == BUILDER_SYSTEM_PROMPT
+        assert PERSONALITIES["general"] is PERSONALITY_REGISTRY["general"].prompt.text
+
+    def test_compact_prompts_are_smaller(self):
+        coder = get_personality("coder")
+        assert get_tokenizer().count(coder.compact_prompt.text) < get_tokenizer().count(coder.prompt.text)
+        assert coder.coalesce_chars > get_personality("general").coalesce_chars
+
+    def test_unknown_falls_back_to_default(self):
+        assert get_personality("pirate") is PERSONALITY_REGISTRY[DEFAULT_PERSONALITY]
+
+
+async def stream_events(personality, pieces, log=None):
+    from api import chatbot_backup
+
+    async def fake_fetch(*args, **kwargs):
+        for piece in pieces:
+            if isinstance(piece, float):
+                await asyncio.sleep(piece)
+                continue
+            if log is not None:
+                log.append(("produced", piece))
+            yield piece
+        yield None
+
+    with patch('api.chatbot_backup.fetch_chunks_async', fake_fetch), \
+         patch('api.chatbot_backup.chat_cache') as mock_cache, \
+         patch('api.chatbot_backup.analytics'):
+        mock_cache.get.return_value = None
+        frames = []
+        async for f in chatbot_backup.stream_chat_completion(
+            [{"role": "user", "content": "hi"}], "gpt-4o", False, personality, None, False, "coalesce-test"
+        ):
+            if log is not None:
+                log.append(("sent", f))
+            frames.append(f)
+    return [json.loads(f[6:]) for f in frames if f.startswith("data: ")]
+
+
+class TestChunkCoalescing:
+    """Tests for per-personality chunk coalescing."""
+
+    @pytest.mark.anyio
+    async def test_coder_chunks_are_merged(self):
+        pieces = ["a"] * 300
+        chunks = [e for e in await stream_events("coder", pieces) if e["type"] == "chunk"]
+
+        assert chunks[0]["content"] == "a"
+        assert "".join(c["content"] for c in chunks) == "a" * 300
+        assert len(chunks) < 10
+
+    @pytest.mark.anyio
+    async def test_buffer_flushed_before_other_events(self):
+        events = await stream_events("general", ["Hel", "lo", {"provider": "g4f", "upstream": "X"}, " world"])
+        types = [e["type"] for e in events]
+
+        assert [e["content"] for e in events if e["type"] == "chunk"] == ["Hel", "lo", " world"]
+        assert types.index("provider") < len(types) - 1
+
+    @pytest.mark.anyio
+    async def test_buffer_flushed_while_upstream_pauses(self):
+        log = []
+        events = await stream_events("coder", ["a", "b", 0.5, "c"], log)
+        sent_b = next(i for i, (kind, v) in enumerate(log) if kind == "sent" and '"b"' in v)
+        produced_c = log.index(("produced", "c"))
+
+        assert [e["content"] for e in events if e["type"] == "chunk"] == ["a", "b", "c"]
+        assert sent_b < produced_c
@@ -0,0 +1,117 @@
+"""
+Unit tests for the profiler module.
+
+Tests verify:
+- Busy code shows up in the collapsed stacks with its callers
+- Sessions stop after N requests and refuse to overlap
+- Duration and interval are bounded
+- /api/admin/profile is off by default and admin-only
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api.profiler import ProfilerBusy, SamplingProfiler
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestSamplingProfiler:
+    """Tests for the sampler."""
+
+    def test_collapsed_stacks(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,), name="busy-worker")
+        worker.start()
+        profiler = SamplingProfiler()
+        try:
+            profiler.start(0.2, interval=0.002)
+            while profiler.running:
+                time.sleep(0.01)
+        finally:
+            stop.set()
+            worker.join()
+
+        lines = profiler.collapsed().splitlines()
+        busy = [line for line in lines if line.startswith("busy-worker;")]
+        assert busy
+        stack, count = busy[0].rsplit(" ", 1)
+        assert "test_profiler:busy_loop" in stack.split(";")
+        assert int(count) > 0
+        stats = profiler.get_stats()
+        assert stats["samples"] > 10
+        assert not stats["running"]
+        assert stats["overhead"] < 0.5
+
+    def test_stops_after_requests(self):
+        profiler = SamplingProfiler()
+        profiler.start(10, requests=2)
+        profiler.request_done()
+        assert profiler.running
+        profiler.request_done()
+        profiler._thread.join(1)
+        assert not profiler.running
+        assert profiler.get_stats()["elapsed_s"] < 1
+
+    def test_one_session_at_a_time(self):
+        profiler = SamplingProfiler()
+        profiler.start(10)
+        try:
+            with pytest.raises(ProfilerBusy):
+                profiler.start(1)
+        finally:
+            profiler.stop()
+            profiler._thread.join(1)
+
+    def test_bounds(self):
+        profiler = SamplingProfiler(max_duration=0.05, min_interval=0.01, max_depth=3, max_stacks=1)
+        profiler.start(100, interval=0.0)
+        profiler._thread.join(1)
+        assert profiler.get_stats()["elapsed_s"] < 0.5
+        assert all(len(stack) <= 4 for stack in profiler.stacks)
+
+    @pytest.mark.anyio
+    async def test_profile_does_not_block_loop(self):
+        profiler = SamplingProfiler()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        collapsed = await profiler.profile(0.15, interval=0.005)
+        task.cancel()
+        assert ticks >= 5
+        assert "MainThread;" in collapsed
+
+
+def test_profile_endpoint_disabled_by_default():
+    from api import chatbot_backup
+
+    client = TestClient(chatbot_backup.app)
+    headers = {"X-Admin-Token": chatbot_backup.ADMIN_SECRET_KEY}
+    assert client.post("/api/admin/profile?seconds=0.1", headers=headers).status_code == 404
+    assert client.post("/api/admin/profile?seconds=0.1", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+
+def test_profile_endpoint():
+    from api import chatbot_backup
+
+    client = TestClient(chatbot_backup.app)
+    headers = {"X-Admin-Token": chatbot_backup.ADMIN_SECRET_KEY}
+    with patch.object(chatbot_backup.Config, 'PROFILER_ENABLED', True):
+        response = client.post("/api/admin/profile?seconds=0.1&interval_ms=2", headers=headers)
+        assert client.post("/api/admin/profile?seconds=-1", headers=headers).status_code == 400
+    assert response.status_code == 200
+    assert int(response.headers["x-profile-samples"]) > 0
+    assert response.text.endswith("\n")
@@ -0,0 +1,63 @@
+"""
+Unit tests for the prompt_registry module.
+
+Tests verify:
+- Every personality × thinking mode prefix is precomputed with its tokens and hash
+- Prefix text matches the layout chatbot_response always sent
+- Custom base prompts are built once and cached
+- Prompt hashes distinguish dynamic additions
+- System prompt token counts reuse the precomputed prefix count
+"""
+
+from api.config import Config
+from api.personalities import PERSONALITIES
+from api.prompt_registry import PromptRegistry, assemble_prefix, prompt_hash, prompt_registry, system_prompt_tokens
+from api.thinking_modes import THINKING_MODES
+from api.tokenizer import get_tokenizer
+
+
+class TestPromptRegistry:
+    """Tests for precomputed prefixes."""
+
+    def test_all_combinations_precomputed(self):
+        assert set(prompt_registry.prefixes) == {(p, m) for p in PERSONALITIES for m in THINKING_MODES}
+
+    def test_prefix_text_tokens_and_hash(self):
+        prefix = prompt_registry.get("coder", "deep")
+        expected = assemble_prefix(
+            Config.DUB5_SYSTEM_PROMPT, "coder", PERSONALITIES["coder"], "deep", THINKING_MODES["deep"]["system_add"]
+        )
+        assert prefix.text == expected
+        assert "ROL: CODER" in prefix.text and "MODUS: DEEP" in prefix.text
+        assert prefix.tokens == get_tokenizer().count(expected)
+        assert len({p.hash for p in prompt_registry.prefixes.values()}) == len(prompt_registry.prefixes)
+
+    def test_lookup_returns_same_object(self):
+        assert prompt_registry.get("general", "balanced") is prompt_registry.get("general", "balanced")
+
+    def test_unknown_names_use_defaults(self):
+        assert prompt_registry.get("pirate", "frantic") is prompt_registry.get("general", "balanced")
+
+    def test_custom_base_prompt_cached_and_bounded(self):
+        registry = PromptRegistry("Base", PERSONALITIES, THINKING_MODES, max_custom=2)
+        first = registry.get("general", "concise", "Eigen prompt")
+        assert first.text.startswith("Eigen prompt\n\nROL: GENERAL")
+        assert registry.get("general", "concise", "Eigen prompt") is first
+        registry.get("general", "concise", "Twee")
+        registry.get("general", "concise", "Drie")
+        assert len(registry._custom) == 2
+        assert registry.get("general", "concise", "Base") is registry.prefixes[("general", "concise")]
+
+    def test_prompt_hash_covers_dynamic_parts(self):
+        prefix = prompt_registry.get("general", "balanced")
+        assert prompt_hash(prefix) == prefix.hash
+        assert prompt_hash(prefix, "\n\nWEB SEARCH ENABLED") != prefix.hash
+        assert prompt_hash(prefix, "a") != prompt_hash(prefix, "b")
+
+    def test_system_prompt_tokens_from_prefix(self):
+        prefix = prompt_registry.get("coder", "deep")
+        dynamic = "\n\nWEB SEARCH ENABLED: You have access to real-time information via web search."
+        assert system_prompt_tokens(prefix) == prefix.tokens
+        assert system_prompt_tokens(prefix, dynamic) == get_tokenizer().count(prefix.text + dynamic)
+        # Same count whatever encoding the model uses
+        assert system_prompt_tokens(prefix, dynamic, "gpt-4o") == get_tokenizer("gpt-4o").count(prefix.text + dynamic)
@@ -0,0 +1,120 @@
+"""
+Unit tests for the upstream failure handling in the provider_manager module.
+
+Tests verify:
+- Retry-After is parsed as delta seconds and as an HTTP date
+- 429, 503, other 4xx/5xx and network errors are classified differently
+- Deferred providers are skipped exactly until their "not before" time
+- A rate-limited Pollinations response defers instead of recording a failure
+"""
+
+import asyncio
+import time
+import pytest
+from email.utils import formatdate
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+from api.provider_manager import (
+    DEFAULT_RATE_LIMIT_DELAY,
+    MAX_RETRY_AFTER,
+    ProviderManager,
+    UpstreamHTTPError,
+    classify_failure,
+    parse_retry_after,
+)
+
+
+class TestParseRetryAfter:
+    """Tests for Retry-After parsing."""
+
+    def test_delta_seconds(self):
+        assert parse_retry_after("12") == 12.0
+        assert parse_retry_after(" 1.5 ") == 1.5
+        assert parse_retry_after(3) == 3.0
+
+    def test_http_date(self):
+        now = 1_700_000_000.0
+        assert parse_retry_after(formatdate(now + 30, usegmt=True), now=now) == pytest.approx(30)
+        assert parse_retry_after(formatdate(now - 30, usegmt=True), now=now) == 0.0
+
+    def test_invalid_and_bounds(self):
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(MagicMock()) is None
+        assert parse_retry_after("999999") == MAX_RETRY_AFTER
+
+
+class TestClassifyFailure:
+    """Tests for the status-aware failure classifier."""
+
+    def test_rate_limited(self):
+        failure = classify_failure(UpstreamHTTPError("x", 429, 7.0))
+        assert (failure.kind, failure.delay, failure.outage, failure.overload) == ("rate_limited", 7.0, False, True)
+        assert classify_failure(UpstreamHTTPError("x", 429)).delay == DEFAULT_RATE_LIMIT_DELAY
+
+    def test_unavailable(self):
+        assert not classify_failure(UpstreamHTTPError("x", 503, 20.0)).outage
+        assert classify_failure(UpstreamHTTPError("x", 503)).outage
+
+    def test_server_and_client_errors(self):
+        assert classify_failure(UpstreamHTTPError("x", 500)).kind == "server_error"
+        client = classify_failure(UpstreamHTTPError("x", 400))
+        assert client.kind == "client_error"
+        assert not client.outage and not client.overload
+
+    def test_network_and_unknown(self):
+        assert classify_failure(httpx.ConnectError("refused")).kind == "network"
+        assert classify_failure(asyncio.TimeoutError()).kind == "network"
+        unknown = classify_failure(Exception("g4f failed"))
+        assert unknown.kind == "unknown" and unknown.outage
+
+
+class TestDefer:
+    """Tests for exact "not before" scheduling."""
+
+    def test_deferred_provider_is_skipped_until_allowed(self):
+        manager = ProviderManager(providers=["g4f", "pollinations"])
+        manager.defer("g4f", 0.05, "rate_limited")
+        assert manager.get_next_provider() == "pollinations"
+        assert manager.failure_counts["g4f"] == 0
+        assert manager.get_provider_status()["g4f"]["last_failure_kind"] == "rate_limited"
+        time.sleep(0.06)
+        assert manager.get_next_provider() == "g4f"
+
+    def test_all_deferred_picks_earliest(self):
+        manager = ProviderManager(providers=["g4f", "pollinations"])
+        manager.defer("g4f", 30)
+        manager.defer("pollinations", 5)
+        assert manager.get_next_provider() == "pollinations"
+
+
+@pytest.mark.anyio
+async def test_pollinations_429_defers_provider():
+    """A 429 with Retry-After defers Pollinations without a strike."""
+    from api.chatbot_backup import fetch_chunks_async
+
+    manager = ProviderManager(providers=["pollinations", "g4f"])
+    manager.get_next_provider = MagicMock(side_effect=["pollinations", "g4f"])
+
+    response = MagicMock()
+    response.is_success = False
+    response.status_code = 429
+    response.headers = {"Retry-After": "42"}
+    response.aread = AsyncMock(return_value=b"Too Many Requests")
+    http = MagicMock()
+    http.stream.return_value.__aenter__ = AsyncMock(return_value=response)
+    http.stream.return_value.__aexit__ = AsyncMock(return_value=None)
+
+    with patch('httpx.AsyncClient') as client_class, \
+         patch('api.chatbot_backup._lazy_import_g4f', return_value=(None, None, False)):
+        client_class.return_value.__aenter__ = AsyncMock(return_value=http)
+        client_class.return_value.__aexit__ = AsyncMock(return_value=None)
+        [c async for c in fetch_chunks_async(
+            [{"role": "user", "content": "Hi"}], "gpt-4o", False, "general", None, False, "s1",
+            provider_manager=manager
+        )]
+
+    assert manager.failure_counts["pollinations"] == 0
+    assert 40 < manager.get_provider_status()["pollinations"]["not_before_remaining"] <= 42
@@ -279,3 +279,22 @@ async def test_g4f_success_records_success():
         
         # Verify record_failure was NOT called
         mock_pm_instance.record_failure.assert_not_called()
+
+
+def test_shared_manager_does_not_retry_same_provider():
+    """
+    Test that a provider already tried for a request is skipped.
+    
+    With shared provider health, both providers can have equal failure
+    counts; the fallback must still move on to the other provider.
+    """
+    from api.provider_manager import ProviderManager
+    
+    manager = ProviderManager(providers=["g4f", "pollinations"])
+    manager.record_failure("pollinations")
+    manager.record_failure("g4f")
+    
+    first = manager.get_next_provider()
+    second = manager.get_next_provider(exclude=[first])
+    
+    assert {first, second} == {"g4f", "pollinations"}
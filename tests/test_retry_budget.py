@@ -0,0 +1,121 @@
+"""
+Unit tests for the retry_budget module.
+
+Tests verify:
+- Only transient pre-first-token failures are retryable
+- The budget caps retries at a ratio of requests within the window
+- call_with_retry retries transient errors and stops at budget or deadline
+"""
+
+import time
+import pytest
+import httpx
+
+from api.provider_manager import UpstreamHTTPError
+from api.retry_budget import RetryBudget, call_with_retry, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def flaky(failures, error=None):
+    """Coroutine function that fails `failures` times before returning "ok"."""
+    calls = {"n": 0}
+
+    async def fn():
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise error or httpx.ConnectError("refused")
+        return "ok"
+
+    return fn, calls
+
+
+class TestIsRetryable:
+    """Tests for the retry classification."""
+
+    def test_transient_failures(self):
+        assert is_retryable(httpx.ConnectTimeout("slow"))
+        assert is_retryable(UpstreamHTTPError("x", 502))
+        assert is_retryable(UpstreamHTTPError("x", 503, 1.0))
+
+    def test_not_retried(self):
+        assert not is_retryable(UpstreamHTTPError("x", 429))
+        assert not is_retryable(UpstreamHTTPError("x", 503, 30.0))
+        assert not is_retryable(UpstreamHTTPError("x", 400))
+        assert not is_retryable(UpstreamHTTPError("x", 500))
+        assert not is_retryable(ValueError("bad payload"))
+
+
+class TestRetryBudget:
+    """Tests for the sliding-window budget."""
+
+    def test_ratio_with_floor(self):
+        clock = FakeClock()
+        budget = RetryBudget(ratio=0.1, min_retries=2, clock=clock)
+        for _ in range(50):
+            budget.record_request("p")
+        for _ in range(5):
+            assert budget.can_retry()
+            budget.record_retry("p")
+        assert not budget.can_retry()
+        assert budget.get_stats()["providers"]["p"] == {"requests": 50, "retries": 5, "denied": 0}
+
+    def test_window_expires(self):
+        clock = FakeClock()
+        budget = RetryBudget(ratio=0.1, min_retries=1, window=10, clock=clock)
+        budget.record_retry("p")
+        assert not budget.can_retry()
+        clock.now += 11
+        assert budget.can_retry()
+
+
+class TestCallWithRetry:
+    """Tests for the tenacity retry layer."""
+
+    @pytest.mark.anyio
+    async def test_transient_error_is_retried(self):
+        budget = RetryBudget()
+        fn, calls = flaky(2)
+        result = await call_with_retry(fn, "p", budget, time.monotonic() + 10, base_delay=0.001)
+        assert result == "ok"
+        assert calls["n"] == 3
+        assert budget.per_provider["p"]["retries"] == 2
+
+    @pytest.mark.anyio
+    async def test_non_retryable_raises_immediately(self):
+        budget = RetryBudget()
+        fn, calls = flaky(1, UpstreamHTTPError("x", 429))
+        with pytest.raises(UpstreamHTTPError):
+            await call_with_retry(fn, "p", budget, time.monotonic() + 10, base_delay=0.001)
+        assert calls["n"] == 1
+
+    @pytest.mark.anyio
+    async def test_budget_exhausted(self):
+        budget = RetryBudget(ratio=0.0, min_retries=0)
+        fn, calls = flaky(1)
+        with pytest.raises(httpx.ConnectError):
+            await call_with_retry(fn, "p", budget, time.monotonic() + 10, base_delay=0.001)
+        assert calls["n"] == 1
+        assert budget.per_provider["p"]["denied"] == 1
+
+    @pytest.mark.anyio
+    async def test_deadline_stops_retries(self):
+        budget = RetryBudget()
+        fn, calls = flaky(5)
+        with pytest.raises(httpx.ConnectError):
+            await call_with_retry(fn, "p", budget, time.monotonic() - 1, base_delay=0.001)
+        assert calls["n"] == 1
+
+    @pytest.mark.anyio
+    async def test_max_attempts(self):
+        budget = RetryBudget()
+        fn, calls = flaky(5)
+        with pytest.raises(httpx.ConnectError):
+            await call_with_retry(fn, "p", budget, time.monotonic() + 10, max_attempts=2, base_delay=0.001)
+        assert calls["n"] == 2
@@ -0,0 +1,121 @@
+"""
+Unit tests for the stream_hub module.
+
+Tests verify:
+- Concurrent subscribers of the same key share one generation
+- Late subscribers catch up from the first frame
+- A slow subscriber does not stall the others and still gets every frame
+- The generation is cancelled when the last subscriber leaves
+"""
+
+import asyncio
+import pytest
+from api.stream_hub import StreamHub, turn_key
+
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+class TestTurnKey:
+    """Tests for hub key construction."""
+
+    def test_same_turn_same_key(self):
+        assert turn_key("s1", MESSAGES, "gpt-4o", "general") == turn_key("s1", list(MESSAGES), "gpt-4o", "general")
+
+    def test_session_and_options_change_key(self):
+        base = turn_key("s1", MESSAGES, "gpt-4o", "general")
+        assert turn_key("s2", MESSAGES, "gpt-4o", "general") != base
+        assert turn_key("s1", MESSAGES, "gpt-4o", "coder") != base
+        assert turn_key("s1", MESSAGES, "gpt-4o", "general", web_search=True) != base
+
+
+class TestStreamHub:
+    """Tests for shared generations."""
+
+    @pytest.mark.anyio
+    async def test_subscribers_share_generation(self):
+        """Test that a second subscriber attaches instead of starting anew."""
+        hub = StreamHub()
+        starts = []
+        release = asyncio.Event()
+
+        def factory():
+            starts.append(1)
+
+            async def gen():
+                yield "a"
+                await release.wait()
+                yield "b"
+            return gen()
+
+        async def consume():
+            return [f async for f in hub.subscribe("k", factory)]
+
+        first = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        release.set()
+
+        assert await first == ["a", "b"]
+        assert await second == ["a", "b"]
+        assert len(starts) == 1
+        assert hub.active_count() == 0
+
+    @pytest.mark.anyio
+    async def test_slow_subscriber_does_not_stall(self):
+        """Test that an overflowing subscriber catches up from history."""
+        hub = StreamHub(queue_size=2)
+        total = 50
+
+        def factory():
+            async def gen():
+                for i in range(total):
+                    yield i
+                    await asyncio.sleep(0)
+            return gen()
+
+        finished = []
+
+        async def fast():
+            frames = [f async for f in hub.subscribe("k", factory)]
+            finished.append("fast")
+            return frames
+
+        async def slow():
+            frames = []
+            async for f in hub.subscribe("k", factory):
+                frames.append(f)
+                await asyncio.sleep(0.005)
+            finished.append("slow")
+            return frames
+
+        fast_frames, slow_frames = await asyncio.gather(fast(), slow())
+        assert fast_frames == list(range(total))
+        assert slow_frames == list(range(total))
+        assert finished == ["fast", "slow"]
+
+    @pytest.mark.anyio
+    async def test_last_subscriber_leaving_cancels(self):
+        """Test that the generation stops when nobody listens anymore."""
+        hub = StreamHub()
+        cancelled = asyncio.Event()
+
+        def factory():
+            async def gen():
+                try:
+                    while True:
+                        yield "tick"
+                        await asyncio.sleep(0.01)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return gen()
+
+        stream = hub.subscribe("k", factory)
+        assert await stream.__anext__() == "tick"
+        await stream.aclose()
+
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        assert hub.active_count() == 0
@@ -0,0 +1,135 @@
+"""
+Unit tests for the timeseries module.
+
+Tests verify:
+- Windows are parsed from "30s", "15m", "1h" and plain seconds
+- Events land in per-second and per-minute slots; old slots are reused
+- Window summaries report error rate, cache hit rate and p50/p95 latency
+- Snapshots round-trip and corrupt snapshots are rejected
+- The admin endpoints expose the windows and AdminAnalytics persists snapshots
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.timeseries import TimeSeriesStore, parse_window
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestParseWindow:
+    """Tests for window parsing."""
+
+    def test_units(self):
+        assert parse_window("30s") == 30
+        assert parse_window("15m") == 900
+        assert parse_window("1h") == 3600
+        assert parse_window("1d") == 86400
+        assert parse_window("90") == 90
+        assert parse_window(120) == 120
+
+    @pytest.mark.parametrize("window", ["", "abc", "-5m", "0", "1x"])
+    def test_invalid(self, window):
+        with pytest.raises(ValueError):
+            parse_window(window)
+
+
+class TestTimeSeriesStore:
+    """Tests for recording and querying."""
+
+    def test_window_summary(self):
+        clock = FakeClock()
+        store = TimeSeriesStore(clock=clock)
+        for latency in (0.08, 0.09, 0.4, 0.45, 2.5):
+            store.record(tokens=10, latency=latency)
+        store.record(tokens=0, is_error=True, latency=12.0)
+        store.record(tokens=5)  # Input tokens only: no request
+        store.record_cache(True)
+        store.record_cache(False)
+
+        summary = store.query("5m")["summary"]
+        assert summary["requests"] == 6
+        assert summary["errors"] == 1
+        assert summary["tokens"] == 55
+        assert summary["error_rate"] == round(1 / 6, 4)
+        assert summary["cache_hit_rate"] == 0.5
+        assert summary["p50_ms"] == 500
+        assert summary["p95_ms"] == 15000
+
+    def test_resolution_and_expiry(self):
+        clock = FakeClock()
+        store = TimeSeriesStore(second_slots=60, minute_slots=10, clock=clock)
+        store.record(latency=0.1)
+        clock.now += 30
+        store.record(latency=0.1)
+
+        recent = store.query("60s")
+        assert recent["resolution"] == 1
+        assert len(recent["points"]) == 60
+        assert recent["summary"]["requests"] == 2
+        assert store.query("10s")["summary"]["requests"] == 1
+
+        # Longer windows use the per-minute ring (capped at its length)
+        hourly = store.query("1h")
+        assert hourly["resolution"] == 60
+        assert len(hourly["points"]) == 10
+        assert hourly["summary"]["requests"] == 2
+
+        # After a full lap the old slots no longer count
+        clock.now += 11 * 60
+        assert store.query("1h")["summary"]["requests"] == 0
+        store.record(latency=0.1)
+        assert store.query("1h")["summary"]["requests"] == 1
+
+    def test_snapshot_round_trip(self):
+        clock = FakeClock()
+        store = TimeSeriesStore(clock=clock)
+        store.record(tokens=7, latency=0.3)
+        store.record_cache(True)
+        blob = store.snapshot()
+        # Mostly empty slots: the snapshot compresses well
+        assert len(blob) < 10_000
+
+        restored = TimeSeriesStore(clock=clock)
+        restored.restore(blob)
+        assert restored.query("1h") == store.query("1h")
+
+    def test_snapshot_rejected(self):
+        store = TimeSeriesStore()
+        with pytest.raises(ValueError):
+            store.restore(b"not a snapshot")
+        with pytest.raises(ValueError):
+            store.restore(TimeSeriesStore(second_slots=10).snapshot())
+
+
+def test_analytics_snapshot_persisted(tmp_path):
+    from api.chatbot_backup import AdminAnalytics
+
+    path = str(tmp_path / "analytics.bin")
+    analytics = AdminAnalytics(path, snapshot_interval=0)
+    analytics.log_request("gpt-4o", 12, latency=0.2)
+    assert (tmp_path / "analytics.bin").exists()
+
+    # New instance (cold start) continues with the stored series
+    assert AdminAnalytics(path).query("5m")["summary"]["requests"] == 1
+
+
+def test_admin_timeseries_endpoint():
+    from api import chatbot_backup
+
+    client = TestClient(chatbot_backup.app)
+    headers = {"X-Admin-Token": chatbot_backup.ADMIN_SECRET_KEY}
+    response = client.get("/api/admin/stats/timeseries?window=15m", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["resolution"] == 60
+    assert client.get("/api/admin/stats/timeseries?window=bogus", headers=headers).status_code == 400
+
+    snapshot = client.get("/api/admin/stats/snapshot", headers=headers)
+    assert snapshot.headers["content-type"] == "application/octet-stream"
+    assert client.get("/api/admin/stats/snapshot", headers={"X-Admin-Token": "wrong"}).status_code == 403
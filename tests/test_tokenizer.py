@@ -0,0 +1,102 @@
+"""
+Unit tests for the tokenizer module and token counting helpers.
+
+Tests verify:
+- BPE merges are applied by rank and counts are stable
+- Per-text memo and word cache are used for repeated texts
+- Message lists are counted with formatting overhead
+- Missing vocab files fall back to the character estimate
+- Crafted long pre-tokens are counted in bounded time
+"""
+
+import random
+import string
+import time
+import pytest
+from api import tokenizer as tokenizer_module
+from api.tokenizer import BPETokenizer, EstimateTokenizer, get_tokenizer
+from api.context_manager import count_tokens, count_messages_tokens
+
+
+class TestBPETokenizer:
+    """Tests for the BPE counter."""
+
+    def test_merges_reduce_count(self):
+        """Test that merges are applied in rank order."""
+        tok = BPETokenizer("test", [["l", "o"], ["lo", "w"], [" ", "low"]])
+        assert tok.count("low") == 1
+        assert tok.count(" low") == 1
+        assert tok.count("lower") == 3  # "low" + "e" + "r"
+
+    def test_unknown_bytes_count_individually(self):
+        tok = BPETokenizer("test", [])
+        assert tok.count("abc") == 3
+        assert tok.count("é") == 2  # two UTF-8 bytes
+
+    def test_memo_hits(self):
+        """Test that counting the same text twice hits the memo."""
+        tok = BPETokenizer("test", [["a", "b"]])
+        assert tok.count("ab ab") == tok.count("ab ab")
+        assert tok.memo_hits == 1
+        assert tok.memo_misses == 1
+
+    def test_memo_is_bounded(self):
+        tok = BPETokenizer("test", [], memo_size=2)
+        for text in ["one", "two", "three"]:
+            tok.count(text)
+        assert len(tok._memo) == 2
+
+    def test_empty_text(self):
+        assert BPETokenizer("test", []).count("") == 0
+
+
+class TestShippedVocab:
+    """Tests for the shipped vocab and the count_tokens helpers."""
+
+    def test_vocab_loads(self):
+        assert isinstance(get_tokenizer("gpt-4o"), BPETokenizer)
+
+    def test_count_is_realistic(self):
+        """Test that English prose counts fewer tokens than characters."""
+        text = "You are DUB5, an advanced AI system. Provide complete and detailed answers."
+        tokens = count_tokens(text, "gpt-4o")
+        assert len(text.split()) <= tokens < len(text) / 2
+
+    def test_count_messages_tokens(self):
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": "Hello"}
+        ]
+        expected = sum(count_tokens(m["content"]) for m in messages) + 3 * 2 + 3
+        assert count_messages_tokens(messages) == expected
+        assert count_messages_tokens([]) == 0
+
+    def test_non_string_content(self):
+        messages = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+        assert count_messages_tokens(messages) > 0
+
+    @pytest.mark.parametrize("text", [
+        " " * 100_000,
+        "ab" * 50_000,
+        "".join(random.Random(5).choice(string.ascii_letters) for _ in range(100_000)),
+    ])
+    def test_long_pretoken_is_fast(self, text):
+        """Test that a 100k-char whitespace run or single word does not stall the event loop."""
+        tok = BPETokenizer.from_file("dub5-bpe", tokenizer_module.ENCODINGS["dub5-bpe"])
+        start = time.perf_counter()
+        count = tok.count(text)
+        assert time.perf_counter() - start < 0.5
+        assert 0 < count <= len(text)
+
+
+class TestFallback:
+    """Tests for the estimate fallback."""
+
+    def test_missing_vocab_uses_estimate(self, monkeypatch, tmp_path):
+        monkeypatch.setitem(tokenizer_module.ENCODINGS, "missing", tmp_path / "nope.json")
+        monkeypatch.setitem(tokenizer_module.MODEL_ENCODINGS, "missing-model", "missing")
+        monkeypatch.setattr(tokenizer_module, "_tokenizers", {})
+
+        tok = get_tokenizer("missing-model")
+        assert isinstance(tok, EstimateTokenizer)
+        assert tok.count("abcdefgh") == 2
@@ -0,0 +1,159 @@
+"""
+Unit tests for the tracing module.
+
+Tests verify:
+- span() and record() are no-ops outside a trace and record stages inside one
+- Server-Timing values and timing events list the recorded stages
+- Only sampled traces are exported (memory and JSON lines file)
+- /api/chatbot sends Server-Timing and ends the stream with a timing event
+- Requests sharing one generation each get their own timing event
+"""
+
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api import tracing
+from api.tracing import Trace, TraceExporter
+
+
+@pytest.fixture
+def trace():
+    current = Trace("test", sampled=True)
+    token = tracing.current_trace.set(current)
+    yield current
+    tracing.current_trace.reset(token)
+
+
+class TestSpans:
+    """Tests for recording stages."""
+
+    def test_noop_without_trace(self):
+        with tracing.span("prompt"):
+            pass
+        tracing.record("queue", time.perf_counter())
+        tracing.annotate(model="x")
+        assert tracing.current_trace.get() is None
+
+    def test_span_and_record(self, trace):
+        with tracing.span("prompt"):
+            time.sleep(0.005)
+        tracing.record("connect", time.perf_counter() - 0.01, desc="pollinations")
+        tracing.annotate(model="gpt-4o")
+
+        assert [s.name for s in trace.spans] == ["prompt", "connect"]
+        assert trace.spans[0].duration >= 0.004
+        assert trace.spans[1].desc == "pollinations"
+        assert trace.to_dict()["model"] == "gpt-4o"
+
+    def test_span_recorded_on_error(self, trace):
+        with pytest.raises(ValueError):
+            with tracing.span("rag"):
+                raise ValueError("boom")
+        assert trace.spans[0].name == "rag"
+
+    def test_server_timing_format(self, trace):
+        trace.add("prompt", trace.start, 0.0042)
+        trace.add("connect", trace.start, 0.120, desc="g4f")
+        value = trace.server_timing()
+        assert value.startswith('prompt;dur=4.2, connect;desc="g4f";dur=120.0, total;dur=')
+
+    def test_timing_event(self, trace):
+        trace.add("ttft", trace.start + 0.01, 0.5)
+        event = trace.timing_event()
+        assert event["type"] == "timing"
+        assert event["spans"] == [{"name": "ttft", "start_ms": 10.0, "dur_ms": 500.0}]
+
+
+class TestTraceExporter:
+    """Tests for sampled export."""
+
+    def test_only_sampled_traces(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        exporter = TraceExporter(sample_rate=1.0, path=str(path), capacity=2)
+        assert exporter.should_sample()
+        exporter.export(Trace("skipped", sampled=False))
+        for name in ("a", "b", "c"):
+            exporter.export(Trace(name, sampled=True))
+
+        assert [t["name"] for t in exporter.recent] == ["b", "c"]
+        lines = path.read_text().splitlines()
+        assert [json.loads(line)["name"] for line in lines] == ["a", "b", "c"]
+        assert len(exporter.jsonl().splitlines()) == 2
+
+    def test_disabled(self):
+        assert not TraceExporter(sample_rate=0.0).should_sample()
+
+
+async def fake_fetch_chunks(*args, **kwargs):
+    yield {"provider": "pollinations", "upstream": "pollinations"}
+    yield "Hallo"
+    yield " daar"
+    yield None
+
+
+def test_chatbot_server_timing_and_timing_event():
+    from api import chatbot_backup
+
+    chatbot_backup.limiter.clients.clear()
+    with patch('api.chatbot_backup.fetch_chunks_async', fake_fetch_chunks), \
+         patch('api.chatbot_backup.chat_cache') as cache, \
+         patch.object(chatbot_backup.trace_exporter, 'sample_rate', 1.0):
+        cache.get.return_value = None
+        response = TestClient(chatbot_backup.app).post("/api/chatbot", json={"input": "Hoi"})
+
+    assert response.status_code == 200
+    stages = [part.split(";")[0] for part in response.headers["server-timing"].split(", ")]
+    for stage in ("body", "validate", "admission", "files", "prompt", "total"):
+        assert stage in stages
+
+    frames = [json.loads(line[6:]) for line in response.text.split("\n\n") if line.startswith("data: ")]
+    timing = frames[-1]
+    assert timing["type"] == "timing"
+    assert "ttft" in [s["name"] for s in timing["spans"]]
+
+    exported = chatbot_backup.trace_exporter.recent[-1]
+    assert exported["trace_id"] == timing["trace_id"]
+    assert exported["outcome"] == "ok"
+
+
+@pytest.mark.anyio
+async def test_shared_generation_sends_each_request_its_own_timing():
+    import asyncio
+    from api import chatbot_backup
+
+    release = asyncio.Event()
+
+    async def slow_fetch(*args, **kwargs):
+        yield "Hallo"
+        await release.wait()
+        yield " daar"
+        yield None
+
+    async def request(name):
+        token = tracing.current_trace.set(Trace(name, sampled=True))
+        try:
+            user_input = chatbot_backup.UserInput(input="Hoi", session_id="timing-shared")
+            frames = [f async for f in chatbot_backup.open_chat_stream(user_input)]
+            return tracing.current_trace.get().trace_id, frames
+        finally:
+            tracing.current_trace.reset(token)
+
+    with patch('api.chatbot_backup.fetch_chunks_async', slow_fetch), \
+         patch('api.chatbot_backup.chat_cache') as cache, \
+         patch('api.chatbot_backup.analytics'):
+        cache.get.return_value = None
+        first = asyncio.create_task(request("first"))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(request("second"))
+        await asyncio.sleep(0.05)
+        release.set()
+        results = [await first, await second]
+
+    for trace_id, frames in results:
+        events = [json.loads(f[6:]) for f in frames if f.startswith("data: ")]
+        timings = [e for e in events if e["type"] == "timing"]
+        assert [t["trace_id"] for t in timings] == [trace_id]
+        assert events[-1]["type"] == "timing"
@@ -0,0 +1,146 @@
+"""
+Integration tests for the /api/ws WebSocket chat transport.
+
+Tests verify:
+- Chat streams reuse the stream_chat_completion pipeline
+- Several conversations are multiplexed by stream_id
+- Mid-stream cancel messages stop only the targeted stream
+- Invalid messages produce error events without closing the connection
+- Streams share the per-user stream cap with /api/chatbot
+"""
+
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from api import chatbot_backup
+from api.admission_control import AdmissionController, LagMonitor
+from api.chatbot_backup import sse_to_events
+
+
+async def quick_fetch_chunks(*args, **kwargs):
+    yield "Hello"
+    yield " world"
+    yield None
+
+
+async def endless_fetch_chunks(*args, **kwargs):
+    while True:
+        await asyncio.sleep(0.05)
+        yield "tick"
+
+
+def receive_until(ws, stream_id, event_type, limit=200):
+    """Collects events for stream_id until an event of event_type arrives."""
+    events = []
+    for _ in range(limit):
+        event = json.loads(ws.receive_text())
+        if event.get("stream_id") != stream_id:
+            continue
+        events.append(event)
+        if event["type"] == event_type:
+            return events
+    raise AssertionError(f"No {event_type} event for {stream_id}")
+
+
+@pytest.fixture
+def client():
+    chatbot_backup.limiter.clients.clear()
+    with patch('api.chatbot_backup.chat_cache') as mock_cache:
+        mock_cache.get.return_value = None
+        yield TestClient(chatbot_backup.app)
+
+
+class TestSseToEvents:
+    """Tests for converting SSE frames to WebSocket events."""
+
+    def test_heartbeat_is_dropped(self):
+        assert sse_to_events(": heartbeat\n\n") == []
+
+    def test_data_frame_is_decoded(self):
+        frame = f"data: {json.dumps({'type': 'chunk', 'content': 'hi'})}\n\n"
+        assert sse_to_events(frame) == [{"type": "chunk", "content": "hi"}]
+
+    def test_raw_text_becomes_chunk(self):
+        assert sse_to_events("cached text") == [{"type": "chunk", "content": "cached text"}]
+
+
+class TestWebSocketTransport:
+    """Tests for the /api/ws endpoint."""
+
+    def test_single_stream(self, client):
+        """Test that a chat message streams chunks and a done event."""
+        with patch('api.chatbot_backup.fetch_chunks_async', quick_fetch_chunks):
+            with client.websocket_connect("/api/ws") as ws:
+                ws.send_text(json.dumps({"type": "chat", "stream_id": "a", "input": "Hi"}))
+                events = receive_until(ws, "a", "done")
+
+        types = [e["type"] for e in events]
+        assert types[0] == "metadata"
+        content = "".join(e["content"] for e in events if e["type"] == "chunk")
+        assert content == "Hello world"
+
+    def test_multiplexed_streams(self, client):
+        """Test that two conversations run over one connection."""
+        with patch('api.chatbot_backup.fetch_chunks_async', quick_fetch_chunks):
+            with client.websocket_connect("/api/ws") as ws:
+                ws.send_text(json.dumps({"type": "chat", "stream_id": "a", "input": "One"}))
+                ws.send_text(json.dumps({"type": "chat", "stream_id": "b", "input": "Two"}))
+
+                done = set()
+                for _ in range(200):
+                    event = json.loads(ws.receive_text())
+                    if event["type"] == "done":
+                        done.add(event["stream_id"])
+                    if done == {"a", "b"}:
+                        break
+
+        assert done == {"a", "b"}
+
+    def test_cancel_stream(self, client):
+        """Test that a cancel message stops a running stream."""
+        with patch('api.chatbot_backup.fetch_chunks_async', endless_fetch_chunks):
+            with client.websocket_connect("/api/ws") as ws:
+                ws.send_text(json.dumps({"type": "chat", "stream_id": "a", "input": "Go"}))
+                receive_until(ws, "a", "chunk")
+                ws.send_text(json.dumps({"type": "cancel", "stream_id": "a"}))
+                receive_until(ws, "a", "cancelled")
+
+                ws.send_text(json.dumps({"type": "ping", "stream_id": "p"}))
+                receive_until(ws, "p", "pong")
+
+    def test_invalid_messages(self, client):
+        """Test that bad input yields error events and keeps the socket open."""
+        with client.websocket_connect("/api/ws") as ws:
+            ws.send_text("not json")
+            assert json.loads(ws.receive_text())["type"] == "error"
+
+            ws.send_text(json.dumps({"type": "chat", "stream_id": "a"}))
+            event = json.loads(ws.receive_text())
+            assert event["type"] == "error"
+            assert event["stream_id"] == "a"
+
+            ws.send_text(json.dumps({"type": "ping", "stream_id": "p"}))
+            assert json.loads(ws.receive_text())["type"] == "pong"
+
+    def test_user_cap_enforced(self, client):
+        """Test that a second stream of the same user is refused while the first runs."""
+        capped = AdmissionController(LagMonitor(), max_per_user=1, retry_after=1)
+        with patch('api.chatbot_backup.admission', capped), \
+             patch('api.chatbot_backup.fetch_chunks_async', endless_fetch_chunks):
+            with client.websocket_connect("/api/ws") as ws:
+                ws.send_text(json.dumps({"type": "chat", "stream_id": "a", "input": "One", "session_id": "s1"}))
+                receive_until(ws, "a", "chunk")
+                ws.send_text(json.dumps({"type": "chat", "stream_id": "b", "input": "Two", "session_id": "s1"}))
+                rejected = receive_until(ws, "b", "error")[-1]
+                assert capped.user_load == {"session:s1": 1}
+
+                ws.send_text(json.dumps({"type": "cancel", "stream_id": "a"}))
+                receive_until(ws, "a", "cancelled")
+
+        assert rejected["status"] == 429 and rejected["retry_after"] == 1
+        assert capped.rejected["user_limit"] == 1
+        # Cancelled stream gave its slot back
+        assert capped.inflight == 0 and capped.user_load == {}